@@ -2,7 +2,13 @@
 """
 OfficeAI - Script de Inicio
 Ejecuta este archivo desde la raíz del proyecto
+
+    python run.py                  Chat en consola
+    python run.py --serve          API HTTP/JSON (ver src/server.py)
+    python run.py --batch preguntas.jsonl --out respuestas.jsonl
+                                   Responder un fichero sin interacción (ver src/batch.py)
 """
+import argparse
 import sys
 from pathlib import Path
 
@@ -10,9 +16,43 @@ from pathlib import Path
 src_path = Path(__file__).parent / 'src'
 sys.path.insert(0, str(src_path))
 
-# Ahora importar y ejecutar
-from main import main
+from config import BATCH_WORKERS, SERVER_HOST, SERVER_PORT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OfficeAI - Chatbot de Microsoft Office")
+    parser.add_argument('--serve', action='store_true', help="Servir la API HTTP/JSON en lugar del chat en consola")
+    parser.add_argument('--host', default=SERVER_HOST, help=f"Interfaz de escucha (por defecto {SERVER_HOST})")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help=f"Puerto de escucha (por defecto {SERVER_PORT})")
+    parser.add_argument('--batch', metavar='ENTRADA', help="Responder las preguntas de un JSONL y salir")
+    parser.add_argument('--out', metavar='SALIDA', help="JSONL de respuestas de --batch (se reanuda si ya existe)")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS,
+                        help=f"Hilos de --batch (por defecto {BATCH_WORKERS})")
+    parser.add_argument('--db', help="Ruta de la base de datos (por defecto la de config.py)")
+    parser.add_argument('--stub-gemini', action='store_true',
+                        help="Sustituir Gemini por respuestas simuladas (pruebas locales; requiere --db)")
+    args = parser.parse_args()
+    if args.batch and not args.out:
+        parser.error("--batch requiere --out")
+    if args.batch and args.serve:
+        parser.error("--batch y --serve no se pueden combinar")
+    if args.workers < 1:
+        parser.error("--workers debe ser al menos 1")
+    if args.stub_gemini and not args.db:
+        # Las respuestas web se guardan en la base de conocimiento: no ensuciar la real
+        parser.error("--stub-gemini requiere --db con una base de datos de pruebas")
+    return args
+
 
 if __name__ == "__main__":
-    print("Iniciando OfficeAI...")
-    main()
+    args = parse_args()
+    if args.batch:
+        from batch import run_batch
+        run_batch(args.batch, args.out, args.db, args.stub_gemini, args.workers)
+    elif args.serve:
+        from server import serve
+        serve(args.host, args.port, args.db, args.stub_gemini)
+    else:
+        from main import main
+        print("Iniciando OfficeAI...")
+        main()
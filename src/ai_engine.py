@@ -3,46 +3,41 @@
 Motor de IA para OfficeAI
 Maneja lógica de respuestas, Q-learning y toma de decisiones
 """
-import unicodedata
+import threading
 from typing import List, Dict, Optional, Tuple
 
-from config import FUZZY_CUTOFF, CORRECTION_PHRASES, MAX_CONTEXT_TURNS, MIN_RESULT_LENGTH, MAX_SYNTHESIS_LENGTH, AUTO_SAVE_WEB_ANSWERS, USE_GEMINI_SEARCH
-from conversation_engine import ConversationEngine
-from gemini_engine import GeminiEngine
+from config import FUZZY_CUTOFF, FTS_MIN_COVERAGE, SEMANTIC_THRESHOLD, LOCAL_FALLBACK_FUZZY_CUTOFF, LOCAL_FALLBACK_SEMANTIC_THRESHOLD, LOCAL_FALLBACK_FTS_COVERAGE, CORRECTION_PHRASES, MAX_CONTEXT_TURNS, MIN_RESULT_LENGTH, MAX_SYNTHESIS_LENGTH, AUTO_SAVE_WEB_ANSWERS, USE_GEMINI_SEARCH, CACHE_TTL_HOURS, SESSION_MAX_ACTIVE, SESSION_IDLE_TTL_MINUTES, SESSION_PERSIST
+from conversation_engine import ConversationEngine, match_keywords
+from gemini_engine import DeadlineExceeded, GeminiEngine
+from session import Session, SessionStore
+from text_normalizer import normalize
+from utils import is_bad_answer
 
 
 class AIEngine:
-    """Motor de inteligencia artificial del chatbot"""
+    """
+    Motor de inteligencia artificial del chatbot
+    
+    El estado de cada conversación vive en una Session (ver self.sessions); los métodos
+    que lo usan reciben session y, si se omite, trabajan con default_session
+    """
     
     def __init__(self, database):
         self.db = database
         self.gemini_engine = GeminiEngine() if USE_GEMINI_SEARCH else None
-        self.conversation_engine = ConversationEngine()
-        self.last_question = None
-        self.last_answer = None
-        self.last_source = None
-        self.last_learned_id = None  # ID de la última entrada aprendida
-        self.conversation_context = []  # Almacena últimas conversaciones para contexto
-        self.skipped_questions = set()  # Preguntas que no quieren ser evaluadas esta sesión
+        self.conversation_engine = ConversationEngine(speller=database.speller)
+        self.sessions = SessionStore(SESSION_MAX_ACTIVE, SESSION_IDLE_TTL_MINUTES * 60,
+                                     database if SESSION_PERSIST else None)
+        self.default_session = Session('local')  # Sesión de los métodos llamados sin session (consola)
+        self.web_stats = {'total_searches': 0, 'cache_hits': 0, 'cache_misses': 0}
+        self._stats_lock = threading.Lock()
+    
+    def _session(self, session: Optional[Session]) -> Session:
+        return self.default_session if session is None else session
     
     def get_topic(self, question: str) -> str:
         """Detecta el tema de la pregunta"""
-        q_lower = question.lower()
-        
-        topics = {
-            "excel": ["excel", "hoja de cálculo", "fórmula", "celda", "tabla dinámica", "buscarv", "hoja", "cálculo"],
-            "word": ["word", "procesador de textos", "estilos", "índice", "documento", "redactar"],
-            "access": ["access", "base de datos", "tabla", "clave primaria", "consulta"],
-            "powerpoint": ["powerpoint", "presentación", "diapositiva", "presentacion"],
-            "outlook": ["outlook", "correo", "calendario", "reglas", "email"],
-            "base_office": ["office", "microsoft office", "suite"]
-        }
-        
-        for topic, keywords in topics.items():
-            if any(keyword in q_lower for keyword in keywords):
-                return topic
-        
-        return "general"
+        return match_keywords(question).topic
     
     def is_correction(self, text: str) -> bool:
         """Detecta si el texto es una corrección"""
@@ -51,69 +46,70 @@ class AIEngine:
     
     def is_bad_answer(self, answer: str) -> bool:
         """Verifica si una respuesta es de baja calidad"""
-        bad_phrases = ["no se", "quizas", "puede ser", "no tengo informacion", "no estoy seguro"]
-        
-        if len(answer.split()) < 2:
-            return True
-        
-        for bp in bad_phrases:
-            if bp in answer.lower():
-                return True
-        
-        return False
+        return is_bad_answer(answer)
     
-    def find_answers(self, question: str) -> Optional[List[Dict]]:
-        """Busca las mejores respuestas para una pregunta"""
-        results = self.db.search_answers(question, limit=5)
+    def find_answers(self, question: str, fuzzy_cutoff: float = FUZZY_CUTOFF,
+                     semantic_threshold: float = SEMANTIC_THRESHOLD,
+                     fts_coverage: float = FTS_MIN_COVERAGE) -> Optional[List[Dict]]:
+        """Busca las mejores respuestas para una pregunta (los umbrales son los de config.py salvo que se indiquen)"""
+        # Filtro de Bloom: los niveles SQL solo se consultan si la pregunta puede alcanzar su umbral
+        match_bound = self.db.local_match_bound(question)
         
-        if results and not all(self.is_bad_answer(r['answer']) for r in results):
-            good_results = [r for r in results if not self.is_bad_answer(r['answer'])]
-            return good_results if good_results else None
+        # Pregunta exacta y, si no tiene respuestas válidas, preguntas similares en una sola consulta
+        if match_bound >= fuzzy_cutoff:
+            answers = self.db.retrieve_answers(question, fuzzy_cutoff, limit=5, per_question_limit=3)
+            if answers:
+                return answers
         
-        similar_questions = self.db.get_similar_questions(question, FUZZY_CUTOFF)
+        # Erratas ("tabal dinamica", "powerpiont"): misma consulta con el vocabulario de la base corregido
+        corrected = self.db.correct_spelling(question)
+        if corrected != self.db.normalize_text(question) and self.db.local_match_bound(corrected) >= fuzzy_cutoff:
+            answers = self.db.retrieve_answers(corrected, fuzzy_cutoff, limit=5, per_question_limit=3)
+            if answers:
+                return answers
         
-        if similar_questions:
-            all_answers = []
-            for similar_q in similar_questions:
-                answers = self.db.search_answers(similar_q, limit=3)
-                for ans in answers:
-                    if not self.is_bad_answer(ans['answer']):
-                        all_answers.append(ans)
-            
-            if all_answers:
-                unique_answers = []
-                seen = set()
-                for ans in all_answers:
-                    if ans['answer'] not in seen:
-                        unique_answers.append(ans)
-                        seen.add(ans['answer'])
-                
-                return unique_answers[:5]
+        # Preguntas parafraseadas o con erratas: similitud de n-gramas (índice semántico local)
+        semantic_answers = self.db.search_semantic(question, limit=5, threshold=semantic_threshold)
+        if semantic_answers:
+            return semantic_answers
+        
+        # Último nivel local: búsqueda full-text (BM25) para preguntas parafraseadas
+        if self.db.local_match_bound(question, content_only=True) >= fts_coverage:
+            fulltext_answers = self.db.search_fulltext(question, limit=5, min_coverage=fts_coverage)
+            if fulltext_answers:
+                return fulltext_answers
         
         return None
     
-    def handle_meta_questions(self, question: str) -> Optional[str]:
+    def best_local_candidate(self, question: str) -> Optional[str]:
+        """Mejor respuesta local con umbrales laxos (para cuando la web no responde a tiempo)"""
+        answers = self.find_answers(question, LOCAL_FALLBACK_FUZZY_CUTOFF, LOCAL_FALLBACK_SEMANTIC_THRESHOLD,
+                                    LOCAL_FALLBACK_FTS_COVERAGE)
+        return answers[0]['answer'] if answers else None
+    
+    def handle_meta_questions(self, question: str, session: Optional[Session] = None) -> Optional[str]:
         """Maneja preguntas sobre el propio historial de conversación"""
-        q = question.lower()
-        normalized = unicodedata.normalize('NFKD', q).encode('ASCII', 'ignore').decode('utf-8')
+        session = self._session(session)
+        normalized = normalize(question).folded
         
         # Patrones para "qué te pregunté antes"
         if any(p in normalized for p in ["que te pregunte", "cual fue mi ultima", "que dije antes", "de que hablamos", "que pregunte"]):
             
             # Verificar contexto en memoria primero
-            if self.conversation_context:
-                last = self.conversation_context[-1]
+            if session.conversation_context:
+                last = session.conversation_context[-1]
                 
                 # Si la última en contexto es la actual (porque se añade al final), mirar la anterior
-                if last['question'] == self.last_question and len(self.conversation_context) > 1:
-                    last = self.conversation_context[-2]
-                elif last['question'] == self.last_question:
+                if last['question'] == session.last_question and len(session.conversation_context) > 1:
+                    last = session.conversation_context[-2]
+                elif last['question'] == session.last_question:
                      return "Acabas de preguntarme eso precisamente."
                 
                 return f"Tu última pregunta fue: \"{last['question']}\". Y te respondí sobre: {last['answer'][:50]}..."
             
-            # Si no hay contexto en memoria, buscar en DB
-            history = self.db.get_history(limit=2)
+            # Si no hay contexto en memoria, buscar en DB (el historial es común:
+            # solo vale para la sesión de consola, no para las de otros usuarios)
+            history = self.db.get_history(limit=2) if session is self.default_session else []
             if len(history) > 1: # La 0 es la actual probablemente
                 prev = history[1]
                 return f"Anteriormente me preguntaste: \"{prev['question']}\"."
@@ -122,9 +118,10 @@ class AIEngine:
             
         return None
 
-    def process_question(self, question: str) -> Tuple[Optional[str], str]:
+    def process_question(self, question: str, session: Optional[Session] = None) -> Tuple[Optional[str], str]:
         """Procesa una pregunta y devuelve la mejor respuesta"""
-        self.last_question = question
+        session = self._session(session)
+        session.last_question = question
         
         # 0. Verificar si es una intención puramente conversacional
         # 0. Verificar si es una intención puramente conversacional
@@ -132,18 +129,18 @@ class AIEngine:
         
         # Si encuentra definición interna o es charla casual
         if conv_response:
-            self.last_answer = conv_response
-            self.last_source = 'conversational' # Puede ser 'DEFINITION_FOUND' también internamente
+            session.last_answer = conv_response
+            session.last_source = 'conversational' # Puede ser 'DEFINITION_FOUND' también internamente
             return conv_response, 'conversational'
             
         # Si es intención técnica, seguimos al buscador
         # INTENT = intent (TECHNICAL o UNKNOWN)
 
         # 0.5. Verificar meta-preguntas (sobre el historial)
-        meta_answer = self.handle_meta_questions(question)
+        meta_answer = self.handle_meta_questions(question, session)
         if meta_answer:
-            self.last_answer = meta_answer
-            self.last_source = 'meta_context'
+            session.last_answer = meta_answer
+            session.last_source = 'meta_context'
             return meta_answer, 'meta'
 
         answers = self.find_answers(question)
@@ -155,44 +152,63 @@ class AIEngine:
             
             if len(answers) == 1 or best_q > 5.0:
                 answer = answers[0]['answer']
-                self.last_answer = answer
-                self.last_source = 'local'
+                session.last_answer = answer
+                session.last_source = 'local'
                 
                 self.db.update_q_value(question, answer, +0.5)
                 self.db.add_to_history(question, answer, 'local')
                 return answer, 'local'
             else:
                 # Si hay varias con confianza similar, pedimos elegir
-                self.last_answer = answers
-                self.last_source = 'local_multi'
+                session.last_answer = answers
+                session.last_source = 'local_multi'
                 return answers, 'local_multi'
         
-        self.last_source = 'unknown'
+        session.last_source = 'unknown'
         return None, 'unknown'
     
-    def skip_question_feedback(self, question: str):
+    def skip_question_feedback(self, question: str, session: Optional[Session] = None):
         """Marca una pregunta para no pedir feedback en esta sesión"""
-        self.skipped_questions.add(self.db.normalize_text(question))
+        session = self._session(session)
+        session.skipped_questions.add(self.db.normalize_text(question))
     
-    def should_ask_feedback(self, question: str) -> bool:
+    def should_ask_feedback(self, question: str, session: Optional[Session] = None) -> bool:
         """Determina si se debe pedir feedback para esta pregunta"""
-        return self.db.normalize_text(question) not in self.skipped_questions
+        session = self._session(session)
+        return self.db.normalize_text(question) not in session.skipped_questions
     
 
     
-    def search_web_and_process(self, question: str) -> Tuple[Optional[str], Optional[List[str]]]:
-        """Realiza búsqueda web exclusivamente con Gemini"""
+    def search_web_and_process(self, question: str,
+                               session: Optional[Session] = None) -> Tuple[Optional[str], Optional[List[str]]]:
+        """
+        Realiza búsqueda web exclusivamente con Gemini
+        
+        Si Gemini no responde dentro del plazo devuelve la mejor candidata local,
+        si la hay, con session.last_source = 'local_fallback'; ante cualquier
+        otro fallo de Gemini devuelve (None, None) como siempre
+        """
+        session = self._session(session)
         
         if self.gemini_engine:
-            answer, sources = self.gemini_engine.search_and_synthesize(question)
+            try:
+                answer, sources = self._cached_web_search(question)
+            except DeadlineExceeded:
+                candidate = self.best_local_candidate(question)
+                if candidate:
+                    session.last_source = 'local_fallback'
+                    session.last_answer = candidate
+                    self.db.add_to_history(question, candidate, 'local_fallback')
+                    return candidate, []
+                return None, None
             if answer:
-                self.last_source = 'gemini'
-                self.last_answer = answer
+                session.last_source = 'gemini'
+                session.last_answer = answer
                 
                 # Guardar automáticamente en knowledge base si está configurado
                 if AUTO_SAVE_WEB_ANSWERS:
                     topic = self.get_topic(question)
-                    self.last_learned_id = self.db.add_knowledge(question, answer, topic)
+                    session.last_learned_id = self.db.add_knowledge(question, answer, topic)
                     self.db.update_q_value(question, answer, +1.5)
                 
                 self.db.add_to_history(question, answer, 'gemini_search')
@@ -200,17 +216,36 @@ class AIEngine:
         
         return None, None
     
-    def handle_user_correction(self, correct_answer: str, question: Optional[str] = None):
+    def _cached_web_search(self, question: str) -> Tuple[Optional[str], List[str]]:
+        """Caché de lectura (clave = pregunta normalizada) delante de Gemini"""
+        cache_key = self.db.normalize_text(question)
+        
+        cached = self.db.get_cached_web_results(cache_key)
+        hit = isinstance(cached, dict) and bool(cached.get('answer'))
+        with self._stats_lock:
+            self.web_stats['total_searches'] += 1
+            self.web_stats['cache_hits' if hit else 'cache_misses'] += 1
+        if hit:
+            return cached['answer'], cached.get('sources', [])
+        
+        answer, sources = self.gemini_engine.search_and_synthesize(question)
+        if answer:
+            self.db.cache_web_results(cache_key, {'answer': answer, 'sources': sources}, CACHE_TTL_HOURS)
+        return answer, sources
+    
+    def handle_user_correction(self, correct_answer: str, question: Optional[str] = None,
+                               session: Optional[Session] = None):
         """Maneja una corrección del usuario"""
+        session = self._session(session)
         if question is None:
-            question = self.last_question
+            question = session.last_question
         
         if not question:
             return False
         
-        if isinstance(self.last_answer, str):
-            self.db.update_q_value(question, self.last_answer, -2.0)
-            self.db.record_selection(question, self.last_answer, was_correct=False)
+        if isinstance(session.last_answer, str):
+            self.db.update_q_value(question, session.last_answer, -2.0)
+            self.db.record_selection(question, session.last_answer, was_correct=False)
         
         topic = self.get_topic(question)
         self.db.add_knowledge(question, correct_answer, topic)
@@ -220,7 +255,10 @@ class AIEngine:
         return True
     
     def handle_answer_selection(self, question: str, selected_answer: str, is_correct: bool):
-        """Maneja la selección de una respuesta por el usuario"""
+        """
+        Maneja la valoración de una respuesta por el usuario (elegida entre varias o confirmada):
+        la única vía de refuerzo tanto para la consola como para POST /feedback
+        """
         reward = +1.5 if is_correct else -0.5
         self.db.update_q_value(question, selected_answer, reward)
         self.db.record_selection(question, selected_answer, was_correct=is_correct)
@@ -233,56 +271,73 @@ class AIEngine:
         self.db.update_q_value(question, answer, +1.0)
         self.db.add_to_history(question, answer, 'user_alternative')
     
-    def add_to_context(self, question: str, answer: str):
+    def add_to_context(self, question: str, answer: str, session: Optional[Session] = None):
         """Añade una interacción al contexto conversacional"""
-        self.conversation_context.append({
+        session = self._session(session)
+        session.conversation_context.append({
             'question': question,
             'answer': answer
         })
         
         # Mantener solo las últimas N conversaciones
-        if len(self.conversation_context) > MAX_CONTEXT_TURNS:
-            self.conversation_context = self.conversation_context[-MAX_CONTEXT_TURNS:]
+        if len(session.conversation_context) > MAX_CONTEXT_TURNS:
+            session.conversation_context = session.conversation_context[-MAX_CONTEXT_TURNS:]
     
-    def get_context_summary(self) -> str:
+    def get_context_summary(self, session: Optional[Session] = None) -> str:
         """Obtiene un resumen del contexto conversacional"""
-        if not self.conversation_context:
+        session = self._session(session)
+        if not session.conversation_context:
             return ""
         
         context_parts = []
-        for ctx in self.conversation_context[-3:]:  # Últimas 3 interacciones
+        for ctx in session.conversation_context[-3:]:  # Últimas 3 interacciones
             context_parts.append(f"P: {ctx['question'][:50]}... R: {ctx['answer'][:50]}...")
         
         return " | ".join(context_parts)
     
-    def get_stats(self) -> Dict:
+    def get_stats(self, session: Optional[Session] = None) -> Dict:
         """Obtiene estadísticas del motor de IA"""
+        session = self._session(session)
         db_stats = self.db.get_stats()
         
+        with self._stats_lock:
+            web_stats = dict(self.web_stats)
+        total_searches = web_stats['total_searches']
+        
         return {
             **db_stats,
-            'context_interactions': len(self.conversation_context)
+            **web_stats,
+            'cache_hit_rate': (web_stats['cache_hits'] / total_searches * 100) if total_searches else 0.0,
+            'context_interactions': len(session.conversation_context),
+            'sessions': self.sessions.stats(),
+            'gemini': self.gemini_engine.stats() if self.gemini_engine else None
         }
 
-    def forget_last_interaction(self) -> str:
+    def forget_last_interaction(self, session: Optional[Session] = None) -> str:
         """Olvida la última interacción aprendida si fue incorrecta"""
-        if not self.last_learned_id:
+        session = self._session(session)
+        if not session.last_learned_id:
             return "No tengo nada reciente que pueda olvidar."
         
         # Eliminar de base de conocimiento
-        if self.db.delete_knowledge(self.last_learned_id):
+        if self.db.delete_knowledge(session.last_learned_id):
+            # Que la caché web no vuelva a servir la respuesta incorrecta
+            if session.last_question:
+                self.db.invalidate_web_cache(self.db.normalize_text(session.last_question))
+            
             # Limpiar referencia
-            self.last_learned_id = None
+            session.last_learned_id = None
             
             # Limpiar de contexto también
-            if self.conversation_context:
-                self.conversation_context.pop()
+            if session.conversation_context:
+                session.conversation_context.pop()
                 
             return "Entendido. He olvidado la última respuesta aprendida."
         else:
             return "Hubo un error al intentar olvidar la respuesta."
-    def learn_from_url(self, url: str) -> bool:
+    def learn_from_url(self, url: str, session: Optional[Session] = None) -> bool:
         """Aprende de una URL específica proporcionada por el usuario"""
+        session = self._session(session)
         try:
             import requests
             import re
@@ -327,11 +382,11 @@ class AIEngine:
             synthesis = clean_text[:MAX_SYNTHESIS_LENGTH]
             
             if synthesis:
-                topic = self.get_topic(self.last_question)
+                topic = self.get_topic(session.last_question)
                 # Añadir como nuevo conocimiento
-                self.db.add_knowledge(self.last_question, synthesis, topic)
-                self.db.update_q_value(self.last_question, synthesis, +2.0)
-                self.db.add_to_history(self.last_question, synthesis, 'user_url_correction', was_correct=True)
+                self.db.add_knowledge(session.last_question, synthesis, topic)
+                self.db.update_q_value(session.last_question, synthesis, +2.0)
+                self.db.add_to_history(session.last_question, synthesis, 'user_url_correction', was_correct=True)
                 return True
                 
             return False
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Modo por lotes de OfficeAI (run.py --batch entrada.jsonl --out salida.jsonl)
+Responde preguntas de un JSONL sin interacción, con un pool de hilos, y escribe
+los resultados en el orden de entrada. La propia salida sirve de checkpoint: si
+el proceso muere, al relanzarlo se saltan los ids que ya tienen resultado y se
+reintentan los que fallaron (source "error").
+
+Entrada: una línea por pregunta, {"id": ..., "question": "..."} ("id" es opcional;
+por defecto, el número de línea) o simplemente "texto de la pregunta"
+Salida: {"id", "question", "answer", "source", "options", "sources"} y "error" si falló
+(source "error") o si la línea de entrada no era válida (source "invalid", no se reintenta)
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from ai_engine import AIEngine
+from config import BATCH_WORKERS, BATCH_WEB_CONCURRENCY, BATCH_WINDOW, BATCH_PROGRESS_EVERY
+from database import Database
+from gemini_engine import StubGeminiEngine
+from session import Session
+from utils import setup_logging, stop_on_sigterm
+
+
+def id_key(item_id) -> str:
+    """Forma canónica (y hashable) de un id JSON cualquiera, también listas u objetos"""
+    return json.dumps(item_id, sort_keys=True, ensure_ascii=False)
+
+
+def read_items(input_path: str) -> Iterator[Tuple[object, str, str]]:
+    """(id, pregunta, error) de cada línea no vacía de la entrada"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield line_number, "", "Línea JSON no válida"
+                continue
+            if isinstance(item, str):
+                item = {'question': item}
+            question = item.get('question') if isinstance(item, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                yield line_number, "", "Falta el campo 'question'"
+                continue
+            yield item.get('id', line_number), question.strip(), None
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """
+    Ids (en su forma id_key) que ya tienen resultado en la salida
+
+    Quita de la salida los resultados con source "error", que se vuelven a intentar, y
+    una última línea a medio escribir
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb') as f:
+        data = f.read()
+    complete = data.rfind(b"\n") + 1  # Si el proceso murió escribiendo una línea, se descarta
+    kept = []
+    for line in data[:complete].splitlines(keepends=True):
+        try:
+            result = json.loads(line)
+            key = id_key(result['id'])
+        except (ValueError, KeyError, TypeError):
+            kept.append(line)
+            continue
+        if result.get('source') == 'error':
+            continue
+        done.add(key)
+        kept.append(line)
+
+    cleaned = b"".join(kept)
+    if cleaned != data:
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(cleaned)
+        os.replace(tmp_path, output_path)
+    return done
+
+
+class BatchRunner:
+    """Responde preguntas en paralelo con un AIEngine compartido (una sesión por pregunta)"""
+
+    def __init__(self, ai, workers: int = BATCH_WORKERS, web_concurrency: int = BATCH_WEB_CONCURRENCY,
+                 window: int = BATCH_WINDOW):
+        """
+        Args:
+            ai: AIEngine compartido por todos los hilos
+            workers: Hilos del pool
+            web_concurrency: Búsquedas web simultáneas como máximo (dentro del pool)
+            window: Preguntas en curso por delante de la última escrita (acota la memoria)
+        """
+        self.ai = ai
+        self.workers = workers
+        self.window = max(window, workers)
+        self._web_slots = threading.BoundedSemaphore(web_concurrency)
+
+    def answer(self, item_id, question: str) -> Dict:
+        """Resultado de una pregunta: local, conversacional o, si no se sabe, de la web"""
+        session = Session(f"batch-{item_id}")
+        result = {'id': item_id, 'question': question, 'answer': None, 'source': 'unknown',
+                  'options': [], 'sources': []}
+        answer, source = self.ai.process_question(question, session)
+        if source == 'local_multi':
+            result['options'] = [option['answer'] for option in answer]
+            answer = result['options'][0]
+        elif source == 'unknown' and self.ai.gemini_engine is not None:
+            with self._web_slots:
+                answer, sources = self.ai.search_web_and_process(question, session)
+            if answer:
+                source = session.last_source  # 'gemini' o 'local_fallback'
+                result['sources'] = sources or []
+        result['answer'] = answer
+        result['source'] = source
+        return result
+
+    def _safe_answer(self, item_id, question: str) -> Dict:
+        try:
+            return self.answer(item_id, question)
+        except Exception as e:
+            return {'id': item_id, 'question': question, 'answer': None, 'source': 'error',
+                    'options': [], 'sources': [], 'error': str(e)}
+
+    def run(self, input_path: str, output_path: str) -> Dict[str, int]:
+        """
+        Procesa la entrada y añade los resultados a la salida en el orden de entrada
+
+        Returns:
+            Dict con el número de preguntas respondidas, saltadas (ya hechas) y por fuente
+        """
+        done = completed_ids(output_path)
+        counts = {'processed': 0, 'skipped': 0, 'errors': 0}
+        started = time.monotonic()
+        pending = deque()
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='officeai-batch') as pool, \
+                open(output_path, 'a', encoding='utf-8') as out:
+
+            def write_next():
+                result = pending.popleft().result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts['processed'] += 1
+                counts[result['source']] = counts.get(result['source'], 0) + 1
+                if 'error' in result:
+                    counts['errors'] += 1
+                if counts['processed'] % BATCH_PROGRESS_EVERY == 0:
+                    rate = counts['processed'] / max(time.monotonic() - started, 1e-9)
+                    print(f"[BATCH] {counts['processed']} respondidas ({rate:.1f} preguntas/s)")
+
+            try:
+                for item_id, question, error in read_items(input_path):
+                    if id_key(item_id) in done:
+                        counts['skipped'] += 1
+                        continue
+                    if error:
+                        invalid = {'id': item_id, 'question': question, 'answer': None, 'source': 'invalid',
+                                   'options': [], 'sources': [], 'error': error}
+                        pending.append(pool.submit(lambda result=invalid: result))
+                    else:
+                        pending.append(pool.submit(self._safe_answer, item_id, question))
+                    while len(pending) >= self.window:
+                        write_next()
+                while pending:
+                    write_next()
+            except BaseException:
+                # Interrumpido: lo no escrito se repetirá al reanudar, no esperar a lo encolado
+                for future in pending:
+                    future.cancel()
+                raise
+
+        counts['seconds'] = round(time.monotonic() - started, 2)
+        return counts
+
+
+def run_batch(input_path: str, output_path: str, db_path: Optional[str] = None,
+              stub_gemini: bool = False, workers: int = BATCH_WORKERS):
+    """Procesa un fichero completo (modo run.py --batch)"""
+    setup_logging()
+    db = Database(db_path) if db_path else Database()
+    ai = AIEngine(db)
+    if stub_gemini:
+        ai.gemini_engine = StubGeminiEngine()
+
+    stop_on_sigterm()
+    print(f"Procesando {input_path} -> {output_path} con {workers} hilos (Ctrl+C para parar y reanudar luego)")
+    try:
+        counts = BatchRunner(ai, workers=workers).run(input_path, output_path)
+        print(f"[BATCH] Terminado: {counts}")
+    except KeyboardInterrupt:
+        print("\n[BATCH] Interrumpido; vuelve a lanzar el mismo comando para continuar")
+    finally:
+        db.close()
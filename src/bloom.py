@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Filtro de Bloom para OfficeAI
+Conjunto probabilístico sin falsos negativos: si dice que una clave no está,
+no está. Se usa para descartar en O(1) las consultas que no pueden coincidir
+con nada de la base de conocimiento. Se persiste junto a la base de datos.
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+_MAGIC = b"OAIBLOOM"
+_HEADER = struct.Struct("<8sIQdQqq")  # magia, versión, capacidad, tasa de error, claves, huella (n, suma)
+_FORMAT_VERSION = 1
+
+
+@lru_cache(maxsize=65536)
+def _positions(key: str, num_bits: int, num_hashes: int) -> Tuple[int, ...]:
+    """Posiciones de bit de una clave; se memorizan porque las palabras consultadas se repiten mucho"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return tuple((h1 + i * h2) % num_bits for i in range(num_hashes))
+
+
+class BloomFilter:
+    """Array de bits con k posiciones por clave (doble hashing sobre BLAKE2b)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Args:
+            capacity: Número de claves previsto; por encima la tasa de falsos positivos crece
+            error_rate: Tasa de falsos positivos objetivo con capacity claves
+        """
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0  # Claves que activaron algún bit nuevo (estimación de claves distintas)
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def dirty(self) -> bool:
+        """True si cambió desde la última vez que se guardó"""
+        return self._dirty
+
+    @property
+    def saturated(self) -> bool:
+        """True si ya contiene más claves de las previstas (conviene reconstruirlo más grande)"""
+        return self._count > self.capacity
+
+    def add(self, key: str) -> bool:
+        """Añade una clave; devuelve True si era (seguro) nueva"""
+        positions = _positions(key, self.num_bits, self.num_hashes)
+        with self._lock:
+            added = False
+            for position in positions:
+                byte, mask = position >> 3, 1 << (position & 7)
+                if not self._bits[byte] & mask:
+                    self._bits[byte] |= mask
+                    added = True
+            if added:
+                self._count += 1
+                self._dirty = True
+            return added
+
+    def add_many(self, keys: Iterable[str]) -> int:
+        return sum(self.add(key) for key in keys)
+
+    def __contains__(self, key: str) -> bool:
+        """False: la clave no se añadió nunca. True: probablemente se añadió"""
+        bits = self._bits
+        for position in _positions(key, self.num_bits, self.num_hashes):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path: Path, fingerprint: Tuple[int, int]) -> bool:
+        """Persiste el filtro junto con la huella de los datos de los que sale (escritura atómica)"""
+        path = Path(path)
+        with self._lock:
+            header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, self.capacity, self.error_rate,
+                                  self._count, *fingerprint)
+            bits = bytes(self._bits)
+            self._dirty = False
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.write(bits)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            self._dirty = True
+            print(f"[ERROR] No se pudo guardar el filtro de Bloom: {e}")
+            return False
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[Tuple['BloomFilter', Tuple[int, int]]]:
+        """Carga un filtro persistido y su huella; None si no existe o no es válido"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                bits = f.read()
+            magic, version, capacity, error_rate, count, n, total = _HEADER.unpack(header)
+        except (OSError, struct.error) as e:
+            print(f"[ERROR] No se pudo cargar el filtro de Bloom: {e}")
+            return None
+
+        if (magic, version) != (_MAGIC, _FORMAT_VERSION) or not 0 < error_rate < 1:
+            return None
+        bloom = cls(capacity, error_rate)
+        if len(bits) != len(bloom._bits):
+            return None
+        bloom._bits = bytearray(bits)
+        bloom._count = count
+        return bloom, (n, total)
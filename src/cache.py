@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Caché LRU en memoria para OfficeAI
+Acotada, segura entre hilos y con métricas de aciertos, fallos y expulsiones
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Diccionario acotado que expulsa la entrada usada hace más tiempo"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0  # Crece con cada invalidación
+
+    @property
+    def generation(self) -> int:
+        """Marca que se toma antes de leer de la fuente y se pasa a put()"""
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Devuelve el valor cacheado (marcándolo como reciente) o None si no está"""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Guarda un valor y expulsa las entradas menos recientes si se supera el tope
+        
+        Si se indica generation y hubo invalidaciones desde entonces, el valor puede
+        estar obsoleto y no se guarda
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        """Descarta las entradas indicadas (las ausentes se ignoran)"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Descarta todas las entradas (las métricas se conservan)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """Métricas acumuladas de la caché"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+            }
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Cortocircuito (circuit breaker) para OfficeAI
+Tras varios fallos seguidos de un servicio deja de llamarlo durante un tiempo
+de enfriamiento; pasado ese tiempo deja pasar una única llamada de prueba y,
+según salga, vuelve a cerrarse o espera otro periodo
+"""
+import threading
+import time
+from typing import Dict
+
+CLOSED = 'closed'        # Funciona: se llama con normalidad
+OPEN = 'open'            # Falla: no se llama hasta que pase el enfriamiento
+HALF_OPEN = 'half_open'  # Enfriado: hay una llamada de prueba en curso
+
+
+class CircuitOpenError(Exception):
+    """Ningún servicio disponible: todos los circuitos están abiertos"""
+
+
+class CircuitBreaker:
+    """Estado de salud de un servicio según sus últimos resultados (seguro entre hilos)"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0):
+        """
+        Args:
+            failure_threshold: Fallos consecutivos que abren el circuito
+            cooldown: Segundos que permanece abierto antes de dejar pasar una prueba
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return HALF_OPEN  # La próxima llamada será la de prueba
+            return self._state
+
+    def allow(self) -> bool:
+        """True si se puede llamar ahora (si es la llamada de prueba, el circuito pasa a semiabierto)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+                return True
+            return False  # Abierto, o semiabierto con la prueba aún en curso
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """La llamada permitida no llegó a hacerse: si era la prueba, se permite otra"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = OPEN
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'times_opened': self.times_opened,
+                'retry_in': round(max(0.0, self.cooldown - (time.monotonic() - self._opened_at)), 1)
+                            if self._state == OPEN else 0.0,
+            }
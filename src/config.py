@@ -30,11 +30,113 @@ PERSONALITY: Final[dict] = {
 # Frases de corrección
 CORRECTION_PHRASES: Final[list] = ["1001"]
 
+# Palabras clave por tema, en orden de prioridad (sin distinguir acentos; se comparan palabras completas)
+TOPIC_KEYWORDS: Final[dict] = {
+    "excel": ["excel", "hoja de cálculo", "fórmula", "fórmulas", "celda", "celdas", "tabla dinámica",
+              "tablas dinámicas", "buscarv", "hoja", "hojas", "cálculo"],
+    "word": ["word", "procesador de textos", "estilos", "índice", "documento", "documentos", "redactar"],
+    "access": ["access", "base de datos", "bases de datos", "tabla", "tablas", "clave primaria", "consulta", "consultas"],
+    "powerpoint": ["powerpoint", "presentación", "presentaciones", "diapositiva", "diapositivas"],
+    "outlook": ["outlook", "correo", "correos", "calendario", "reglas", "email"],
+    "base_office": ["office", "microsoft office", "suite"]
+}
+
+# Calidad de respuestas: se evalúa al insertar y se guarda como flag en knowledge
+BAD_ANSWER_PHRASES: Final[list] = ["no se", "quizas", "puede ser", "no tengo informacion", "no estoy seguro"]
+BAD_ANSWER_MIN_WORDS: Final[int] = 2
+
+# Configuración de SQLite (perfil de PRAGMAs aplicado a cada conexión persistente)
+DB_PRAGMAS: Final[dict] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # En KiB cuando es negativo (~16MB)
+    "mmap_size": 128 * 1024 * 1024,  # 128MB
+    "busy_timeout": 5000,  # ms
+    "temp_store": "MEMORY",
+}
+DB_STATEMENT_CACHE_SIZE: Final[int] = 256  # Sentencias preparadas cacheadas por conexión
+
+# Escritura diferida (historial, Q-values y selecciones) con commit agrupado
+WRITE_BEHIND_ENABLED: Final[bool] = True
+WRITE_BEHIND_BATCH_SIZE: Final[int] = 64  # Mutaciones máximas por transacción
+WRITE_BEHIND_FLUSH_INTERVAL: Final[float] = 0.2  # Segundos máximos antes de confirmar un lote
+
+# Retención del historial: las filas más antiguas se agregan por día y se eliminan
+HISTORY_RETENTION_DAYS: Final[int] = 90
+HISTORY_COMPACTION_BATCH: Final[int] = 5000  # Filas compactadas por transacción
+
+# Normalizador de texto compartido
+NORMALIZER_CACHE_SIZE: Final[int] = 4096  # Textos normalizados memorizados (LRU)
+
+# Caché en memoria de respuestas rankeadas por pregunta normalizada
+ANSWER_CACHE_SIZE: Final[int] = 2048  # Preguntas cacheadas (LRU)
+ANSWER_CACHE_DEPTH: Final[int] = 5  # Respuestas guardadas por pregunta (límites mayores van a SQLite)
+
 # Configuración de búsqueda
 FUZZY_CUTOFF: Final[float] = 0.7
 MIN_POINTS_FOR_PRIORITY: Final[int] = 10
 WEB_SEARCH_RESULTS: Final[int] = 4
 CACHE_TTL_HOURS: Final[int] = 24
+WEB_CACHE_MAX_ENTRIES: Final[int] = 5000  # Tope de búsquedas cacheadas (se expulsan las menos usadas)
+
+# Búsqueda full-text (FTS5/BM25) como nivel de respaldo antes de Gemini
+USE_FTS_SEARCH: Final[bool] = True
+FTS_MIN_COVERAGE: Final[float] = 0.75  # Fracción de las palabras con contenido de la pregunta que debe tener la candidata
+FTS_MIN_CANDIDATE_COVERAGE: Final[float] = 0.5  # Y fracción de las de la candidata presentes en la pregunta
+
+# Palabras vacías que no cuentan para la cobertura de una candidata (interrogativos, artículos,
+# preposiciones y verbos genéricos): 'cuantos planetas hay' no es 'cuantos continentes hay'
+RETRIEVAL_STOPWORDS: Final[frozenset] = frozenset({
+    "el", "la", "lo", "los", "las", "un", "una", "unos", "unas", "y", "o", "u", "e", "ni", "pero", "si", "no",
+    "a", "al", "de", "del", "en", "con", "sin", "por", "para", "sobre", "entre", "desde", "hasta",
+    "que", "cual", "cuales", "quien", "quienes", "cuando", "donde", "como", "porque",
+    "cuanto", "cuanta", "cuantos", "cuantas",
+    "me", "te", "se", "le", "les", "nos", "mi", "mis", "tu", "tus", "su", "sus", "yo",
+    "este", "esta", "estos", "estas", "ese", "esa", "esos", "esas", "esto", "eso",
+    "es", "son", "hay", "ser", "estar", "puedo", "puede", "puedes", "debo",
+    "hacer", "hace", "hago", "crear", "creo", "sirve", "sirven", "usar", "uso", "utilizar",
+    "mas", "muy", "ya", "tambien", "algo", "alguna", "alguno",
+})
+
+# Índice semántico local (n-gramas de caracteres con hashing + coseno TF-IDF en NumPy)
+USE_SEMANTIC_SEARCH: Final[bool] = True
+SEMANTIC_INDEX_DIM: Final[int] = 1024  # Cubetas del hashing (columnas de la matriz)
+SEMANTIC_NGRAM: Final[int] = 3  # Longitud de los n-gramas de caracteres
+SEMANTIC_THRESHOLD: Final[float] = 0.72  # Coseno mínimo para aceptar una pregunta parecida
+SEMANTIC_TOP_K: Final[int] = 5  # Preguntas candidatas por consulta
+
+# Corrección ortográfica (SymSpell) con el vocabulario de las preguntas conocidas
+USE_SPELL_CORRECTION: Final[bool] = True
+SPELLING_MAX_DISTANCE: Final[int] = 2  # Errores tolerados en palabras largas (1 hasta 5 letras, 0 hasta 3)
+SPELLING_PREFIX_LENGTH: Final[int] = 7  # Longitud del prefijo cuyos borrados se indexan
+
+# Filtro de Bloom con las palabras de las preguntas conocidas: descarta sin consultar la DB
+# las preguntas que no pueden alcanzar la similitud ni la cobertura mínimas
+USE_BLOOM_FILTER: Final[bool] = True
+BLOOM_ERROR_RATE: Final[float] = 0.01  # Tasa de falsos positivos objetivo
+BLOOM_MIN_CAPACITY: Final[int] = 10000  # Palabras previstas como mínimo (se reconstruye al doble si se supera)
+
+# Sesiones de conversación (un proceso atiende a muchos usuarios)
+SESSION_MAX_ACTIVE: Final[int] = 10000  # Sesiones en memoria (se expulsan las usadas hace más tiempo)
+SESSION_IDLE_TTL_MINUTES: Final[int] = 30  # Inactividad tras la que una sesión caduca
+SESSION_PERSIST: Final[bool] = True  # Guardar en SQLite las sesiones expulsadas para recuperarlas
+
+# Servidor HTTP/JSON (run.py --serve)
+SERVER_HOST: Final[str] = "127.0.0.1"
+SERVER_PORT: Final[int] = 8080
+SERVER_MAX_IN_FLIGHT: Final[int] = 64  # Peticiones en curso a la vez; por encima se responde 429
+SERVER_MAX_WEB_IN_FLIGHT: Final[int] = 8  # Búsquedas web en curso a la vez; por encima se responde 429
+SERVER_DB_WORKERS: Final[int] = 8  # Hilos para el trabajo de base de datos
+SERVER_WEB_WORKERS: Final[int] = 8  # Hilos para las llamadas a Gemini
+SERVER_MAX_BODY_BYTES: Final[int] = 64 * 1024
+SERVER_KEEPALIVE_TIMEOUT: Final[float] = 15.0  # Segundos que se mantiene abierta una conexión ociosa
+SERVER_STUB_LATENCY: Final[float] = 0.5  # Latencia simulada de Gemini con --stub-gemini
+
+# Modo por lotes (run.py --batch entrada.jsonl --out salida.jsonl)
+BATCH_WORKERS: Final[int] = 8  # Hilos que responden preguntas a la vez
+BATCH_WEB_CONCURRENCY: Final[int] = 4  # Búsquedas web simultáneas como máximo
+BATCH_WINDOW: Final[int] = 64  # Preguntas en curso por delante de la última escrita (salida en orden)
+BATCH_PROGRESS_EVERY: Final[int] = 100  # Cada cuántas respuestas se informa del progreso
 
 # Configuración de Q-Learning
 Q_LEARNING_RATE: Final[float] = 0.1
@@ -56,8 +158,40 @@ AUTO_SAVE_WEB_ANSWERS: Final[bool] = True  # Guardar respuestas web automáticam
 # Configuración de Gemini
 GEMINI_API_KEY: Final[str] = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL: Final[str] = "gemini-flash-latest"  # Cambiado a flash-latest para mejor estabilidad de cuota
+GEMINI_FALLBACK_MODEL: Final[str] = "gemini-flash-lite-latest"  # Respaldo si el principal falla o no existe
 USE_GEMINI_SEARCH: Final[bool] = True if GEMINI_API_KEY else False
 
+# Cuota de Gemini, compartida por todos los procesos a través de un fichero SQLite propio
+GEMINI_QUOTA_DB_PATH: Final[Path] = DATA_DIR / "gemini_quota.db"
+GEMINI_REQUESTS_PER_MINUTE: Final[int] = int(os.getenv("GEMINI_RPM", "10"))  # Según el plan de la API key
+GEMINI_REQUESTS_PER_DAY: Final[int] = int(os.getenv("GEMINI_RPD", "250"))
+GEMINI_MAX_CONCURRENCY: Final[int] = 4  # Llamadas simultáneas por proceso
+GEMINI_QUOTA_WAIT_SECONDS: Final[float] = 30.0  # Espera máxima por un hueco de cuota antes de desistir
+GEMINI_MAX_RETRIES: Final[int] = 3  # Reintentos tras un 429
+GEMINI_BACKOFF_BASE: Final[float] = 1.0  # Segundos; la espera máxima se duplica en cada reintento
+GEMINI_BACKOFF_MAX: Final[float] = 30.0
+
+# Cortocircuito por variante de modelo (principal, sin herramientas, respaldo)
+GEMINI_BREAKER_FAILURES: Final[int] = 3  # Fallos seguidos que abren el circuito
+GEMINI_BREAKER_COOLDOWN: Final[float] = 60.0  # Segundos sin llamar a la variante antes de probarla de nuevo
+GEMINI_LATENCY_WINDOW: Final[int] = 200  # Latencias recientes por variante (estadísticas y hedging)
+
+# Peticiones con plazo y cobertura (hedging): si la principal tarda más que el percentil
+# indicado de sus llamadas recientes, se lanza otra a la siguiente variante y gana la primera
+GEMINI_DEADLINE_SECONDS: Final[float] = 25.0  # Plazo total de una búsqueda web
+GEMINI_HEDGE_PERCENTILE: Final[float] = 90.0
+GEMINI_HEDGE_MIN_SAMPLES: Final[int] = 20  # Latencias necesarias para fiarse del percentil
+GEMINI_HEDGE_DEFAULT_DELAY: Final[float] = 8.0  # Segundos antes de cubrir mientras no hay datos
+GEMINI_HEDGE_MIN_DELAY: Final[float] = 1.0
+
+# Entrenamiento masivo (train_bot.py): respuestas de Gemini que se guardan juntas en cada transacción
+TRAINING_SAVE_BATCH: Final[int] = 5
+
+# Si la web no responde a tiempo, se ofrece la mejor candidata local con umbrales más laxos
+LOCAL_FALLBACK_FUZZY_CUTOFF: Final[float] = 0.5
+LOCAL_FALLBACK_SEMANTIC_THRESHOLD: Final[float] = 0.6
+LOCAL_FALLBACK_FTS_COVERAGE: Final[float] = 0.6  # Con dos palabras con contenido exige ambas
+
 # Datos iniciales para base de conocimiento
 INITIAL_DATA: Final[dict] = {
     "base_office": {
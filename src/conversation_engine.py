@@ -5,7 +5,12 @@ Maneja saludos, charla casual y detección de intenciones no técnicas.
 """
 import random
 import re
-import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+from config import TOPIC_KEYWORDS, NORMALIZER_CACHE_SIZE
+from keyword_matcher import KeywordMatcher
+from text_normalizer import normalize
 
 class ConversationEngine:
     """Motor para manejar aspectos conversacionales, clasificación de intenciones y NLP"""
@@ -31,16 +36,27 @@ class ConversationEngine:
             r'\b(gracias|ok|vale|entendido|perfecto|genial|bien)\b'
         ],
         'DEFINITION_REQUEST': [
-            r'\b(que\s?es|definicion\s?de|significado\s?de|define)\b'
+            r'\b(que\s?es|definicion\s?de|significado\s?de|define)\b',
+            # Patrones extendidos para peticiones de información
+            r'\b(sabes\s?de|conoces\s?sobre|informacion\s?de|hablame\s?de|dime\s?de|dime\s?lo\s?que\s?sepas\s?de)\b'
         ],
         'OPINION_REQUEST': [
             r'\b(que\s?opinas|tu\s?opinion)\b'
-        ],
-        'OFFICE_TOPIC': [
-            r'\b(excel|word|powerpoint|access|outlook|office|formula|macro|tabla|celda|diapositiva|correo)\b'
         ]
     }
     
+    # Orden de resolución: definición > opinión > (Office) > intenciones conversacionales
+    INTENT_PRIORITY = [
+        'DEFINITION_REQUEST', 'OPINION_REQUEST',
+        'GREETING', 'FAREWELL', 'IDENTIFICATION', 'CAPABILITIES', 'FEELING', 'ACKNOWLEDGEMENT'
+    ]
+    
+    # Entidades que marcan un mensaje como tema de Office
+    OFFICE_ENTITIES = [
+        'excel', 'word', 'powerpoint', 'access', 'outlook', 'office',
+        'formula', 'macro', 'tabla', 'celda', 'diapositiva', 'correo'
+    ]
+    
     RESPONSES = {
         'GREETING': [
             "¡Hola! ¿En qué puedo ayudarte hoy con Office?",
@@ -98,26 +114,27 @@ class ConversationEngine:
         "lo", "que", "sepas", "hacer", "quiero", "necesito", "gustaria", "dime", "cuenta", "explica"
     ])
 
-    def __init__(self):
-        pass
+    def __init__(self, speller=None):
+        """
+        Args:
+            speller: Corrector ortográfico opcional (SpellingCorrector) para las palabras clave
+        """
+        self.speller = speller
 
     def _normalize(self, text):
-        """Normaliza el texto para facilitar la coincidencia de patrones"""
-        # Eliminar acentos
-        text = ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
-        return text.lower().strip()
+        """Normaliza el texto para facilitar la coincidencia de patrones (sin acentos, en minúsculas)"""
+        return normalize(text).folded
 
     def tokenize(self, text):
         """Divide el texto en tokens (palabras) limpias"""
-        normalized = self._normalize(text)
-        # Eliminar puntuación y caracteres especiales
-        clean_text = re.sub(r'[^\w\s]', '', normalized)
-        return clean_text.split()
+        return list(normalize(text).tokens)
 
     def extract_keywords(self, text):
-        """Extrae palabras clave eliminando stopwords"""
+        """Extrae palabras clave eliminando stopwords (y corrigiendo erratas si hay corrector)"""
         tokens = self.tokenize(text)
         keywords = [token for token in tokens if token not in self.STOPWORDS and len(token) > 1]
+        if self.speller is not None:
+            keywords = [self.speller.correct_word(token) for token in keywords]
         return keywords
 
     def refine_search_query(self, text):
@@ -148,60 +165,60 @@ class ConversationEngine:
 
     def get_internal_definition(self, text):
         """Busca una definición interna basada en el texto"""
-        normalized = self._normalize(text)
-        
-        # Buscar coincidencias exactas o parciales en las definiciones internas
-        for key, definition in self.INTERNAL_DEFINITIONS.items():
-            # Si la clave está en el texto (ej: "que es excel" -> key="excel")
-            if re.search(r'\b' + re.escape(key) + r'\b', normalized):
-                return definition
+        # Si alguna clave está en el texto (ej: "que es excel" -> key="excel"), gana la primera declarada
+        definitions = match_keywords(text).definitions
+        if definitions:
+            return self.INTERNAL_DEFINITIONS[definitions[0]]
         return None
 
+    def match_intents(self, text):
+        """Devuelve todas las intenciones presentes en el texto, en orden de prioridad"""
+        return self._scan_intents(self._normalize(text), exhaustive=True)
+
+    def _scan_intents(self, normalized_text, exhaustive):
+        """
+        Recorre el texto con el escáner único de intenciones
+        
+        Cada búsqueda devuelve la intención de mayor prioridad que empieza en esa posición,
+        así que la mejor de todas aparece siempre. Con exhaustive también se comprueban las de
+        menor prioridad que empiezan en el mismo punto; sin él, se para al encontrar la primera
+        en prioridad.
+        """
+        found = set()
+        match = _INTENT_SCANNER.search(normalized_text)
+        while match:
+            start, intent = match.start(), match.lastgroup
+            found.add(intent)
+            if exhaustive:
+                for other in self.INTENT_PRIORITY[_INTENT_RANK[intent] + 1:]:
+                    if other not in found and _INTENT_PATTERNS[other].match(normalized_text, start):
+                        found.add(other)
+            elif _INTENT_RANK[intent] == 0:
+                break
+            match = _INTENT_SCANNER.search(normalized_text, start + 1)
+        
+        return tuple(intent for intent in self.INTENT_PRIORITY if intent in found)
+
     def classify_intent(self, text):
         """Clasifica la intención del usuario basándose en patrones regex y keywords"""
         normalized_text = self._normalize(text)
+        intents = self._scan_intents(normalized_text, exhaustive=False)
+        is_office_related = bool(match_keywords(text).office_entities)
         
-        # Prioridad 0: Definiciones explícitas
-        # Patrones extendidos para peticiones de información
-        definition_phrases = self.INTENTS['DEFINITION_REQUEST'] + [
-            r'\b(sabes\s?de|conoces\s?sobre|informacion\s?de|hablame\s?de|dime\s?de|dime\s?lo\s?que\s?sepas\s?de)\b'
-        ]
-        
-        is_definition_request = False
-        for pattern in definition_phrases:
-            if re.search(pattern, normalized_text):
-                is_definition_request = True
-                break
-        
-        if is_definition_request:
-            # Verificar si es sobre un tema de Office
-            for topic in self.INTENTS['OFFICE_TOPIC']:
-                if re.search(topic, normalized_text):
-                     return 'DEFINITION_OFFICE'
-            return 'DEFINITION_GENERAL'
+        # Prioridad 0: Definiciones explícitas (¿sobre un tema de Office?)
+        if 'DEFINITION_REQUEST' in intents:
+            return 'DEFINITION_OFFICE' if is_office_related else 'DEFINITION_GENERAL'
 
         # Prioridad 0.5: Opiniones
-        for pattern in self.INTENTS['OPINION_REQUEST']:
-             if re.search(pattern, normalized_text):
-                 return 'OPINION'
-
-        # Prioridad 1: Verificar si es tema técnico de Office (para saltar charla)
-        is_office_related = False
-        for pattern in self.INTENTS['OFFICE_TOPIC']:
-            if re.search(pattern, normalized_text):
-                is_office_related = True
-                break
-                
-        # Clasificar otras intenciones conversacionales
-        for intent, patterns in self.INTENTS.items():
-            if intent in ['OFFICE_TOPIC', 'DEFINITION_REQUEST', 'OPINION_REQUEST']: continue 
-            
-            for pattern in patterns:
-                if re.search(pattern, normalized_text):
-                    # Si es un saludo pero tiene mucho contenido técnico, es técnico
-                    if is_office_related and len(normalized_text.split()) > 3:
-                        return 'TECHNICAL'
-                    return intent
+        if 'OPINION_REQUEST' in intents:
+            return 'OPINION'
+
+        # Intenciones conversacionales (ya vienen ordenadas por prioridad)
+        if intents:
+            # Si es un saludo pero tiene mucho contenido técnico, es técnico
+            if is_office_related and len(normalized_text.split()) > 3:
+                return 'TECHNICAL'
+            return intents[0]
         
         # Si no coincide con charla pero tiene palabras de Office, es técnico
         if is_office_related:
@@ -209,6 +226,21 @@ class ConversationEngine:
             
         return 'UNKNOWN'
 
+    def classify_many(self, texts):
+        """
+        Clasifica un lote de textos (p. ej. para reclasificar el historial sin conexión)
+        
+        Returns:
+            Lista de intenciones alineada con texts; los textos repetidos se clasifican una vez
+        """
+        classified = {}
+        intents = []
+        for text in texts:
+            if text not in classified:
+                classified[text] = self.classify_intent(text)
+            intents.append(classified[text])
+        return intents
+
     def get_response(self, intent):
         """Obtiene una respuesta aleatoria para la intención dada"""
         if intent in self.RESPONSES:
@@ -244,3 +276,71 @@ class ConversationEngine:
             
         response = self.get_response(intent)
         return response, intent
+
+
+class KeywordHits(NamedTuple):
+    """Palabras clave encontradas en un texto"""
+    topics: Tuple[str, ...]            # Temas de TOPIC_KEYWORDS, en su orden de prioridad
+    office_entities: Tuple[str, ...]   # Entidades de OFFICE_ENTITIES, en orden de aparición
+    definitions: Tuple[str, ...]       # Claves de INTERNAL_DEFINITIONS, en su orden de declaración
+
+    @property
+    def topic(self) -> str:
+        """Tema principal del texto ('general' si no menciona ninguno)"""
+        return self.topics[0] if self.topics else "general"
+
+
+def _build_keyword_matcher() -> KeywordMatcher:
+    """Autómata único con los temas, las entidades de Office y las definiciones internas"""
+    matcher = KeywordMatcher()
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        for keyword in keywords:
+            matcher.add(keyword, ('topic', topic))
+    for entity in ConversationEngine.OFFICE_ENTITIES:
+        matcher.add(entity, ('office', entity))
+    for key in ConversationEngine.INTERNAL_DEFINITIONS:
+        matcher.add(key, ('definition', key))
+    return matcher.build()
+
+
+_KEYWORD_MATCHER = _build_keyword_matcher()
+
+def _build_intent_scanner():
+    """
+    Una sola alternancia con un grupo con nombre por intención, en orden de prioridad
+    
+    El \\b inicial de cada patrón se sustituye por una única comprobación (?<!\\w) común:
+    equivale (todos empiezan por letra) y evita evaluar cada rama en mitad de una palabra.
+    """
+    def without_leading_boundary(pattern):
+        return pattern[len(r'\b'):] if pattern.startswith(r'\b') else pattern
+    
+    groups = (
+        f"(?P<{intent}>{'|'.join(without_leading_boundary(p) for p in ConversationEngine.INTENTS[intent])})"
+        for intent in ConversationEngine.INTENT_PRIORITY
+    )
+    return re.compile(r"(?<!\w)(?:" + "|".join(groups) + ")")
+
+
+_INTENT_SCANNER = _build_intent_scanner()
+_INTENT_PATTERNS = {
+    intent: re.compile("|".join(patterns)) for intent, patterns in ConversationEngine.INTENTS.items()
+}
+_INTENT_RANK = {intent: rank for rank, intent in enumerate(ConversationEngine.INTENT_PRIORITY)}
+_TOPIC_PRIORITY = {topic: index for index, topic in enumerate(TOPIC_KEYWORDS)}
+_DEFINITION_PRIORITY = {key: index for index, key in enumerate(ConversationEngine.INTERNAL_DEFINITIONS)}
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def match_keywords(text: str) -> KeywordHits:
+    """Temas, entidades de Office y definiciones de un texto en una sola pasada (memorizado)"""
+    found = {'topic': [], 'office': [], 'definition': []}
+    for match in _KEYWORD_MATCHER.find_all(text):
+        kind, value = match.label
+        if value not in found[kind]:
+            found[kind].append(value)
+    return KeywordHits(
+        topics=tuple(sorted(found['topic'], key=_TOPIC_PRIORITY.__getitem__)),
+        office_entities=tuple(found['office']),
+        definitions=tuple(sorted(found['definition'], key=_DEFINITION_PRIORITY.__getitem__))
+    )
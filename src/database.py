@@ -4,82 +4,397 @@ Módulo de base de datos para OfficeAI
 Usa SQLite para almacenamiento eficiente y persistente
 """
 import sqlite3
+import atexit
+import gzip
+import hashlib
 import json
+import threading
 from datetime import datetime
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Tuple
 from contextlib import contextmanager
-import unicodedata
-import re
+from functools import partial
 
-from config import DB_PATH, INITIAL_DATA
+from config import (
+    DB_PATH, DB_PRAGMAS, DB_STATEMENT_CACHE_SIZE, ANSWER_CACHE_SIZE, ANSWER_CACHE_DEPTH, INITIAL_DATA, Q_INITIAL_VALUE, USE_FTS_SEARCH, FTS_MIN_COVERAGE,
+    FTS_MIN_CANDIDATE_COVERAGE, RETRIEVAL_STOPWORDS,
+    CACHE_TTL_HOURS, WEB_CACHE_MAX_ENTRIES, HISTORY_RETENTION_DAYS, HISTORY_COMPACTION_BATCH,
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+    BAD_ANSWER_PHRASES, BAD_ANSWER_MIN_WORDS,
+    USE_SEMANTIC_SEARCH, SEMANTIC_INDEX_DIM, SEMANTIC_NGRAM, SEMANTIC_THRESHOLD, SEMANTIC_TOP_K,
+    USE_SPELL_CORRECTION, SPELLING_MAX_DISTANCE, SPELLING_PREFIX_LENGTH,
+    USE_BLOOM_FILTER, BLOOM_ERROR_RATE, BLOOM_MIN_CAPACITY
+)
+from bloom import BloomFilter
+from cache import LRUCache
+from semantic_index import SemanticIndex
+from spelling import SpellingCorrector
+from text_normalizer import normalize
+from utils import is_bad_answer
+from write_behind import WriteBehindQueue
+
+
+def answer_hash(answer: str) -> int:
+    """Hash de 64 bits del texto de una respuesta (con signo, para caber en un INTEGER de SQLite)"""
+    digest = hashlib.blake2b(answer.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
 
 
 class Database:
     """Maneja todas las operaciones de base de datos"""
     
-    def __init__(self, db_path: str = str(DB_PATH)):
+    def __init__(self, db_path: str = str(DB_PATH), pragmas: Optional[Dict] = None,
+                 write_behind: bool = WRITE_BEHIND_ENABLED):
         self.db_path = db_path
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._connections = []  # Conexiones abiertas por todos los hilos
+        self._connections_lock = threading.Lock()
+        self._answer_cache = LRUCache(ANSWER_CACHE_SIZE)  # pregunta normalizada -> respuestas rankeadas
+        self._close_callbacks = []  # Se llaman al principio de close(), con la DB aún operativa
+        
+        self.semantic_index = None
+        if USE_SEMANTIC_SEARCH:
+            self.semantic_index = SemanticIndex(self._sidecar_path('.semantic.npz'), SEMANTIC_INDEX_DIM, SEMANTIC_NGRAM)
+            self.semantic_index.load()
+        self.speller = SpellingCorrector(SPELLING_MAX_DISTANCE, SPELLING_PREFIX_LENGTH) if USE_SPELL_CORRECTION else None
+        self.bloom = None  # Se carga tras crear el esquema
+        self._bloom_rows = set()  # Hashes de (id, texto) de las preguntas cuyas palabras están en el filtro
+        self._bloom_version = -1  # Versión de la tabla questions con la que se sincronizó por última vez
+        self._bloom_lock = threading.RLock()
+        
         self._initialize_db()
+        if self.semantic_index is not None:
+            self._sync_semantic_index()
+        if self.speller is not None:
+            self._build_speller()
+        self.bloom = self._load_bloom() if USE_BLOOM_FILTER else None
+        
+        self._writer = None
+        if write_behind:
+            self._writer = WriteBehindQueue(
+                self._get_connection,
+                batch_size=WRITE_BEHIND_BATCH_SIZE,
+                flush_interval=WRITE_BEHIND_FLUSH_INTERVAL
+            )
+            atexit.register(self.close)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Abre una conexión nueva y le aplica el perfil de PRAGMAs"""
+        conn = sqlite3.connect(
+            self.db_path,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # close() puede cerrarla desde otro hilo
+        )
+        conn.row_factory = sqlite3.Row
+        conn.create_function('answer_hash', 1, answer_hash, deterministic=True)
+        conn.create_function('is_bad_answer', 1, lambda answer: int(is_bad_answer(answer)), deterministic=True)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+    
+    def _thread_connection(self) -> sqlite3.Connection:
+        """Devuelve la conexión persistente del hilo actual, creándola si no existe"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            self._local.after_commit = []
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
     
     @contextmanager
     def _get_connection(self):
-        """Context manager para conexiones seguras"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Context manager sobre la conexión del hilo; solo el nivel externo hace commit/rollback"""
+        conn = self._thread_connection()
+        depth = self._local.depth
+        self._local.depth = depth + 1
         try:
             yield conn
-            conn.commit()
+            if depth == 0:
+                conn.commit()
         except Exception as e:
-            conn.rollback()
+            if depth == 0:
+                conn.rollback()
+                self._local.after_commit.clear()
             raise e
         finally:
-            conn.close()
+            self._local.depth = depth
+        if depth == 0:
+            callbacks, self._local.after_commit = self._local.after_commit, []
+            for callback in callbacks:
+                callback()
+    
+    def _after_commit(self, callback):
+        """
+        Ejecuta callback() cuando se confirme la transacción en curso del hilo (o ya, si no hay
+        ninguna abierta); si esa transacción se deshace, se descarta sin ejecutarse
+        """
+        if getattr(self._local, 'depth', 0) > 0:
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+    
+    def _submit_write(self, operation, *args, on_commit=None):
+        """Ejecuta operation(cursor, *args) en la cola diferida o, si no hay, en el acto"""
+        if self._writer:
+            self._writer.submit(operation, *args, on_commit=on_commit)
+            return
+        with self._get_connection() as conn:
+            operation(conn.cursor(), *args)
+        if on_commit is not None:
+            on_commit()
+    
+    def flush(self):
+        """Espera a que se confirmen todas las escrituras diferidas pendientes"""
+        if self._writer:
+            self._writer.flush()
+    
+    def add_close_callback(self, callback):
+        """Registra callback() para que se ejecute al cerrar, antes de confirmar lo pendiente"""
+        self._close_callbacks.append(callback)
+    
+    def close(self):
+        """Confirma las escrituras pendientes y cierra todas las conexiones persistentes"""
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+        if self._writer:
+            self._writer.close()
+        if self.semantic_index is not None:
+            self.semantic_index.save()
+        if self.bloom is not None and self.bloom.dirty:
+            self._save_bloom()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"[ERROR] No se pudo cerrar una conexión: {e}")
+        self._local = threading.local()
+    
+    def _sidecar_path(self, suffix: str) -> Optional[Path]:
+        """Fichero auxiliar junto a la base de datos (None para bases en memoria)"""
+        if self.db_path == ':memory:':
+            return None
+        return Path(self.db_path).with_suffix(suffix)
+    
+    def _sync_semantic_index(self):
+        """Reconstruye el índice semántico si no corresponde a la tabla questions"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, normalized FROM questions ORDER BY id")
+            entries = [(row['id'], row['normalized']) for row in cursor.fetchall()]
+        # Los ids solos no bastan: una base recreada reutiliza los mismos ids para otras preguntas
+        if SemanticIndex.fingerprint(entries) == self.semantic_index.signature:
+            return
+        
+        print("[DB] Construyendo índice semántico de preguntas...")
+        self.semantic_index.rebuild(entries)
+        self.semantic_index.save()
+    
+    def _build_speller(self):
+        """Carga el vocabulario de las preguntas conocidas en el corrector ortográfico"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, normalized FROM questions")
+            self.speller.rebuild((row['id'], row['normalized']) for row in cursor.fetchall())
+    
+    def _questions_snapshot(self, cursor) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+        Versión de la tabla questions y sus filas (id, texto). La versión se lee
+        antes: si alguien escribe entre medias, la siguiente comprobación lo verá
+        """
+        version = self._read_counter(cursor, 'questions_version')
+        cursor.execute("SELECT id, normalized FROM questions")  # Una sola sentencia: una sola instantánea
+        return version, [(row['id'], row['normalized']) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _question_row_hash(question_id: int, normalized_q: str) -> int:
+        return answer_hash(f"{question_id}:{normalized_q}")
+    
+    @classmethod
+    def _rows_fingerprint(cls, rows: List[Tuple[int, str]]) -> Tuple[int, int]:
+        """Huella (número, suma de hashes de id y texto) de un conjunto de preguntas"""
+        return len(rows), sum(cls._question_row_hash(*row) & 4294967295 for row in rows)
+    
+    def _load_bloom(self) -> BloomFilter:
+        """Carga el filtro de Bloom persistido o lo reconstruye si no corresponde a la tabla questions"""
+        path = self._sidecar_path('.bloom')
+        loaded = BloomFilter.load(path) if path else None
+        if loaded is not None:
+            bloom, saved_fingerprint = loaded
+            with self._get_connection() as conn:
+                version, rows = self._questions_snapshot(conn.cursor())
+            if (saved_fingerprint == self._rows_fingerprint(rows) and bloom.error_rate == BLOOM_ERROR_RATE
+                    and not bloom.saturated):
+                self._set_bloom(bloom, version, rows)
+                return bloom
+        return self._build_bloom()
+    
+    def _set_bloom(self, bloom: BloomFilter, version: int, rows: List[Tuple[int, str]]):
+        """Instala un filtro que cubre exactamente las filas indicadas (las de la versión version)"""
+        self._bloom_rows = {self._question_row_hash(*row) for row in rows}
+        self._bloom_version = version
+        self.bloom = bloom
+    
+    def _build_bloom(self) -> BloomFilter:
+        """Construye el filtro de Bloom con las palabras de las preguntas conocidas"""
+        with self._bloom_lock:
+            with self._get_connection() as conn:
+                version, rows = self._questions_snapshot(conn.cursor())
+            tokens = set()
+            for _, normalized_q in rows:
+                tokens |= self._question_tokens(normalized_q)
+            bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * len(tokens)), BLOOM_ERROR_RATE)
+            bloom.add_many(tokens)
+            self._set_bloom(bloom, version, rows)
+            self._persist_bloom(rows)
+        return bloom
+    
+    def _cover_rows(self, rows: List[Tuple[int, str]]):
+        """Añade al filtro las palabras de las filas que aún no cubre (con _bloom_lock tomado)"""
+        for row in rows:
+            row_hash = self._question_row_hash(*row)
+            if row_hash not in self._bloom_rows:
+                self.bloom.add_many(self._question_tokens(row[1]))
+                self._bloom_rows.add(row_hash)
+    
+    def _sync_bloom(self) -> bool:
+        """
+        Añade al filtro las preguntas que no cubre (escritas por otro proceso u
+        otra instancia); devuelve True si hubo que reconstruirlo por saturación
+        """
+        with self._get_connection() as conn:
+            version, rows = self._questions_snapshot(conn.cursor())
+        with self._bloom_lock:
+            self._cover_rows(rows)
+            self._bloom_version = max(self._bloom_version, version)
+        if self.bloom.saturated:
+            self._build_bloom()
+            return True
+        return False
+    
+    def _bloom_is_current(self) -> bool:
+        """True si nadie ha tocado la tabla questions desde la última sincronización del filtro"""
+        with self._get_connection() as conn:
+            return self._read_counter(conn.cursor(), 'questions_version') == self._bloom_version
+    
+    def _save_bloom(self):
+        """
+        Persiste el filtro de Bloom. La huella guardada es la de una instantánea
+        de questions cuyas filas están todas en el filtro (se sincroniza antes),
+        nunca la de filas que no se llegaron a añadir
+        """
+        with self._get_connection() as conn:
+            _, rows = self._questions_snapshot(conn.cursor())
+        with self._bloom_lock:
+            self._cover_rows(rows)
+            self._persist_bloom(rows)
+    
+    def _persist_bloom(self, covered_rows: List[Tuple[int, str]]):
+        path = self._sidecar_path('.bloom')
+        if path is not None:
+            self.bloom.save(path, self._rows_fingerprint(covered_rows))
+    
+    def local_match_bound(self, question: str, content_only: bool = False) -> float:
+        """
+        Cota superior de la similitud Jaccard (o, con content_only, de la cobertura FTS) que puede alcanzar la pregunta
+        
+        Es la fracción de sus palabras (con content_only, de sus palabras con contenido) que el
+        filtro de Bloom no descarta: una palabra que el filtro no conoce no aparece en ninguna
+        pregunta, así que no puede ser compartida. 1.0 si no hay filtro o no hay palabras.
+        
+        Antes de usar el filtro se comprueba (con un contador que mantiene un trigger) si la
+        tabla questions cambió; si es así se añaden las preguntas que falten.
+        """
+        words_q = self._question_tokens(self.normalize_text(question))
+        if content_only:
+            words_q = self._content_terms(words_q)
+        if self.bloom is None or not words_q:
+            return 1.0
+        if not self._bloom_is_current():
+            # Otro proceso (o esta misma instancia) cambió las preguntas: sin sincronizar habría falsos negativos
+            self._sync_bloom()
+        known = sum(1 for word in words_q if word in self.bloom)
+        return known / len(words_q)
     
     def _initialize_db(self):
-        """Crea las tablas si no existen"""
+        """Crea las tablas si no existen y migra las bases con el esquema antiguo"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            migrated = self._migrate_to_integer_keys(cursor)
             
-            # Tabla de conocimiento
+            # Preguntas normalizadas: las demás tablas las referencian por id
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY,
+                    normalized TEXT NOT NULL UNIQUE
+                )
+            """)
+            
+            # Tabla de conocimiento (unicidad por pregunta + hash del contenido de la respuesta)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS knowledge (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question_normalized TEXT NOT NULL,
+                    question_id INTEGER NOT NULL REFERENCES questions(id),
                     question_original TEXT NOT NULL,
                     answer TEXT NOT NULL,
+                    answer_hash INTEGER NOT NULL,
+                    is_bad INTEGER NOT NULL DEFAULT 0,
                     topic TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(question_normalized, answer)
+                    UNIQUE(question_id, answer_hash)
                 )
             """)
             
-            # Índices para búsquedas rápidas
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_question_normalized 
-                ON knowledge(question_normalized)
-            """)
+            # Flag de calidad de la respuesta (columna añadida en bases antiguas)
+            cursor.execute("PRAGMA table_info(knowledge)")
+            if 'is_bad' not in {row['name'] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE knowledge ADD COLUMN is_bad INTEGER NOT NULL DEFAULT 0")
             
+            # Índices para búsquedas rápidas
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_topic 
                 ON knowledge(topic)
             """)
             
-            # Tabla de Q-values para aprendizaje
+            # Tabla de Q-values para aprendizaje (una fila por respuesta de knowledge)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS q_values (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question_normalized TEXT NOT NULL,
-                    answer TEXT NOT NULL,
+                    knowledge_id INTEGER PRIMARY KEY REFERENCES knowledge(id),
                     q_value REAL DEFAULT 0.0,
                     times_selected INTEGER DEFAULT 0,
                     times_correct INTEGER DEFAULT 0,
                     times_incorrect INTEGER DEFAULT 0,
-                    last_used TIMESTAMP,
-                    UNIQUE(question_normalized, answer)
+                    last_used TIMESTAMP
                 )
             """)
             
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS knowledge_q_values_delete AFTER DELETE ON knowledge BEGIN
+                    DELETE FROM q_values WHERE knowledge_id = old.id;
+                END
+            """)
+            
+            # Vista con el texto de la pregunta de cada respuesta (contenido del índice FTS)
+            cursor.execute("""
+                CREATE VIEW IF NOT EXISTS knowledge_documents AS
+                SELECT k.id, q.normalized AS question_normalized, k.answer
+                FROM knowledge k
+                JOIN questions q ON q.id = k.question_id
+            """)
+            
             # Tabla de historial
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS history (
@@ -92,6 +407,23 @@ class Database:
                 )
             """)
             
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_timestamp 
+                ON history(timestamp)
+            """)
+            
+            # Agregados diarios del historial ya compactado
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS history_rollup (
+                    day TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    correct INTEGER NOT NULL DEFAULT 0,
+                    incorrect INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, source)
+                ) WITHOUT ROWID
+            """)
+            
             # Tabla de caché de búsquedas web
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS web_cache (
@@ -108,71 +440,512 @@ class Database:
                 ON web_cache(query)
             """)
             
+            # Marca de último acierto para la expulsión LRU (columna añadida en bases antiguas)
+            cursor.execute("PRAGMA table_info(web_cache)")
+            if 'last_hit_at' not in {row['name'] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE web_cache ADD COLUMN last_hit_at TIMESTAMP")
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_web_cache_expires 
+                ON web_cache(expires_at)
+            """)
+            
+            # Índice invertido token -> pregunta para el matching fuzzy
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS question_tokens (
+                    token TEXT NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    n_tokens INTEGER NOT NULL,
+                    PRIMARY KEY (token, question_id)
+                ) WITHOUT ROWID
+            """)
+            
+            # Estado de las sesiones de conversación expulsadas de memoria (ver session.py)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_last_seen
+                ON sessions(last_seen)
+            """)
+            
+            # Metadatos clave/valor del esquema y de los trabajos de mantenimiento
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            
+            self.fts_enabled = USE_FTS_SEARCH and self._create_fulltext_index(cursor)
+            self._create_stats_counters(cursor)
+            self._refresh_answer_quality(cursor)
+            
             # Insertar datos iniciales si la DB está vacía
-            cursor.execute("SELECT COUNT(*) FROM knowledge")
-            if cursor.fetchone()[0] == 0:
+            if self._read_counter(cursor, 'knowledge') == 0:
                 self._load_initial_data()
+            else:
+                cursor.execute("SELECT 1 FROM question_tokens LIMIT 1")
+                if cursor.fetchone() is None:
+                    self._rebuild_question_tokens(cursor)
+        
+        if migrated:
+            # Recuperar el espacio de las columnas e índices de texto eliminados
+            self._thread_connection().execute("VACUUM")
+    
+    def _migrate_to_integer_keys(self, cursor) -> bool:
+        """
+        Migra en el sitio el esquema antiguo (knowledge y q_values unidos por texto) al esquema
+        con claves enteras: questions(id, normalized), knowledge.question_id + answer_hash
+        y q_values por knowledge_id. Devuelve True si hubo migración.
+        """
+        cursor.execute("PRAGMA table_info(knowledge)")
+        if 'question_normalized' not in {row['name'] for row in cursor.fetchall()}:
+            return False
+        
+        print("[DB] Migrando la base de datos al esquema con claves enteras...")
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        
+        # El índice FTS y el índice invertido se reconstruyen sobre el esquema nuevo
+        for trigger in ('knowledge_fts_insert', 'knowledge_fts_delete', 'knowledge_fts_update'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS knowledge_fts_vocab")
+        cursor.execute("DROP TABLE IF EXISTS knowledge_fts")
+        cursor.execute("DROP TABLE IF EXISTS question_tokens")
+        
+        cursor.execute("""
+            CREATE TABLE questions (
+                id INTEGER PRIMARY KEY,
+                normalized TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO questions (normalized)
+            SELECT question_normalized FROM knowledge GROUP BY question_normalized ORDER BY MIN(id)
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE knowledge_migrated (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question_id INTEGER NOT NULL REFERENCES questions(id),
+                question_original TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                answer_hash INTEGER NOT NULL,
+                is_bad INTEGER NOT NULL DEFAULT 0,
+                topic TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(question_id, answer_hash)
+            )
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO knowledge_migrated
+                (id, question_id, question_original, answer, answer_hash, topic, created_at, updated_at)
+            SELECT k.id, q.id, k.question_original, k.answer, answer_hash(k.answer), k.topic, k.created_at, k.updated_at
+            FROM knowledge k
+            JOIN questions q ON q.normalized = k.question_normalized
+            ORDER BY k.id
+        """)
+        
+        # Los Q-values sin respuesta en knowledge no participan en el ranking: se descartan
+        cursor.execute("""
+            CREATE TABLE q_values_migrated (
+                knowledge_id INTEGER PRIMARY KEY REFERENCES knowledge(id),
+                q_value REAL DEFAULT 0.0,
+                times_selected INTEGER DEFAULT 0,
+                times_correct INTEGER DEFAULT 0,
+                times_incorrect INTEGER DEFAULT 0,
+                last_used TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO q_values_migrated
+                (knowledge_id, q_value, times_selected, times_correct, times_incorrect, last_used)
+            SELECT k.id, v.q_value, v.times_selected, v.times_correct, v.times_incorrect, v.last_used
+            FROM q_values v
+            JOIN knowledge k ON k.question_normalized = v.question_normalized AND k.answer = v.answer
+        """)
+        
+        cursor.execute("DROP TABLE q_values")
+        cursor.execute("DROP TABLE knowledge")
+        cursor.execute("ALTER TABLE knowledge_migrated RENAME TO knowledge")
+        cursor.execute("ALTER TABLE q_values_migrated RENAME TO q_values")
+        
+        # Los triggers de estadísticas se eliminaron con la tabla: recalcular sus contadores
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'stats_counters'")
+        if cursor.fetchone() is not None:
+            cursor.execute("DELETE FROM stats_counters WHERE name IN ('knowledge', 'topic')")
+            cursor.execute("""
+                INSERT INTO stats_counters (name, key, value)
+                SELECT 'knowledge', '', COUNT(*) FROM knowledge
+                UNION ALL SELECT 'topic', topic, COUNT(*) FROM knowledge GROUP BY topic
+            """)
+        return True
+    
+    def _create_fulltext_index(self, cursor) -> bool:
+        """Crea la tabla FTS5 espejo de knowledge y sus triggers; False si FTS5 no está disponible"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'knowledge_fts'")
+        exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+                    question_normalized, answer,
+                    content='knowledge_documents', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"[DB] FTS5 no disponible, búsqueda full-text desactivada: {e}")
+            return False
+        
+        # Vocabulario que usaban versiones anteriores para ponderar la cobertura por IDF
+        cursor.execute("DROP TABLE IF EXISTS knowledge_fts_vocab")
+        
+        # Triggers que mantienen el índice sincronizado con knowledge
+        question_text = "(SELECT normalized FROM questions WHERE id = {row}.question_id)"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS knowledge_fts_insert AFTER INSERT ON knowledge BEGIN
+                INSERT INTO knowledge_fts (rowid, question_normalized, answer)
+                VALUES (new.id, {question_text.format(row='new')}, new.answer);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS knowledge_fts_delete AFTER DELETE ON knowledge BEGIN
+                INSERT INTO knowledge_fts (knowledge_fts, rowid, question_normalized, answer)
+                VALUES ('delete', old.id, {question_text.format(row='old')}, old.answer);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS knowledge_fts_update AFTER UPDATE OF question_id, answer ON knowledge BEGIN
+                INSERT INTO knowledge_fts (knowledge_fts, rowid, question_normalized, answer)
+                VALUES ('delete', old.id, {question_text.format(row='old')}, old.answer);
+                INSERT INTO knowledge_fts (rowid, question_normalized, answer)
+                VALUES (new.id, {question_text.format(row='new')}, new.answer);
+            END
+        """)
+        
+        if not exists:
+            cursor.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+        return True
+    
+    def _create_stats_counters(self, cursor):
+        """Crea los contadores de estadísticas mantenidos por triggers (y los inicializa una vez)"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'stats_counters'")
+        exists = cursor.fetchone() is not None
+        
+        # name: métrica; key: desglose (tema, fuente, día) o '' para el total
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL DEFAULT '',
+                value INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, key)
+            ) WITHOUT ROWID
+        """)
+        
+        increment = """
+            INSERT INTO stats_counters (name, key, value) VALUES ({name}, {key}, {delta})
+            ON CONFLICT(name, key) DO UPDATE SET value = value + excluded.value;
+        """
+        triggers = {
+            'knowledge_stats_insert': ("AFTER INSERT ON knowledge", [
+                ("'knowledge'", "''", 1), ("'topic'", "new.topic", 1)]),
+            'knowledge_stats_delete': ("AFTER DELETE ON knowledge", [
+                ("'knowledge'", "''", -1), ("'topic'", "old.topic", -1)]),
+            'knowledge_stats_topic': ("AFTER UPDATE OF topic ON knowledge WHEN old.topic <> new.topic", [
+                ("'topic'", "old.topic", -1), ("'topic'", "new.topic", 1)]),
+            'history_stats_insert': ("AFTER INSERT ON history", [
+                ("'interactions'", "new.source", 1), ("'interactions_day'", "date(new.timestamp)", 1)]),
+            'web_cache_stats_insert': ("AFTER INSERT ON web_cache", [("'web_cache'", "''", 1)]),
+            'web_cache_stats_delete': ("AFTER DELETE ON web_cache", [("'web_cache'", "''", -1)]),
+            # Versión de questions (solo crece): permite detectar escrituras de otros procesos
+            'questions_version_insert': ("AFTER INSERT ON questions", [("'questions_version'", "''", 1)]),
+            'questions_version_delete': ("AFTER DELETE ON questions", [("'questions_version'", "''", 1)]),
+        }
+        for trigger_name, (event, updates) in triggers.items():
+            body = "".join(increment.format(name=n, key=k, delta=d) for n, k, d in updates)
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {event} BEGIN {body} END")
+        
+        if not exists:
+            # Único recorrido completo: a partir de aquí los triggers mantienen los totales
+            cursor.execute("""
+                INSERT INTO stats_counters (name, key, value)
+                SELECT 'knowledge', '', COUNT(*) FROM knowledge
+                UNION ALL SELECT 'topic', topic, COUNT(*) FROM knowledge GROUP BY topic
+                UNION ALL SELECT 'interactions', source, COUNT(*) FROM history GROUP BY source
+                UNION ALL SELECT 'interactions_day', date(timestamp), COUNT(*) FROM history GROUP BY date(timestamp)
+                UNION ALL SELECT 'web_cache', '', COUNT(*) FROM web_cache
+            """)
+    
+    @staticmethod
+    def _read_counter(cursor, name: str, key: str = '') -> int:
+        cursor.execute("SELECT value FROM stats_counters WHERE name = ? AND key = ?", (name, key))
+        row = cursor.fetchone()
+        return row['value'] if row else 0
+    
+    @staticmethod
+    def _answer_quality_rules() -> str:
+        """Huella de las reglas de calidad: si cambian, hay que recalcular los flags guardados"""
+        rules = json.dumps([BAD_ANSWER_MIN_WORDS, sorted(BAD_ANSWER_PHRASES)], ensure_ascii=False)
+        return hashlib.blake2b(rules.encode('utf-8'), digest_size=8).hexdigest()
+    
+    def _refresh_answer_quality(self, cursor, force: bool = False) -> int:
+        """Recalcula knowledge.is_bad si las reglas cambiaron desde el último cálculo"""
+        rules = self._answer_quality_rules()
+        cursor.execute("SELECT value FROM meta WHERE key = 'answer_quality_rules'")
+        row = cursor.fetchone()
+        if not force and row is not None and row['value'] == rules:
+            return 0
+        
+        cursor.execute("""
+            UPDATE knowledge SET is_bad = is_bad_answer(answer)
+            WHERE is_bad <> is_bad_answer(answer)
+        """)
+        updated = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO meta (key, value) VALUES ('answer_quality_rules', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (rules,))
+        if updated:
+            print(f"[DB] Flags de calidad recalculados: {updated} respuestas")
+        return updated
+    
+    def refresh_answer_quality(self) -> int:
+        """Recalcula los flags de calidad de todas las respuestas; devuelve cuántas cambiaron"""
+        with self._get_connection() as conn:
+            updated = self._refresh_answer_quality(conn.cursor(), force=True)
+        self._answer_cache.clear()
+        return updated
     
     def _load_initial_data(self):
         """Carga los datos iniciales en la base de datos"""
         print("[DB] Cargando datos iniciales...")
-        for topic, questions in INITIAL_DATA.items():
-            for question, answers in questions.items():
-                for answer in answers:
-                    self.add_knowledge(question, answer, topic)
-        print(f"[DB] Datos iniciales cargados: {self.get_knowledge_count()} entradas")
+        result = self.add_knowledge_many(
+            (question, answer, topic)
+            for topic, questions in INITIAL_DATA.items()
+            for question, answers in questions.items()
+            for answer in answers
+        )
+        print(f"[DB] Datos iniciales cargados: {result['inserted']} entradas")
     
     @staticmethod
     def normalize_text(text: str) -> str:
         """Normaliza texto para comparaciones"""
-        text = text.lower()
-        text = unicodedata.normalize("NFD", text)
-        text = "".join(c for c in text if unicodedata.category(c) != "Mn")
-        text = re.sub(r"[^a-z0-9\s]", "", text)
-        return re.sub(r"\s+", " ", text).strip()
+        return normalize(text).normalized
+    
+    @staticmethod
+    def _question_tokens(normalized_q: str) -> set:
+        """Conjunto de palabras usado por el índice invertido y la similitud Jaccard"""
+        return set(normalized_q.split())
+    
+    @staticmethod
+    def _content_terms(words: set) -> set:
+        """Palabras con contenido (sin las de RETRIEVAL_STOPWORDS) de un conjunto de palabras"""
+        return {word for word in words if word not in RETRIEVAL_STOPWORDS}
+    
+    @staticmethod
+    def _ensure_questions(cursor, *normalized_questions: str):
+        """Registra las preguntas normalizadas que aún no tengan id"""
+        cursor.executemany(
+            "INSERT OR IGNORE INTO questions (normalized) VALUES (?)",
+            [(normalized_q,) for normalized_q in normalized_questions]
+        )
+    
+    def _index_question(self, cursor, *normalized_questions: str):
+        """Añade las entradas de una o varias preguntas al índice invertido"""
+        postings = []
+        for normalized_q in normalized_questions:
+            tokens = self._question_tokens(normalized_q)
+            postings.extend((token, len(tokens), normalized_q) for token in tokens)
+        cursor.executemany("""
+            INSERT OR IGNORE INTO question_tokens (token, question_id, n_tokens)
+            SELECT ?, id, ? FROM questions WHERE normalized = ?
+        """, postings)
+    
+    def _question_ids(self, cursor, *normalized_questions: str) -> List[Tuple[int, str]]:
+        """Pares (id, pregunta normalizada) para alimentar los índices en memoria"""
+        if self.semantic_index is None and self.speller is None and self.bloom is None:
+            return []
+        pairs = []
+        for normalized_q in normalized_questions:
+            cursor.execute("SELECT id FROM questions WHERE normalized = ?", (normalized_q,))
+            row = cursor.fetchone()
+            if row is not None:
+                pairs.append((row['id'], normalized_q))
+        return pairs
+    
+    def _unindex_question(self, cursor, question_id: int, normalized_q: str):
+        """Elimina una pregunta del índice invertido"""
+        cursor.executemany("""
+            DELETE FROM question_tokens WHERE token = ? AND question_id = ?
+        """, [(token, question_id) for token in self._question_tokens(normalized_q)])
+    
+    def _rebuild_question_tokens(self, cursor):
+        """Reconstruye el índice invertido a partir de la tabla questions"""
+        print("[DB] Construyendo índice de tokens de preguntas...")
+        cursor.execute("DELETE FROM question_tokens")
+        cursor.execute("SELECT normalized FROM questions")
+        self._index_question(cursor, *(row['normalized'] for row in cursor.fetchall()))
+    
+    def _add_to_memory_indexes(self, indexed: List[Tuple[int, str]]):
+        """
+        Añade preguntas recién confirmadas al índice semántico, al corrector ortográfico
+        y al filtro de Bloom (que no admite borrados: las palabras retiradas solo causan falsos positivos)
+        """
+        if self.semantic_index is not None:
+            self.semantic_index.add_many(indexed)
+        if self.speller is not None:
+            self.speller.add_many(indexed)
+        if self.bloom is not None:
+            with self._bloom_lock:
+                for question_id, normalized_q in indexed:
+                    self.bloom.add_many(self._question_tokens(normalized_q))
+                    self._bloom_rows.add(self._question_row_hash(question_id, normalized_q))
+            if self.bloom.saturated:
+                self._build_bloom()
+    
+    def _remove_from_memory_indexes(self, question_id: int):
+        """Retira una pregunta ya borrada del índice semántico y del corrector ortográfico"""
+        if self.semantic_index is not None:
+            self.semantic_index.remove(question_id)
+        if self.speller is not None:
+            self.speller.remove(question_id)
+    
+    def correct_spelling(self, question: str) -> str:
+        """Pregunta normalizada con las erratas corregidas según el vocabulario de la base de conocimiento"""
+        if self.speller is None:
+            return self.normalize_text(question)
+        return self.speller.correct(question)
     
     def add_knowledge(self, question: str, answer: str, topic: str) -> bool:
         """Añade nuevo conocimiento a la base de datos"""
+        normalized_q = self.normalize_text(question)
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
+                self._ensure_questions(cursor, normalized_q)
                 cursor.execute("""
                     INSERT OR IGNORE INTO knowledge 
-                    (question_normalized, question_original, answer, topic)
-                    VALUES (?, ?, ?, ?)
-                """, (self.normalize_text(question), question, answer, topic))
-                return cursor.lastrowid if cursor.rowcount > 0 else None
+                    (question_id, question_original, answer, answer_hash, is_bad, topic)
+                    VALUES ((SELECT id FROM questions WHERE normalized = ?), ?, ?, ?, ?, ?)
+                """, (normalized_q, question, answer, answer_hash(answer), is_bad_answer(answer), topic))
+                if cursor.rowcount <= 0:
+                    return None
+                knowledge_id = cursor.lastrowid
+                self._index_question(cursor, normalized_q)
+                indexed = self._question_ids(cursor, normalized_q)
+            self._answer_cache.invalidate(normalized_q)
+            self._after_commit(lambda: self._add_to_memory_indexes(indexed))
+            return knowledge_id
         except Exception as e:
             print(f"[ERROR] No se pudo añadir conocimiento: {e}")
             return None
 
+    def add_knowledge_many(self, entries: Iterable[Tuple[str, str, str]],
+                           initial_q: float = Q_INITIAL_VALUE) -> Dict[str, int]:
+        """
+        Añade conocimiento en bloque dentro de una única transacción
+        
+        Args:
+            entries: Tuplas (pregunta, respuesta, tema)
+            initial_q: Q-value con el que se siembran las respuestas nuevas
+        
+        Returns:
+            Dict con el número de entradas insertadas y duplicadas
+        """
+        rows = [
+            (self.normalize_text(question), question, answer, answer_hash(answer), is_bad_answer(answer), topic)
+            for question, answer, topic in entries
+        ]
+        if not rows:
+            return {'inserted': 0, 'duplicates': 0}
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            new_questions = {row[0] for row in rows}
+            self._ensure_questions(cursor, *new_questions)
+            
+            cursor.executemany("""
+                INSERT OR IGNORE INTO knowledge 
+                (question_id, question_original, answer, answer_hash, is_bad, topic)
+                VALUES ((SELECT id FROM questions WHERE normalized = ?), ?, ?, ?, ?, ?)
+            """, rows)
+            inserted = cursor.rowcount
+            
+            cursor.executemany("""
+                INSERT OR IGNORE INTO q_values (knowledge_id, q_value)
+                SELECT k.id, ? FROM knowledge k
+                JOIN questions q ON q.id = k.question_id
+                WHERE q.normalized = ? AND k.answer_hash = ?
+            """, [(initial_q, normalized_q, hashed) for normalized_q, _, _, hashed, _, _ in rows])
+            
+            self._index_question(cursor, *new_questions)
+            indexed = self._question_ids(cursor, *new_questions)
+        
+        self._answer_cache.invalidate(*new_questions)
+        # Dentro de otra transacción (import_ndjson) los índices esperan a su commit
+        self._after_commit(lambda: self._add_to_memory_indexes(indexed))
+        return {'inserted': inserted, 'duplicates': len(rows) - inserted}
+
     def delete_knowledge(self, knowledge_id: int) -> bool:
         """Elimina una entrada de conocimiento por ID"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT q.id, q.normalized FROM knowledge k
+                    JOIN questions q ON q.id = k.question_id
+                    WHERE k.id = ?
+                """, (knowledge_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return False
+                
+                question_id, normalized_q = row['id'], row['normalized']
                 cursor.execute("DELETE FROM knowledge WHERE id = ?", (knowledge_id,))
-                return cursor.rowcount > 0
+                
+                # Retirar la pregunta (y su entrada en los índices) si ya no le quedan respuestas
+                cursor.execute("SELECT 1 FROM knowledge WHERE question_id = ? LIMIT 1", (question_id,))
+                question_removed = cursor.fetchone() is None
+                if question_removed:
+                    self._unindex_question(cursor, question_id, normalized_q)
+                    cursor.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+            self._answer_cache.invalidate(normalized_q)
+            if question_removed:
+                self._after_commit(lambda: self._remove_from_memory_indexes(question_id))
+            return True
         except Exception as e:
             print(f"[ERROR] No se pudo eliminar conocimiento {knowledge_id}: {e}")
             return False
     
     def search_answers(self, question: str, limit: int = 5) -> List[Dict]:
-        """Busca respuestas para una pregunta"""
+        """Busca respuestas válidas para una pregunta (las primeras ANSWER_CACHE_DEPTH salen de la caché LRU)"""
         normalized_q = self.normalize_text(question)
+        cacheable = limit <= ANSWER_CACHE_DEPTH
+        if cacheable:
+            cached = self._answer_cache.get(normalized_q)
+            if cached is not None:
+                return [dict(result) for result in cached[:limit]]
+            generation = self._answer_cache.generation
         
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
-                SELECT k.answer, k.topic, q.q_value, q.times_selected
-                FROM knowledge k
-                LEFT JOIN q_values q ON k.question_normalized = q.question_normalized 
-                    AND k.answer = q.answer
-                WHERE k.question_normalized = ?
-                ORDER BY COALESCE(q.q_value, 0) DESC, q.times_selected DESC
+                SELECT k.answer, k.topic, v.q_value, v.times_selected
+                FROM questions q
+                JOIN knowledge k ON k.question_id = q.id
+                LEFT JOIN q_values v ON v.knowledge_id = k.id
+                WHERE q.normalized = ? AND k.is_bad = 0
+                ORDER BY COALESCE(v.q_value, 0) DESC, v.times_selected DESC
                 LIMIT ?
-            """, (normalized_q, limit))
+            """, (normalized_q, max(limit, ANSWER_CACHE_DEPTH)))
             
             results = []
             for row in cursor.fetchall():
@@ -182,93 +955,288 @@ class Database:
                     'q_value': row['q_value'] or 0.0,
                     'times_selected': row['times_selected'] or 0
                 })
-            
-            return results
+        
+        if cacheable:
+            # Las copias protegen la entrada cacheada de modificaciones del llamador
+            self._answer_cache.put(normalized_q, tuple(dict(result) for result in results), generation)
+        return results[:limit]
     
     def get_similar_questions(self, question: str, similarity_threshold: float = 0.7) -> List[str]:
-        """Encuentra preguntas similares usando matching fuzzy"""
+        """Encuentra preguntas similares (Jaccard) entre las que comparten algún token"""
         normalized_q = self.normalize_text(question)
+        words_q = self._question_tokens(normalized_q)
         
+        if not words_q:
+            return []
+        
+        placeholders = ", ".join("?" for _ in words_q)
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT question_normalized FROM knowledge")
+            # similitud = |intersección| / |unión| = compartidos / (|q| + |almacenada| - compartidos)
+            cursor.execute(f"""
+                SELECT q.normalized,
+                       COUNT(*) * 1.0 / (? + t.n_tokens - COUNT(*)) AS similarity
+                FROM question_tokens t
+                JOIN questions q ON q.id = t.question_id
+                WHERE t.token IN ({placeholders})
+                GROUP BY t.question_id
+                HAVING similarity >= ?
+                ORDER BY similarity DESC, q.normalized
+                LIMIT 5
+            """, (len(words_q), *words_q, similarity_threshold))
             
-            similar = []
+            return [row['normalized'] for row in cursor.fetchall()]
+    
+    def retrieve_answers(self, question: str, similarity_threshold: float,
+                         limit: int = 5, per_question_limit: int = 3,
+                         max_similar: int = 5) -> List[Dict]:
+        """
+        Recupera en una sola consulta las respuestas válidas de la pregunta exacta y de sus similares
+        
+        Si la pregunta exacta tiene respuestas se devuelven esas (hasta limit); si no, las de
+        las max_similar preguntas más parecidas (Jaccard), per_question_limit por pregunta,
+        sin duplicados y hasta limit. La parte exacta sale de la caché LRU cuando está cacheada.
+        """
+        normalized_q = self.normalize_text(question)
+        words_q = self._question_tokens(normalized_q)
+        
+        cacheable = limit <= ANSWER_CACHE_DEPTH
+        if cacheable:
+            cached = self._answer_cache.get(normalized_q)
+            if cached is not None and (cached or not words_q):
+                return [dict(result) for result in cached[:limit]]
+            generation = self._answer_cache.generation
+        if not words_q:
+            return self.search_answers(question, limit)
+        
+        exact_depth = max(limit, ANSWER_CACHE_DEPTH)
+        placeholders = ", ".join("?" for _ in words_q)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH similar AS (
+                    SELECT t.question_id,
+                           COUNT(*) * 1.0 / (? + t.n_tokens - COUNT(*)) AS similarity
+                    FROM question_tokens t
+                    JOIN questions q ON q.id = t.question_id
+                    WHERE t.token IN ({placeholders})
+                    GROUP BY t.question_id
+                    HAVING similarity >= ?
+                    ORDER BY similarity DESC, q.normalized
+                    LIMIT ?
+                ),
+                candidates AS (
+                    SELECT question_id, MAX(similarity) AS similarity,
+                           MAX(is_exact) AS is_exact, MAX(is_similar) AS is_similar
+                    FROM (
+                        SELECT question_id, similarity, 0 AS is_exact, 1 AS is_similar FROM similar
+                        UNION ALL
+                        SELECT id, 1.0, 1, 0 FROM questions WHERE normalized = ?
+                    )
+                    GROUP BY question_id
+                ),
+                ranked AS (
+                    SELECT c.question_id, c.similarity, c.is_exact, c.is_similar,
+                           k.answer, k.topic, v.q_value, v.times_selected,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY c.question_id
+                               ORDER BY COALESCE(v.q_value, 0) DESC, v.times_selected DESC
+                           ) AS position
+                    FROM candidates c
+                    JOIN knowledge k ON k.question_id = c.question_id AND k.is_bad = 0
+                    LEFT JOIN q_values v ON v.knowledge_id = k.id
+                )
+                SELECT r.is_exact, r.is_similar, r.position, r.answer, r.topic, r.q_value, r.times_selected
+                FROM ranked r
+                JOIN questions q ON q.id = r.question_id
+                WHERE r.position <= CASE WHEN r.is_exact THEN ? ELSE ? END
+                ORDER BY r.similarity DESC, q.normalized, r.position
+            """, (len(words_q), *words_q, similarity_threshold, max_similar, normalized_q,
+                  exact_depth, per_question_limit))
+            rows = cursor.fetchall()
+        
+        def to_result(row):
+            return {
+                'answer': row['answer'],
+                'topic': row['topic'],
+                'q_value': row['q_value'] or 0.0,
+                'times_selected': row['times_selected'] or 0
+            }
+        
+        exact = [to_result(row) for row in rows if row['is_exact']]
+        if cacheable:
+            self._answer_cache.put(normalized_q, tuple(dict(result) for result in exact), generation)
+        if exact:
+            return exact[:limit]
+        
+        results = []
+        seen = set()
+        for row in rows:
+            if not row['is_similar'] or row['position'] > per_question_limit:
+                continue
+            if row['answer'] in seen:
+                continue
+            seen.add(row['answer'])
+            results.append(to_result(row))
+        return results[:limit]
+    
+    def search_semantic(self, question: str, limit: int = 5, threshold: float = SEMANTIC_THRESHOLD,
+                        per_question_limit: int = 3) -> List[Dict]:
+        """
+        Busca respuestas válidas de las preguntas más parecidas según el índice semántico
+        
+        El coseno de n-gramas no distingue "insertar una tabla" de "insertar un video": además
+        la candidata debe contener todas las palabras con contenido de la pregunta (con las
+        erratas corregidas según el vocabulario de la base)
+        """
+        if self.semantic_index is None:
+            return []
+        hits = self.semantic_index.search(self.normalize_text(question), SEMANTIC_TOP_K, threshold)
+        if not hits:
+            return []
+        content_q = self._content_terms(self._question_tokens(self.correct_spelling(question)))
+        
+        values = ", ".join("(?, ?)" for _ in hits)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH hits(question_id, score) AS (VALUES {values})
+                SELECT normalized, answer, topic, q_value, times_selected FROM (
+                    SELECT h.score, h.question_id, q.normalized, k.answer, k.topic, v.q_value, v.times_selected,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY h.question_id
+                               ORDER BY COALESCE(v.q_value, 0) DESC, v.times_selected DESC
+                           ) AS position
+                    FROM hits h
+                    JOIN questions q ON q.id = h.question_id
+                    JOIN knowledge k ON k.question_id = h.question_id AND k.is_bad = 0
+                    LEFT JOIN q_values v ON v.knowledge_id = k.id
+                )
+                WHERE position <= ?
+                ORDER BY score DESC, question_id, position
+            """, (*(value for hit in hits for value in hit), per_question_limit))
+            
+            results = []
+            seen = set()
             for row in cursor.fetchall():
-                stored_q = row['question_normalized']
-                words_q = set(normalized_q.split())
-                words_stored = set(stored_q.split())
-                
-                if not words_q or not words_stored:
+                content_c = self._content_terms(self._question_tokens(row['normalized']))
+                # Sin palabras con contenido en la pregunta, la candidata tampoco puede tenerlas
+                if not content_q <= content_c or (not content_q and content_c):
                     continue
-                
-                intersection = len(words_q & words_stored)
-                union = len(words_q | words_stored)
-                similarity = intersection / union if union > 0 else 0
-                
-                if similarity >= similarity_threshold:
-                    similar.append((stored_q, similarity))
+                if row['answer'] in seen:
+                    continue
+                seen.add(row['answer'])
+                results.append({
+                    'answer': row['answer'],
+                    'topic': row['topic'],
+                    'q_value': row['q_value'] or 0.0,
+                    'times_selected': row['times_selected'] or 0
+                })
             
-            similar.sort(key=lambda x: x[1], reverse=True)
-            return [q for q, _ in similar[:5]]
+            return results[:limit]
     
-    def update_q_value(self, question: str, answer: str, reward: float):
-        """Actualiza el Q-value para una respuesta"""
-        normalized_q = self.normalize_text(question)
+    def search_fulltext(self, question: str, limit: int = 5, min_coverage: float = FTS_MIN_COVERAGE,
+                        min_candidate_coverage: float = FTS_MIN_CANDIDATE_COVERAGE) -> List[Dict]:
+        """
+        Busca respuestas válidas por BM25 sobre las preguntas conocidas (nivel de respaldo)
+        
+        Solo cuentan las palabras con contenido, sin ponderar: la candidata debe tener al menos
+        min_coverage de las de la pregunta y la pregunta min_candidate_coverage de las de la
+        candidata, para que una sola palabra rara compartida no baste
+        """
+        content_q = self._content_terms(self._question_tokens(self.normalize_text(question)))
+        
+        if not self.fts_enabled or not content_q:
+            return []
+        
+        match_query = "question_normalized : (" + " OR ".join(f'"{w}"' for w in sorted(content_q)) + ")"
         
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            
             cursor.execute("""
-                SELECT q_value FROM q_values 
-                WHERE question_normalized = ? AND answer = ?
-            """, (normalized_q, answer))
+                SELECT q.normalized, k.answer, k.topic, v.q_value, v.times_selected
+                FROM knowledge_fts f
+                JOIN knowledge k ON k.id = f.rowid
+                JOIN questions q ON q.id = k.question_id
+                LEFT JOIN q_values v ON v.knowledge_id = k.id
+                WHERE knowledge_fts MATCH ? AND k.is_bad = 0
+                ORDER BY f.rank, COALESCE(v.q_value, 0) DESC
+                LIMIT ?
+            """, (match_query, limit * 4))
             
-            row = cursor.fetchone()
-            current_q = row['q_value'] if row else 0.0
-            new_q = current_q + reward
+            results = []
+            seen = set()
+            for row in cursor.fetchall():
+                content_c = self._content_terms(self._question_tokens(row['normalized']))
+                shared = len(content_q & content_c)
+                if (shared < min_coverage * len(content_q) or shared < min_candidate_coverage * len(content_c)
+                        or row['answer'] in seen):
+                    continue
+                seen.add(row['answer'])
+                results.append({
+                    'answer': row['answer'],
+                    'topic': row['topic'],
+                    'q_value': row['q_value'] or 0.0,
+                    'times_selected': row['times_selected'] or 0
+                })
             
-            cursor.execute("""
-                INSERT INTO q_values (question_normalized, answer, q_value, last_used)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(question_normalized, answer) DO UPDATE SET
-                    q_value = ?,
-                    last_used = CURRENT_TIMESTAMP
-            """, (normalized_q, answer, new_q, new_q))
+            return results[:limit]
+    
+    # Resuelve (pregunta normalizada, hash, texto) al id de knowledge; el texto descarta colisiones del hash
+    _KNOWLEDGE_ID_BY_CONTENT = """
+        SELECT k.id FROM knowledge k
+        JOIN questions q ON q.id = k.question_id
+        WHERE q.normalized = ? AND k.answer_hash = ? AND k.answer = ?
+    """
+    
+    def update_q_value(self, question: str, answer: str, reward: float):
+        """Actualiza el Q-value para una respuesta"""
+        normalized_q = self.normalize_text(question)
+        self._submit_write(self._write_q_reward, normalized_q, answer, reward,
+                           on_commit=partial(self._answer_cache.invalidate, normalized_q))
+    
+    @classmethod
+    def _write_q_reward(cls, cursor, normalized_q: str, answer: str, reward: float):
+        # Las respuestas que no están en knowledge no tienen fila de ranking: la recompensa se ignora
+        cursor.execute(f"""
+            INSERT INTO q_values (knowledge_id, q_value, last_used)
+            SELECT id, ?, CURRENT_TIMESTAMP FROM ({cls._KNOWLEDGE_ID_BY_CONTENT})
+            WHERE true
+            ON CONFLICT(knowledge_id) DO UPDATE SET
+                q_value = q_value + excluded.q_value,
+                last_used = CURRENT_TIMESTAMP
+        """, (reward, normalized_q, answer_hash(answer), answer))
     
     def record_selection(self, question: str, answer: str, was_correct: bool):
         """Registra una selección de respuesta"""
         normalized_q = self.normalize_text(question)
-        
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            if was_correct:
-                cursor.execute("""
-                    UPDATE q_values 
-                    SET times_selected = times_selected + 1,
-                        times_correct = times_correct + 1
-                    WHERE question_normalized = ? AND answer = ?
-                """, (normalized_q, answer))
-            else:
-                cursor.execute("""
-                    UPDATE q_values 
-                    SET times_selected = times_selected + 1,
-                        times_incorrect = times_incorrect + 1
-                    WHERE question_normalized = ? AND answer = ?
-                """, (normalized_q, answer))
+        self._submit_write(self._write_selection, normalized_q, answer, was_correct,
+                           on_commit=partial(self._answer_cache.invalidate, normalized_q))
+    
+    @classmethod
+    def _write_selection(cls, cursor, normalized_q: str, answer: str, was_correct: bool):
+        cursor.execute(f"""
+            UPDATE q_values 
+            SET times_selected = times_selected + 1,
+                times_correct = times_correct + ?,
+                times_incorrect = times_incorrect + ?
+            WHERE knowledge_id IN ({cls._KNOWLEDGE_ID_BY_CONTENT})
+        """, (int(was_correct), int(not was_correct), normalized_q, answer_hash(answer), answer))
     
     def add_to_history(self, question: str, answer: str, source: str, was_correct: Optional[bool] = None):
         """Añade entrada al historial"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO history (question, answer, source, was_correct)
-                VALUES (?, ?, ?, ?)
-            """, (question, answer, source, was_correct))
+        self._submit_write(self._write_history, question, answer, source, was_correct)
+    
+    @staticmethod
+    def _write_history(cursor, question: str, answer: str, source: str, was_correct: Optional[bool]):
+        cursor.execute("""
+            INSERT INTO history (question, answer, source, was_correct)
+            VALUES (?, ?, ?, ?)
+        """, (question, answer, source, was_correct))
     
     def get_history(self, limit: int = 20) -> List[Dict]:
         """Obtiene el historial reciente"""
+        self.flush()
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -280,17 +1248,78 @@ class Database:
             
             return [dict(row) for row in cursor.fetchall()]
     
-    def cache_web_results(self, query: str, results: List[Dict], ttl_hours: int = 24):
-        """Cachea resultados de búsqueda web"""
+    def compact_history(self, retention_days: int = HISTORY_RETENTION_DAYS,
+                        batch_size: int = HISTORY_COMPACTION_BATCH) -> int:
+        """
+        Mueve el historial más antiguo que retention_days a history_rollup y borra las filas
+        originales por lotes (una transacción por lote)
+        
+        Returns:
+            Número de filas compactadas
+        """
+        self.flush()
+        cutoff_modifier = f"-{int(retention_days)} days"
+        oldest_batch = """
+            SELECT id, timestamp, source, was_correct FROM history
+            WHERE timestamp < datetime('now', ?)
+            ORDER BY timestamp, id
+            LIMIT ?
+        """
+        compacted = 0
+        
+        while True:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    INSERT INTO history_rollup (day, source, total, correct, incorrect)
+                    SELECT date(timestamp), source, COUNT(*),
+                           SUM(was_correct IS NOT NULL AND was_correct), SUM(was_correct IS NOT NULL AND NOT was_correct)
+                    FROM ({oldest_batch})
+                    GROUP BY date(timestamp), source
+                    ON CONFLICT(day, source) DO UPDATE SET
+                        total = total + excluded.total,
+                        correct = correct + excluded.correct,
+                        incorrect = incorrect + excluded.incorrect
+                """, (cutoff_modifier, batch_size))
+                cursor.execute(f"""
+                    DELETE FROM history WHERE id IN (SELECT id FROM ({oldest_batch}))
+                """, (cutoff_modifier, batch_size))
+                deleted = cursor.rowcount
+            
+            compacted += deleted
+            if deleted < batch_size:
+                return compacted
+    
+    def get_history_rollup(self, limit: int = 30) -> List[Dict]:
+        """Obtiene los agregados diarios del historial compactado (más recientes primero)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT day, source, total, correct, incorrect FROM history_rollup
+                ORDER BY day DESC, source
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def cache_web_results(self, query: str, results, ttl_hours: int = CACHE_TTL_HOURS,
+                          max_entries: int = WEB_CACHE_MAX_ENTRIES):
+        """Cachea resultados de búsqueda web y programa la limpieza de la caché en segundo plano"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             expires_at = datetime.now().timestamp() + (ttl_hours * 3600)
             cursor.execute("""
-                INSERT OR REPLACE INTO web_cache (query, results, expires_at)
+                INSERT INTO web_cache (query, results, expires_at)
                 VALUES (?, ?, datetime(?, 'unixepoch'))
-            """, (query, json.dumps(results), expires_at))
+                ON CONFLICT(query) DO UPDATE SET
+                    results = excluded.results,
+                    created_at = CURRENT_TIMESTAMP,
+                    expires_at = excluded.expires_at,
+                    last_hit_at = NULL
+            """, (query, json.dumps(results, ensure_ascii=False), expires_at))
+        
+        self._submit_write(self._write_web_cache_eviction, max_entries)
     
-    def get_cached_web_results(self, query: str) -> Optional[List[Dict]]:
+    def get_cached_web_results(self, query: str):
         """Obtiene resultados cacheados si no han expirado"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -300,63 +1329,241 @@ class Database:
             """, (query,))
             
             row = cursor.fetchone()
-            if row:
-                return json.loads(row['results'])
-            return None
+        
+        if row:
+            self._submit_write(self._write_web_cache_hit, query)
+            return json.loads(row['results'])
+        return None
+    
+    def invalidate_web_cache(self, query: str):
+        """Elimina una búsqueda cacheada (p. ej. cuando el usuario la corrige)"""
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM web_cache WHERE query = ?", (query,))
+    
+    @staticmethod
+    def _write_web_cache_hit(cursor, query: str):
+        cursor.execute("UPDATE web_cache SET last_hit_at = CURRENT_TIMESTAMP WHERE query = ?", (query,))
+    
+    @staticmethod
+    def _write_web_cache_eviction(cursor, max_entries: int):
+        """Expulsa entradas caducadas y, por encima del tope, las usadas hace más tiempo"""
+        cursor.execute("DELETE FROM web_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+        cursor.execute("""
+            DELETE FROM web_cache WHERE id IN (
+                SELECT id FROM web_cache
+                ORDER BY COALESCE(last_hit_at, created_at) DESC, id DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+    
+    def save_sessions(self, rows: List[Tuple[str, str, float]], on_commit=None):
+        """Guarda (id, estado JSON, último uso en epoch) de sesiones de conversación (escritura diferida)"""
+        self._submit_write(self._write_sessions, rows, on_commit=on_commit)
+    
+    @staticmethod
+    def _write_sessions(cursor, rows: List[Tuple[str, str, float]]):
+        cursor.executemany("""
+            INSERT INTO sessions (session_id, state, last_seen) VALUES (?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                state = excluded.state,
+                last_seen = excluded.last_seen
+        """, rows)
+    
+    def load_session(self, session_id: str, min_last_seen: float) -> Optional[Tuple[str, float]]:
+        """(estado JSON, último uso) de una sesión guardada usada después de min_last_seen"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT state, last_seen FROM sessions
+                WHERE session_id = ? AND last_seen >= ?
+            """, (session_id, min_last_seen))
+            row = cursor.fetchone()
+        return (row['state'], row['last_seen']) if row else None
+    
+    def delete_sessions(self, *session_ids: str):
+        """Elimina sesiones guardadas (escritura diferida)"""
+        self._submit_write(self._write_session_deletion, session_ids)
+    
+    @staticmethod
+    def _write_session_deletion(cursor, session_ids: Tuple[str, ...]):
+        cursor.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in session_ids])
+    
+    def purge_sessions(self, min_last_seen: float):
+        """Elimina las sesiones guardadas que caducaron (último uso anterior a min_last_seen)"""
+        self._submit_write(self._write_session_purge, min_last_seen)
+    
+    @staticmethod
+    def _write_session_purge(cursor, min_last_seen: float):
+        cursor.execute("DELETE FROM sessions WHERE last_seen < ?", (min_last_seen,))
     
     def get_knowledge_count(self) -> int:
         """Obtiene el total de entradas de conocimiento"""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) as count FROM knowledge")
-            return cursor.fetchone()['count']
+            return self._read_counter(conn.cursor(), 'knowledge')
     
-    def get_stats(self) -> Dict:
-        """Obtiene estadísticas de la base de datos"""
+    def get_stats(self, recent_days: int = 7) -> Dict:
+        """Obtiene estadísticas de la base de datos a partir de los contadores (O(1))"""
+        self.flush()
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("""
+                SELECT name, key, value FROM stats_counters
+                WHERE name IN ('knowledge', 'topic', 'interactions', 'web_cache')
+            """)
             
-            stats = {}
-            cursor.execute("SELECT COUNT(*) as count FROM knowledge")
-            stats['total_knowledge'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(DISTINCT topic) as count FROM knowledge")
-            stats['total_topics'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM history")
-            stats['total_interactions'] = cursor.fetchone()['count']
+            by_source = {}
+            stats = {'total_knowledge': 0, 'total_topics': 0, 'cached_searches': 0}
+            for row in cursor.fetchall():
+                if row['name'] == 'knowledge':
+                    stats['total_knowledge'] = row['value']
+                elif row['name'] == 'topic':
+                    stats['total_topics'] += 1 if row['value'] > 0 else 0
+                elif row['name'] == 'interactions':
+                    by_source[row['key']] = row['value']
+                else:
+                    stats['cached_searches'] = row['value']
             
-            cursor.execute("SELECT COUNT(*) as count FROM web_cache")
-            stats['cached_searches'] = cursor.fetchone()['count']
+            stats['total_interactions'] = sum(by_source.values())
+            stats['interactions_by_source'] = by_source
             
-            return stats
+            cursor.execute("""
+                SELECT key, value FROM stats_counters
+                WHERE name = 'interactions_day'
+                ORDER BY key DESC
+                LIMIT ?
+            """, (recent_days,))
+            stats['interactions_by_day'] = {row['key']: row['value'] for row in cursor.fetchall()}
+        
+        stats['answer_cache'] = self._answer_cache.stats()
+        return stats
+    
+    # Registros lógicos del respaldo: independientes del esquema físico de las tablas
+    EXPORT_FORMAT = "officeai-ndjson"
+    EXPORT_VERSION = 1
+    
+    @staticmethod
+    def _open_backup(filepath: str, mode: str):
+        """Abre un respaldo NDJSON, comprimido con gzip si termina en .gz"""
+        if str(filepath).endswith('.gz'):
+            return gzip.open(filepath, mode + 't', encoding='utf-8')
+        return open(filepath, mode, encoding='utf-8')
+    
+    def export_ndjson(self, filepath: str) -> Optional[Dict[str, int]]:
+        """
+        Exporta la base de datos como NDJSON (una fila por línea) en memoria constante
+        
+        Returns:
+            Dict con las filas exportadas por tipo, o None si falla
+        """
+        self.flush()
+        counts = {'knowledge': 0, 'q_value': 0, 'history': 0}
+        queries = {
+            'knowledge': "SELECT question_original, answer, topic, created_at FROM knowledge ORDER BY id",
+            'q_value': """
+                SELECT q.normalized AS question_normalized, k.answer,
+                       v.q_value, v.times_selected, v.times_correct, v.times_incorrect, v.last_used
+                FROM q_values v
+                JOIN knowledge k ON k.id = v.knowledge_id
+                JOIN questions q ON q.id = k.question_id
+                ORDER BY v.knowledge_id
+            """,
+            'history': "SELECT question, answer, source, was_correct, timestamp FROM history ORDER BY id",
+        }
+        
+        try:
+            with self._get_connection() as conn, self._open_backup(filepath, 'w') as f:
+                header = {'type': 'header', 'format': self.EXPORT_FORMAT, 'version': self.EXPORT_VERSION,
+                          'exported_at': datetime.now().isoformat()}
+                f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                
+                for record_type, query in queries.items():
+                    for row in conn.execute(query):
+                        f.write(json.dumps({'type': record_type, **dict(row)}, ensure_ascii=False, default=str) + "\n")
+                        counts[record_type] += 1
+            return counts
+        except Exception as e:
+            print(f"[ERROR] No se pudo exportar el respaldo: {e}")
+            return None
     
-    def export_to_json(self, filepath: str) -> bool:
-        """Exporta toda la base de datos a JSON como respaldo"""
+    def import_ndjson(self, filepath: str, batch_size: int = 1000) -> Optional[Dict[str, int]]:
+        """
+        Restaura un respaldo NDJSON en una sola transacción, por lotes de batch_size filas
+        
+        Returns:
+            Dict con las filas importadas por tipo, o None si falla (no se aplica nada)
+        """
+        counts = {'knowledge': 0, 'duplicates': 0, 'q_value': 0, 'history': 0}
+        pending = {'knowledge': [], 'q_value': [], 'history': []}
+        
+        def flush_pending(cursor, record_type):
+            rows = pending[record_type]
+            if not rows:
+                return
+            if record_type == 'knowledge':
+                result = self.add_knowledge_many(rows)
+                counts['knowledge'] += result['inserted']
+                counts['duplicates'] += result['duplicates']
+            elif record_type == 'q_value':
+                cursor.executemany(f"""
+                    INSERT INTO q_values (knowledge_id, q_value, times_selected,
+                                          times_correct, times_incorrect, last_used)
+                    SELECT id, ?, ?, ?, ?, ? FROM ({self._KNOWLEDGE_ID_BY_CONTENT})
+                    WHERE true
+                    ON CONFLICT(knowledge_id) DO UPDATE SET
+                        q_value = excluded.q_value,
+                        times_selected = excluded.times_selected,
+                        times_correct = excluded.times_correct,
+                        times_incorrect = excluded.times_incorrect,
+                        last_used = excluded.last_used
+                """, rows)
+                counts['q_value'] += cursor.rowcount
+            else:
+                cursor.executemany("""
+                    INSERT INTO history (question, answer, source, was_correct, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                """, rows)
+                counts['history'] += len(rows)
+            pending[record_type] = []
+        
+        self.flush()
         try:
-            with self._get_connection() as conn:
+            with self._get_connection() as conn, self._open_backup(filepath, 'r') as f:
                 cursor = conn.cursor()
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    record_type = record.get('type')
+                    
+                    if record_type == 'header':
+                        if record.get('format') != self.EXPORT_FORMAT or record.get('version', 0) > self.EXPORT_VERSION:
+                            raise ValueError(f"Formato de respaldo no soportado: {record.get('format')} v{record.get('version')}")
+                        continue
+                    if record_type == 'knowledge':
+                        pending['knowledge'].append((record['question_original'], record['answer'], record['topic']))
+                    elif record_type == 'q_value':
+                        pending['q_value'].append((
+                            record['q_value'], record['times_selected'], record['times_correct'],
+                            record['times_incorrect'], record['last_used'],
+                            record['question_normalized'], answer_hash(record['answer']), record['answer']
+                        ))
+                    elif record_type == 'history':
+                        pending['history'].append((
+                            record['question'], record['answer'], record['source'],
+                            record['was_correct'], record['timestamp']
+                        ))
+                    else:
+                        raise ValueError(f"Tipo de registro desconocido en la línea {line_number}: {record_type}")
+                    
+                    if len(pending[record_type]) >= batch_size:
+                        # El conocimiento va antes que sus Q-values: se vacía primero
+                        flush_pending(cursor, 'knowledge')
+                        flush_pending(cursor, record_type)
                 
-                export_data = {
-                    'knowledge': [],
-                    'history': [],
-                    'q_values': [],
-                    'exported_at': datetime.now().isoformat()
-                }
-                
-                cursor.execute("SELECT * FROM knowledge")
-                export_data['knowledge'] = [dict(row) for row in cursor.fetchall()]
-                
-                cursor.execute("SELECT * FROM history ORDER BY timestamp DESC LIMIT 100")
-                export_data['history'] = [dict(row) for row in cursor.fetchall()]
-                
-                cursor.execute("SELECT * FROM q_values")
-                export_data['q_values'] = [dict(row) for row in cursor.fetchall()]
-                
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(export_data, f, ensure_ascii=False, indent=2, default=str)
-                
-                return True
+                for record_type in pending:
+                    flush_pending(cursor, record_type)
+            self._answer_cache.clear()
+            return counts
         except Exception as e:
-            print(f"[ERROR] No se pudo exportar a JSON: {e}")
-            return False
+            print(f"[ERROR] No se pudo importar el respaldo: {e}")
+            return None
@@ -3,34 +3,173 @@
 Motor de búsqueda con Gemini para OfficeAI
 Utiliza Grounding with Google Search para respuestas precisas
 """
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, Tuple, List, Optional
+
 import google.generativeai as genai
-from typing import Tuple, List, Optional
-from config import GEMINI_API_KEY, GEMINI_MODEL
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from config import (
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_FALLBACK_MODEL, GEMINI_QUOTA_DB_PATH, GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_REQUESTS_PER_DAY, GEMINI_MAX_CONCURRENCY, GEMINI_QUOTA_WAIT_SECONDS, GEMINI_MAX_RETRIES,
+    GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX, GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN, GEMINI_LATENCY_WINDOW,
+    GEMINI_DEADLINE_SECONDS, GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_SAMPLES, GEMINI_HEDGE_DEFAULT_DELAY,
+    GEMINI_HEDGE_MIN_DELAY, SERVER_STUB_LATENCY
+)
+from rate_limiter import QuotaExhausted, RateLimiter, backoff_delay
+
+
+def _is_quota_error(error: Exception) -> bool:
+    return "429" in str(error)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Gemini no dio una respuesta válida dentro del plazo de la petición"""
+
+
+class ModelVariant:
+    """Cliente ya construido de un modelo, con su cortocircuito y sus latencias recientes"""
+
+    def __init__(self, name: str, model_name: str, model):
+        self.name = name
+        self.model_name = model_name
+        self.model = model
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN)
+        self._latencies = deque(maxlen=GEMINI_LATENCY_WINDOW)  # Segundos de las últimas llamadas con éxito
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def record_success(self, latency: float):
+        self.breaker.record_success()
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency)
+
+    def record_failure(self):
+        self.breaker.record_failure()
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Percentil (0-100) de las latencias recientes; None si aún no hay datos"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        rank = min(len(latencies) - 1, max(0, round(percentile / 100 * len(latencies)) - 1))
+        return latencies[rank]
+
+    def stats(self) -> Dict:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        with self._lock:
+            calls, failures = self.calls, self.failures
+        return {
+            'model': self.model_name,
+            **self.breaker.stats(),
+            'calls': calls,
+            'failures': failures,
+            'p50_ms': round(p50 * 1000) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class _WebRequest:
+    """
+    Estado compartido por las cadenas de variantes de una misma pregunta (la principal y la
+    de cobertura): cada variante se llama como mucho una vez y ninguna llamada empieza ni
+    dura más allá del plazo
+    """
+
+    def __init__(self, prompt: str, deadline: float):
+        self.prompt = prompt
+        self.deadline = deadline
+        self.expires = time.monotonic() + deadline
+        self.finished = threading.Event()  # Ya hay ganadora o venció el plazo: lo pendiente se abandona
+        self._lock = threading.Lock()
+        self._claimed = set()
+
+    @property
+    def expired(self) -> bool:
+        return self.finished.is_set() or time.monotonic() >= self.expires
+
+    def remaining(self) -> float:
+        """Segundos de plazo que quedan; DeadlineExceeded si ya no queda o la petición terminó"""
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0 or self.finished.is_set():
+            raise DeadlineExceeded(f"Gemini no respondió en {self.deadline:g}s")
+        return remaining
+
+    def claim(self, variant: ModelVariant) -> bool:
+        """Reserva variant para esta petición; False si la otra cadena ya la usó o la está usando"""
+        with self._lock:
+            if variant.name in self._claimed:
+                return False
+            self._claimed.add(variant.name)
+            return True
+
+    def unclaimed(self, variants: List[ModelVariant]) -> List[ModelVariant]:
+        with self._lock:
+            return [variant for variant in variants if variant.name not in self._claimed]
+
 
 class GeminiEngine:
     """Maneja la integración con Google Gemini para búsqueda conectada a internet"""
     
-    def __init__(self):
+    def __init__(self, limiter: Optional[RateLimiter] = None):
+        """
+        Args:
+            limiter: Cuota compartida (por defecto, la de config.py, común a todos los procesos)
+        """
         self.api_key = GEMINI_API_KEY
+        self.limiter = limiter or RateLimiter(
+            GEMINI_QUOTA_DB_PATH, 'gemini', GEMINI_REQUESTS_PER_MINUTE, GEMINI_REQUESTS_PER_DAY,
+            GEMINI_MAX_CONCURRENCY, max_wait=GEMINI_QUOTA_WAIT_SECONDS
+        )
         if self.api_key:
             genai.configure(api_key=self.api_key)
             # Herramienta de búsqueda de Google (Grounding)
             self.tools = [
                 {'google_search_retrieval': {}}
             ]
-            self.model = genai.GenerativeModel(
-                model_name=GEMINI_MODEL,
-                tools=self.tools
-            )
+            # Clientes construidos una sola vez, en orden de preferencia
+            self.variants = [
+                ModelVariant('primary', GEMINI_MODEL, genai.GenerativeModel(model_name=GEMINI_MODEL, tools=self.tools)),
+                # Sin herramientas: la búsqueda en Google tiene su propia cuota
+                ModelVariant('no_tools', GEMINI_MODEL, genai.GenerativeModel(model_name=GEMINI_MODEL)),
+                ModelVariant('fallback', GEMINI_FALLBACK_MODEL,
+                             genai.GenerativeModel(model_name=GEMINI_FALLBACK_MODEL, tools=self.tools)),
+            ]
         else:
-            self.model = None
+            self.variants = []
+        # Llamadas en segundo plano para poder cubrirlas (hedging) y abandonarlas al vencer el plazo
+        self._executor = ThreadPoolExecutor(GEMINI_MAX_CONCURRENCY * 2, thread_name_prefix='officeai-gemini-call')
+        self._stats_lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadlines_exceeded = 0
 
-    def search_and_synthesize(self, question: str) -> Tuple[Optional[str], List[str]]:
+    def search_and_synthesize(self, question: str,
+                              deadline: float = GEMINI_DEADLINE_SECONDS) -> Tuple[Optional[str], List[str]]:
         """
         Realiza una búsqueda conectada a internet usando Gemini y sintetiza la respuesta
         
+        Args:
+            question: Pregunta del usuario
+            deadline: Segundos como máximo para obtener la respuesta
+        
         Returns:
-            Tuple con (respuesta_sintetizada, lista_de_fuentes)
+            Tuple con (respuesta_sintetizada, lista_de_fuentes); (None, []) si Gemini falla
+        
+        Raises:
+            DeadlineExceeded: Si no hubo respuesta dentro del plazo (quien llama decide la alternativa)
         """
         # No imprimir mensajes técnicos de búsqueda directamente al usuario
         
@@ -44,33 +183,155 @@ class GeminiEngine:
         )
 
         try:
-            return self._generate_with_fallback(prompt)
+            return self._hedged_generate(prompt, deadline)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"[ERROR] Gemini Search falló definitivamente: {e}")
             return None, []
 
-    def _generate_with_fallback(self, prompt: str) -> Tuple[str, List[str]]:
-        """Intenta generar contenido con el modelo principal y un fallback si falla con 404"""
+    def _hedge_delay(self, variant: ModelVariant) -> float:
+        """Espera antes de cubrir una llamada: el percentil de latencia de la variante (o un valor fijo sin datos)"""
+        delay = GEMINI_HEDGE_DEFAULT_DELAY
+        if variant.samples >= GEMINI_HEDGE_MIN_SAMPLES:
+            delay = variant.latency_percentile(GEMINI_HEDGE_PERCENTILE)
+        return max(GEMINI_HEDGE_MIN_DELAY, delay)
+
+    def _hedged_generate(self, prompt: str, deadline: float) -> Tuple[str, List[str]]:
+        """
+        Lanza la cadena de variantes y, si la primera no ha respondido cuando ya
+        habría respondido el GEMINI_HEDGE_PERCENTILE de sus llamadas, lanza en
+        paralelo una petición de cobertura a las variantes que la primera cadena
+        aún no ha usado (cada variante gasta cuota una sola vez por pregunta).
+        Gana la primera respuesta válida; la otra se cancela si aún no había
+        empezado y, si no, se abandona: no empieza más llamadas y la que tenga
+        en curso termina como tarde al vencer el plazo
+        """
+        request = _WebRequest(prompt, deadline)
+        healthy = [variant for variant in self.variants if variant.breaker.state != OPEN]
+        pending = {self._executor.submit(self._generate_with_fallback, request)}
+        hedge = None
+        if len(healthy) > 1:
+            done, _ = wait(pending, timeout=min(self._hedge_delay(healthy[0]), deadline))
+            spare = request.unclaimed(healthy)
+            if not done and spare:
+                hedge = self._executor.submit(self._generate_with_fallback, request, spare)
+                pending.add(hedge)
+                with self._stats_lock:
+                    self.hedges += 1
+
+        last_error = None
         try:
-            response = self.model.generate_content(prompt)
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, request.expires - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    with self._stats_lock:
+                        self.deadlines_exceeded += 1
+                    raise DeadlineExceeded(f"Gemini no respondió en {deadline:g}s")
+                for future in done:
+                    try:
+                        answer, sources = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if answer:
+                        if future is hedge:
+                            with self._stats_lock:
+                                self.hedge_wins += 1
+                        return answer, sources
+            raise last_error or ValueError("Gemini devolvió una respuesta vacía")
+        finally:
+            request.finished.set()
+            for future in pending:
+                future.cancel()
+
+    def search_many(self, questions: Iterable[str]) -> Iterator[Tuple[Optional[str], List[str]]]:
+        """
+        search_and_synthesize de varias preguntas en paralelo (al ritmo que permita la cuota);
+        entrega cada resultado, en orden, en cuanto está listo para que quien llama lo guarde ya
+        """
+        def search(question: str) -> Tuple[Optional[str], List[str]]:
+            try:
+                return self.search_and_synthesize(question)
+            except DeadlineExceeded as e:
+                print(f"[ERROR] Gemini Search falló definitivamente: {e}")
+                return None, []
+
+        pool = ThreadPoolExecutor(self.limiter.max_concurrency, thread_name_prefix='officeai-gemini')
+        try:
+            yield from pool.map(search, questions)
+        finally:
+            # Si quien consume se interrumpe, las búsquedas aún no empezadas no gastan cuota
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _generate(self, variant: ModelVariant, request: _WebRequest):
+        """
+        generate_content dentro de la cuota compartida y del plazo de la petición;
+        ante un 429 frena a todos los procesos y reintenta con espera exponencial con jitter
+        """
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            with self.limiter.slot(min(GEMINI_QUOTA_WAIT_SECONDS, request.remaining())):
+                started = time.monotonic()
+                try:
+                    # Con tope de tiempo: una llamada abandonada libera su hilo al vencer el plazo
+                    response = variant.model.generate_content(
+                        request.prompt, request_options={'timeout': request.remaining()}
+                    )
+                    variant.record_success(time.monotonic() - started)
+                    return response
+                except Exception as e:
+                    if not _is_quota_error(e) or attempt == GEMINI_MAX_RETRIES:
+                        raise
+                    self.limiter.penalize()
+            # Se despierta antes si la petición termina; el siguiente intento comprueba el plazo
+            request.finished.wait(min(backoff_delay(attempt, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX),
+                                      request.remaining()))
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            hedging = {'hedges': self.hedges, 'hedge_wins': self.hedge_wins,
+                       'deadlines_exceeded': self.deadlines_exceeded}
+        return {
+            'rate_limiter': self.limiter.stats(),
+            'variants': {variant.name: variant.stats() for variant in self.variants},
+            'hedging': hedging,
+        }
+
+    def _generate_with_fallback(self, request: _WebRequest,
+                                variants: Optional[List[ModelVariant]] = None) -> Tuple[str, List[str]]:
+        """
+        Prueba las variantes en orden (por defecto principal, sin herramientas y
+        modelo de respaldo) saltándose las que tienen el circuito abierto, de
+        modo que durante una caída se va directamente a la que funciona, y las
+        que la otra cadena de la misma petición ya ha reservado
+        """
+        last_error = None
+        missing_models = set()  # Modelos que dieron 404: sus otras variantes tampoco existen
+        for variant in self.variants if variants is None else variants:
+            if variant.model_name in missing_models or not request.claim(variant):
+                continue
+            request.remaining()  # No empezar otra variante con la petición ya resuelta o fuera de plazo
+            if not variant.breaker.allow():
+                continue
+            try:
+                response = self._generate(variant, request)
+            except (QuotaExhausted, DeadlineExceeded):
+                variant.breaker.release()  # Falta cuota propia o plazo, no es culpa del modelo
+                raise
+            except Exception as e:
+                if request.expired:
+                    variant.breaker.release()  # Cortada al vencer el plazo o abandonada
+                    raise DeadlineExceeded(f"Gemini no respondió en {request.deadline:g}s") from e
+                variant.record_failure()
+                last_error = e
+                if "404" in str(e):
+                    missing_models.add(variant.model_name)
+                continue
             return self._parse_response(response)
-        except Exception as e:
-            if "429" in str(e):
-                # Error de cuota: fallar silenciosamente aquí para que el controlador lo maneje
-                # o reintentar sin herramientas
-                model_no_tools = genai.GenerativeModel(model_name=GEMINI_MODEL)
-                response = model_no_tools.generate_content(prompt)
-                return self._parse_response(response)
-                
-            # Error 404: Modelo no encontrado
-            if "404" in str(e):
-                fallback_model = genai.GenerativeModel(
-                    model_name="gemini-flash-latest",
-                    tools=self.tools
-                )
-                response = fallback_model.generate_content(prompt)
-                return self._parse_response(response)
-            raise e
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError("Todos los modelos de Gemini están en pausa tras fallos recientes")
 
     def _parse_response(self, response) -> Tuple[str, List[str]]:
         """Extrae texto y fuentes de la respuesta de Gemini"""
@@ -92,3 +353,21 @@ class GeminiEngine:
                 # (Opcional: extraer URLs del HTML si fuera necesario)
         
         return answer, list(set(sources))
+
+
+class StubGeminiEngine:
+    """Sustituto de GeminiEngine para pruebas locales: responde sin red tras una latencia fija"""
+
+    def __init__(self, latency: float = SERVER_STUB_LATENCY):
+        self.latency = latency
+
+    def search_and_synthesize(self, question: str,
+                              deadline: float = GEMINI_DEADLINE_SECONDS) -> Tuple[Optional[str], List[str]]:
+        if self.latency > deadline:
+            time.sleep(deadline)
+            raise DeadlineExceeded(f"Gemini no respondió en {deadline:g}s")
+        time.sleep(self.latency)
+        return f"Respuesta simulada para: {question}", []
+
+    def stats(self) -> Dict:
+        return {'stub': True, 'latency': self.latency}
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Buscador de palabras clave multipatrón para OfficeAI
+Autómata Aho-Corasick sobre palabras: encuentra todas las palabras clave
+(de una o varias palabras) en una sola pasada lineal, con límites de palabra
+y sin distinguir mayúsculas ni acentos
+"""
+import re
+from collections import deque
+from typing import Hashable, Iterator, List, NamedTuple, Tuple
+
+from text_normalizer import normalize
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def keyword_words(text: str) -> Tuple[str, ...]:
+    """Palabras de un texto tal como las compara el autómata (minúsculas, sin acentos)"""
+    return tuple(_WORD.findall(normalize(text).folded))
+
+
+class KeywordMatch(NamedTuple):
+    """Coincidencia de una palabra clave (posiciones en palabras, fin exclusivo)"""
+    label: Hashable
+    start: int
+    end: int
+
+
+class KeywordMatcher:
+    """Autómata Aho-Corasick cuyo alfabeto son palabras completas"""
+
+    def __init__(self):
+        self._goto = [{}]     # estado -> {palabra: estado siguiente}
+        self._fail = [0]      # estado -> estado de fallo
+        self._output = [[]]   # estado -> [(etiqueta, longitud en palabras)]
+        self._built = False
+
+    def add(self, keyword: str, label: Hashable):
+        """Registra una palabra clave con su etiqueta (una misma etiqueta puede tener varias)"""
+        if self._built:
+            raise RuntimeError("No se pueden añadir palabras clave a un autómata ya construido")
+        words = keyword_words(keyword)
+        if not words:
+            return
+
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        if (label, len(words)) not in self._output[state]:
+            self._output[state].append((label, len(words)))
+
+    def build(self) -> 'KeywordMatcher':
+        """Calcula los enlaces de fallo (recorrido en anchura) y congela el autómata"""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for word, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(word, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+        self._built = True
+        return self
+
+    def iter_matches(self, words: Tuple[str, ...]) -> Iterator[KeywordMatch]:
+        """Recorre las palabras una vez y emite cada coincidencia al llegar a su final"""
+        if not self._built:
+            self.build()
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for label, length in self._output[state]:
+                yield KeywordMatch(label, position + 1 - length, position + 1)
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Todas las coincidencias en el texto, en orden de aparición"""
+        return list(self.iter_matches(keyword_words(text)))
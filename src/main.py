@@ -14,7 +14,7 @@ from utils import setup_logging, print_banner, print_stats
 
 def handle_correction(ai):
     """Maneja una corrección del usuario con opciones avanzadas"""
-    if not ai.last_question:
+    if not ai.default_session.last_question:
         print(f"\n{PERSONALITY['name']}: No hay pregunta previa para corregir.")
         return
     
@@ -67,7 +67,8 @@ def handle_single_answer(ai, question, answer):
     choice = input("\nElige una opción (1/2/3): ").strip()
     
     if choice == "1":
-        ai.db.update_q_value(question, answer, +2.0)
+        # Mismo refuerzo que POST /feedback del servidor
+        ai.handle_answer_selection(question, answer, is_correct=True)
         print(f"{PERSONALITY['name']}: ¡Perfecto! Aumentaré la confianza en esta respuesta.")
     elif choice == "2":
         new_answer = input("Escribe la respuesta correcta:\n").strip()
@@ -122,7 +123,12 @@ def handle_web_search(ai, question):
     
     synthesis, sources = ai.search_web_and_process(question)
     
-    if synthesis:
+    if synthesis and ai.default_session.last_source == 'local_fallback':
+        # La web no respondió a tiempo: lo más parecido que hay en la base de conocimiento
+        print(f"\n{PERSONALITY['name']}: No he podido consultar la web a tiempo. Lo más parecido que sé es:")
+        print(f"\n{synthesis}\n")
+        ai.add_to_context(question, synthesis)
+    elif synthesis:
         # Mostrar respuesta sintetizada automáticamente
         print(f"\n{PERSONALITY['name']}: {synthesis}\n")
         
@@ -196,13 +202,18 @@ def main():
         ai = AIEngine(db)
         
         logger.info("Componentes inicializados correctamente")
+        
+        compacted = db.compact_history()
+        if compacted:
+            logger.info(f"Historial compactado: {compacted} interacciones antiguas agregadas por día")
         print(f"Base de datos: {DB_PATH}")
         print(f"Conocimiento cargado: {db.get_knowledge_count()} entradas")
         print("\nComandos especiales:")
         print("  '1001' - Corregir última respuesta del sistema")
         print("  'historial' - Ver conversaciones anteriores")
         print("  'stats' - Ver estadísticas del sistema")
-        print("  'export' - Exportar base de datos a JSON")
+        print("  'export' - Exportar base de datos (NDJSON comprimido)")
+        print("  'import' - Restaurar un respaldo exportado")
         print("  'contexto' - Ver contexto conversacional actual")
         print("  'salir' - Terminar programa")
         print("="*80)
@@ -233,13 +244,27 @@ def main():
                 continue
             
             if q.lower() == "export":
-                export_path = DATA_DIR / "backup.json"
-                if db.export_to_json(str(export_path)):
+                export_path = DATA_DIR / "backup.ndjson.gz"
+                counts = db.export_ndjson(str(export_path))
+                if counts:
                     print(f"✓ Base de datos exportada a: {export_path}")
+                    print(f"  {counts['knowledge']} conocimientos, {counts['q_value']} Q-values, {counts['history']} interacciones")
                 else:
                     print("✗ Error al exportar base de datos")
                 continue
             
+            if q.lower() == "import":
+                default_path = DATA_DIR / "backup.ndjson.gz"
+                import_path = input(f"Ruta del respaldo [{default_path}]: ").strip() or str(default_path)
+                counts = db.import_ndjson(import_path)
+                if counts:
+                    print(f"✓ Respaldo importado desde: {import_path}")
+                    print(f"  {counts['knowledge']} conocimientos nuevos ({counts['duplicates']} ya existían), "
+                          f"{counts['q_value']} Q-values, {counts['history']} interacciones")
+                else:
+                    print("✗ Error al importar el respaldo")
+                continue
+            
             if q.lower() == "contexto":
                 context = ai.get_context_summary()
                 if context:
@@ -249,7 +274,7 @@ def main():
                     print("\n📝 No hay contexto conversacional aún.")
                 continue
             
-            if q == "1001" or (ai.is_correction(q) and ai.last_question):
+            if q == "1001" or (ai.is_correction(q) and ai.default_session.last_question):
                 result = ai.forget_last_interaction()
                 if "No tengo nada" not in result:
                     handle_correction(ai)
@@ -289,6 +314,9 @@ def main():
             print(f"\n{PERSONALITY['name']}: Lo siento, ocurrió un error inesperado.")
             logger.error(f"Error en loop principal: {e}", exc_info=True)
             continue
+    
+    db.close()
+    logger.info("Conexiones a la base de datos cerradas")
 
 
 if __name__ == "__main__":
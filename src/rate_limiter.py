@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Limitador de peticiones a Gemini para OfficeAI
+Cubos de tokens (peticiones por minuto y por día) guardados en SQLite, para
+que varios procesos (chat, servidor, entrenamiento) compartan una misma cuota,
+más un tope de llamadas simultáneas dentro de cada proceso
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class QuotaExhausted(Exception):
+    """No hubo cuota disponible dentro del tiempo de espera permitido"""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Espera antes del reintento attempt (0, 1, ...): exponencial con jitter completo"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+    """Cuota compartida entre procesos (cubos de tokens en SQLite) y concurrencia acotada por proceso"""
+
+    def __init__(self, db_path: Path, name: str, requests_per_minute: int, requests_per_day: int,
+                 max_concurrency: int, max_wait: Optional[float] = None):
+        """
+        Args:
+            db_path: Fichero SQLite con el estado de los cubos (el mismo para todos los procesos)
+            name: Cuota a la que se descuenta (p. ej. el servicio)
+            requests_per_minute: Capacidad del cubo por minuto (también la ráfaga máxima)
+            requests_per_day: Capacidad del cubo diario
+            max_concurrency: Llamadas en curso a la vez en este proceso
+            max_wait: Espera por defecto de slot() antes de lanzar QuotaExhausted (None: sin límite)
+        """
+        self.db_path = str(db_path)
+        self.name = name
+        # cubo -> (capacidad, segundos en rellenarse del todo)
+        self.buckets: Dict[str, Tuple[int, float]] = {
+            'minute': (max(1, requests_per_minute), 60.0),
+            'day': (max(1, requests_per_day), 86400.0),
+        }
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.granted = 0
+        self.waited_seconds = 0.0
+        self.throttled = 0  # Avisos de cuota (429) recibidos
+        self.rejected = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión del hilo en modo autocommit (las transacciones se abren a mano)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    name TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (name, bucket)
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transacción con el bloqueo de escritura tomado desde el principio (lectura-modificación-escritura)"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _refilled(self, conn: sqlite3.Connection, now: float) -> Dict[str, float]:
+        """Tokens de cada cubo a fecha now"""
+        stored = dict((bucket, (tokens, updated)) for bucket, tokens, updated in conn.execute(
+            "SELECT bucket, tokens, updated FROM rate_limits WHERE name = ?", (self.name,)
+        ))
+        tokens = {}
+        for bucket, (capacity, period) in self.buckets.items():
+            if bucket not in stored:
+                tokens[bucket] = float(capacity)
+                continue
+            level, updated = stored[bucket]
+            tokens[bucket] = min(capacity, level + max(0.0, now - updated) * capacity / period)
+        return tokens
+
+    def _store(self, conn: sqlite3.Connection, tokens: Dict[str, float], now: float):
+        conn.executemany("""
+            INSERT INTO rate_limits (name, bucket, tokens, updated) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name, bucket) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+        """, [(self.name, bucket, level, now) for bucket, level in tokens.items()])
+
+    def _try_acquire(self) -> float:
+        """Consume un token de cada cubo si los hay; si no, devuelve los segundos hasta que los haya"""
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = self._refilled(conn, now)
+            missing = {bucket: 1 - level for bucket, level in tokens.items() if level < 1}
+            if not missing:
+                for bucket in tokens:
+                    tokens[bucket] -= 1
+            self._store(conn, tokens, now)
+        return max((deficit * self.buckets[bucket][1] / self.buckets[bucket][0]
+                    for bucket, deficit in missing.items()), default=0.0)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Espera a tener un token de cada cubo; False si no llega antes de timeout segundos"""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                with self._stats_lock:
+                    self.granted += 1
+                    self.waited_seconds += time.monotonic() - started
+                return True
+            # Jitter: los procesos que esperan el mismo token no despiertan a la vez
+            wait *= random.uniform(1.0, 1.2)
+            if deadline is not None and time.monotonic() + wait > deadline:
+                with self._stats_lock:
+                    self.rejected += 1
+                return False
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        Hueco de concurrencia más un token de cuota; lanza QuotaExhausted si no llegan a tiempo
+        (timeout None: la espera por defecto del limitador, max_wait)
+        """
+        started = time.monotonic()
+        if timeout is None:
+            timeout = self.max_wait
+        if not self._slots.acquire(timeout=timeout if timeout is not None else -1):
+            with self._stats_lock:
+                self.rejected += 1
+            raise QuotaExhausted(f"Sin hueco libre para {self.name} tras {time.monotonic() - started:.1f}s")
+        try:
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+            if not self.acquire(remaining):
+                raise QuotaExhausted(f"Cuota de {self.name} agotada (se esperó {time.monotonic() - started:.1f}s)")
+            with self._stats_lock:
+                self.in_flight += 1
+            try:
+                yield
+            finally:
+                with self._stats_lock:
+                    self.in_flight -= 1
+        finally:
+            self._slots.release()
+
+    def penalize(self):
+        """
+        El servicio respondió 429: se vacía el cubo por minuto para que todos
+        los procesos frenen hasta que se rellene
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = self._refilled(conn, now)
+            tokens['minute'] = min(tokens['minute'], 0.0)
+            self._store(conn, tokens, now)
+        with self._stats_lock:
+            self.throttled += 1
+
+    def stats(self) -> Dict:
+        """Tokens disponibles (sin consumirlos) y métricas del proceso"""
+        # Lectura simple (autocommit, WAL): no toma el bloqueo de escritura ni espera a quien lo tenga
+        tokens = self._refilled(self._connection(), time.time())
+        with self._stats_lock:
+            return {
+                'tokens': {bucket: round(level, 2) for bucket, level in tokens.items()},
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                'granted': self.granted,
+                'rejected': self.rejected,
+                'throttled': self.throttled,
+                'avg_wait_seconds': round(self.waited_seconds / self.granted, 3) if self.granted else 0.0,
+            }
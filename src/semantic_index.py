@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Índice semántico local para OfficeAI
+Representa cada pregunta como un vector de n-gramas de caracteres y palabras
+(con hashing) ponderado por IDF, y busca por similitud coseno vectorizada con NumPy.
+Funciona sin conexión y en CPU; se persiste junto a la base de datos.
+"""
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_FORMAT_VERSION = 2
+_IDF_REFRESH_RATIO = 1.25  # Variación del número de filas que obliga a recalcular el IDF
+
+
+def _entry_hash(item_id: int, text: str) -> int:
+    """CRC32 de un par id-texto (cambia si el mismo texto pasa a otro id)"""
+    return zlib.crc32(f"{item_id}:{text}".encode('utf-8'))
+
+
+class SemanticIndex:
+    """Matriz densa de vectores TF hasheados con búsqueda top-k por coseno TF-IDF"""
+
+    def __init__(self, path: Optional[Path] = None, dim: int = 1024, ngram: int = 3):
+        """
+        Args:
+            path: Fichero .npz donde se persiste el índice (None: solo en memoria)
+            dim: Número de cubetas del hashing (columnas de la matriz)
+            ngram: Longitud de los n-gramas de caracteres
+        """
+        self.path = Path(path) if path else None
+        self.dim = dim
+        self.ngram = ngram
+        self._lock = threading.Lock()
+        # Búferes con capacidad de sobra (se duplican al llenarse); las filas válidas son [:_size]
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._hashes = np.zeros(0, dtype=np.int64)  # CRC32 del par id-texto de cada fila
+        self._known = set()  # Ids indexados
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        self._weighted = np.zeros((0, dim), dtype=np.float32)  # Filas TF-IDF unitarias con el _idf vigente
+        self._df = np.zeros(dim, dtype=np.float32)  # Filas con cada cubeta activa
+        self._idf = None  # Se recalcula (y con él toda la matriz) solo cuando el tamaño se aleja mucho de _idf_rows
+        self._idf_rows = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def fingerprint(entries: Iterable[Tuple[int, str]]) -> Tuple[int, int]:
+        """(número de entradas, suma de CRC32 de cada par id-texto) de unas entradas (id, texto)"""
+        count = hash_sum = 0
+        for item_id, text in entries:
+            count += 1
+            hash_sum += _entry_hash(item_id, text)
+        return count, hash_sum
+
+    @property
+    def signature(self) -> Tuple[int, int]:
+        """Huella del contenido indexado, comparable con fingerprint() para detectar un índice desfasado"""
+        with self._lock:
+            return self._size, int(self._hashes[:self._size].sum())
+
+    def _features(self, text: str) -> List[str]:
+        """N-gramas de caracteres (con bordes de palabra) más las palabras completas"""
+        padded = f" {text} "
+        grams = [padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1)]
+        grams.extend(f"w:{word}" for word in text.split())
+        return grams
+
+    def embed(self, text: str) -> np.ndarray:
+        """Vector TF sublineal (log 1 + tf) con hashing estable entre ejecuciones"""
+        buckets = [zlib.crc32(gram.encode('utf-8')) % self.dim for gram in self._features(text)]
+        counts = np.bincount(np.asarray(buckets, dtype=np.int64), minlength=self.dim)
+        return np.log1p(counts).astype(np.float32)
+
+    @staticmethod
+    def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _reserve(self, extra: int):
+        """
+        Garantiza hueco para extra filas más duplicando la capacidad (coste amortizado constante).
+        Copia a búferes nuevos: las vistas que tenga una búsqueda en curso siguen siendo válidas
+        """
+        needed = self._size + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, 2 * len(self._ids), 64)
+        n = self._size
+        for name in ('_ids', '_hashes', '_tf', '_weighted'):
+            old = getattr(self, name)
+            grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:n] = old[:n]
+            setattr(self, name, grown)
+
+    def _set_rows(self, ids: np.ndarray, hashes: np.ndarray, tf: np.ndarray):
+        """Sustituye todo el contenido (sin capacidad de sobra); el IDF se recalcula en la próxima búsqueda"""
+        self._size = len(ids)
+        self._ids, self._hashes, self._tf = ids, hashes, tf
+        self._known = set(ids.tolist())
+        self._weighted = np.zeros_like(tf)
+        self._df = (tf > 0).sum(axis=0).astype(np.float32)
+        self._idf = None
+
+    def add_many(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """Añade (id, texto normalizado); los ids ya indexados se ignoran. Devuelve cuántos se añadieron"""
+        with self._lock:
+            new_ids, hashes, rows = [], [], []
+            for item_id, text in entries:
+                if item_id in self._known:
+                    continue
+                self._known.add(item_id)
+                new_ids.append(item_id)
+                hashes.append(_entry_hash(item_id, text))
+                rows.append(self.embed(text))
+            if not rows:
+                return 0
+
+            tf = np.vstack(rows)
+            self._reserve(len(rows))
+            start, end = self._size, self._size + len(rows)
+            self._ids[start:end] = new_ids
+            self._hashes[start:end] = hashes
+            self._tf[start:end] = tf
+            self._df += (tf > 0).sum(axis=0)
+            if self._idf is not None:
+                # Solo se ponderan las filas nuevas; el IDF de todas se pone al día en _weighted_matrix
+                self._weighted[start:end] = self._unit_rows(tf * self._idf)
+            self._size = end
+            self._dirty = True
+            return len(rows)
+
+    def add(self, item_id: int, text: str) -> bool:
+        return self.add_many([(item_id, text)]) == 1
+
+    def remove(self, item_id: int) -> bool:
+        """Quita un id del índice (copia las filas: poco frecuente y seguro con búsquedas en curso)"""
+        with self._lock:
+            n = self._size
+            positions = np.flatnonzero(self._ids[:n] == item_id)
+            if len(positions) == 0:
+                return False
+            self._df -= (self._tf[positions] > 0).sum(axis=0)
+            self._ids = np.delete(self._ids[:n], positions)
+            self._hashes = np.delete(self._hashes[:n], positions)
+            self._tf = np.delete(self._tf[:n], positions, axis=0)
+            self._weighted = np.delete(self._weighted[:n], positions, axis=0)
+            self._size = len(self._ids)
+            self._known.discard(item_id)
+            self._dirty = True
+            return True
+
+    def rebuild(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """Sustituye todo el contenido del índice"""
+        with self._lock:
+            self._set_rows(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                           np.zeros((0, self.dim), dtype=np.float32))
+        return self.add_many(entries)
+
+    def _weighted_matrix(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (ids, matriz TF-IDF con filas unitarias, idf). El IDF completo solo se recalcula cuando
+        el número de filas varía más de _IDF_REFRESH_RATIO desde el último cálculo; entre medias,
+        las filas nuevas se ponderan al insertarlas con el IDF vigente
+        """
+        with self._lock:
+            n = self._size
+            if self._idf is None or not n / _IDF_REFRESH_RATIO <= self._idf_rows <= n * _IDF_REFRESH_RATIO:
+                self._idf = (np.log((n + 1) / (self._df + 1)) + 1).astype(np.float32)
+                self._idf_rows = n
+                weighted = np.zeros_like(self._tf)
+                weighted[:n] = self._unit_rows(self._tf[:n] * self._idf)
+                self._weighted = weighted
+            return self._ids[:n], self._weighted[:n], self._idf
+
+    def search(self, text: str, top_k: int = 5, threshold: float = 0.0) -> List[Tuple[int, float]]:
+        """Los top_k ids más similares (coseno >= threshold), de mayor a menor similitud"""
+        ids, matrix, idf = self._weighted_matrix()
+        if len(ids) == 0:
+            return []
+
+        query = self.embed(text) * idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in best if scores[i] >= threshold]
+
+    def load(self) -> bool:
+        """Carga el índice persistido; False si no existe o no es compatible"""
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                version, dim, ngram = (int(value) for value in data['config'])
+                if (version, dim, ngram) != (_FORMAT_VERSION, self.dim, self.ngram):
+                    return False
+                ids, hashes, tf = data['ids'], data['hashes'], data['tf']
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[ERROR] No se pudo cargar el índice semántico: {e}")
+            return False
+
+        with self._lock:
+            self._set_rows(ids.astype(np.int64), hashes.astype(np.int64), tf.astype(np.float32))
+            self._dirty = False
+        return True
+
+    def save(self) -> bool:
+        """Persiste el índice si cambió (escritura atómica vía fichero temporal)"""
+        if self.path is None or not self._dirty:
+            return False
+        with self._lock:
+            n = self._size
+            ids, hashes, tf = self._ids[:n], self._hashes[:n], self._tf[:n]  # Las altas escriben más allá de n
+            self._dirty = False
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, config=np.array([_FORMAT_VERSION, self.dim, self.ngram]), ids=ids, hashes=hashes, tf=tf)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            self._dirty = True
+            print(f"[ERROR] No se pudo guardar el índice semántico: {e}")
+            return False
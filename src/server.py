@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor HTTP/JSON para OfficeAI
+Expone AIEngine con asyncio (solo biblioteca estándar). El trabajo de base de
+datos y las llamadas a Gemini se ejecutan en pools de hilos acotados y, cuando
+se alcanza el máximo de peticiones en curso, se responde 429 en lugar de encolar.
+
+Endpoints:
+    POST /ask         {"session_id", "question"}
+    POST /feedback    {"session_id", "question", "answer", "correct"}
+    POST /correction  {"session_id", "answer", "question"?}
+    GET  /history?session_id=...&limit=20
+    GET  /health
+"""
+import asyncio
+import json
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from ai_engine import AIEngine
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_MAX_IN_FLIGHT, SERVER_MAX_WEB_IN_FLIGHT,
+    SERVER_DB_WORKERS, SERVER_WEB_WORKERS, SERVER_MAX_BODY_BYTES, SERVER_KEEPALIVE_TIMEOUT
+)
+from database import Database
+from gemini_engine import StubGeminiEngine
+from utils import setup_logging, stop_on_sigterm
+
+logger = logging.getLogger('OfficeAI')
+
+
+class HTTPError(Exception):
+    """Error que se devuelve al cliente con su código HTTP"""
+
+    def __init__(self, status: HTTPStatus, message: str, headers: Tuple[Tuple[str, str], ...] = ()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+def _saturated(what: str) -> HTTPError:
+    return HTTPError(HTTPStatus.TOO_MANY_REQUESTS, f"Servidor saturado ({what}), reintenta en unos segundos",
+                     (("Retry-After", "1"),))
+
+
+def _required(body: Dict, field: str) -> str:
+    value = body.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Falta el campo '{field}'")
+    return value.strip()
+
+
+class OfficeAIServer:
+    """Servidor HTTP/1.1 (con keep-alive) delante de un AIEngine compartido por todas las sesiones"""
+
+    def __init__(self, ai, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                 max_in_flight: int = SERVER_MAX_IN_FLIGHT, max_web_in_flight: int = SERVER_MAX_WEB_IN_FLIGHT,
+                 db_workers: int = SERVER_DB_WORKERS, web_workers: int = SERVER_WEB_WORKERS):
+        self.ai = ai
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.max_web_in_flight = max_web_in_flight
+        self.db_executor = ThreadPoolExecutor(db_workers, thread_name_prefix='officeai-db')
+        self.web_executor = ThreadPoolExecutor(web_workers, thread_name_prefix='officeai-web')
+        self.in_flight = 0
+        self.web_in_flight = 0
+        self.rejected = 0
+        self.served = 0
+        # Una petición a la vez por sesión: el estado de Session no es seguro entre hilos
+        self._session_locks = weakref.WeakValueDictionary()
+        self._routes = {
+            ('POST', '/ask'): self._ask,
+            ('POST', '/feedback'): self._feedback,
+            ('POST', '/correction'): self._correction,
+            ('GET', '/history'): self._history,
+            ('GET', '/health'): self._health,
+        }
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # Puerto real si se pidió el 0
+        logger.info(f"Servidor HTTP escuchando en http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def shutdown(self):
+        """Espera a que terminen los trabajos en curso de los pools"""
+        self.db_executor.shutdown(wait=True)
+        self.web_executor.shutdown(wait=True)
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+
+    async def _run(self, executor, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args))
+
+    # --- Protocolo HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), SERVER_KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    await self._write_response(writer, e.status, {'error': e.message}, False, e.headers)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body, keep_alive = request
+                status, payload, extra_headers = await self._dispatch(method, path, query, body)
+                await self._write_response(writer, status, payload, keep_alive, extra_headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """(método, ruta, query, cabeceras, cuerpo, keep-alive) o None si el cliente cerró"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Cabeceras demasiado grandes")
+
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Petición HTTP mal formada")
+        if 'transfer-encoding' in headers:
+            # Sin soporte de cuerpos por trozos: leer solo Content-Length perdería el cuerpo
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Transfer-Encoding no soportado, envía Content-Length")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length no válido")
+        if length > SERVER_MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Cuerpo demasiado grande")
+        raw_body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers, raw_body, keep_alive
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload,
+                              keep_alive: bool, extra_headers=()):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            *(f"{name}: {value}" for name, value in extra_headers),
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, query: Dict[str, str], raw_body: bytes):
+        """Ejecuta el endpoint con control de admisión; devuelve (estado, payload, cabeceras extra)"""
+        handler = self._routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self._routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Método no permitido"}, ()
+            return HTTPStatus.NOT_FOUND, {'error': "Ruta no encontrada"}, ()
+
+        admitted = path != '/health'  # La salud se responde siempre, aunque haya saturación
+        if admitted:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                error = _saturated("peticiones en curso")
+                return error.status, {'error': error.message}, error.headers
+            self.in_flight += 1
+        try:
+            body = {}
+            if raw_body:
+                try:
+                    body = json.loads(raw_body)
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "El cuerpo no es JSON válido")
+                if not isinstance(body, dict):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "El cuerpo debe ser un objeto JSON")
+            payload = await handler(body if method == 'POST' else query)
+            self.served += 1
+            return HTTPStatus.OK, payload, ()
+        except HTTPError as e:
+            if e.status == HTTPStatus.TOO_MANY_REQUESTS:
+                self.rejected += 1
+            return e.status, {'error': e.message}, e.headers
+        except Exception as e:
+            logger.exception(f"Error atendiendo {method} {path}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Error interno"}, ()
+        finally:
+            if admitted:
+                self.in_flight -= 1
+
+    # --- Endpoints ---
+
+    def _ask_local(self, session_id: str, question: str):
+        session = self.ai.sessions.get(session_id)
+        answer, source = self.ai.process_question(question, session)
+        if source in ('local', 'conversational'):
+            self.ai.add_to_context(question, answer, session)
+        return session, answer, source
+
+    async def _ask(self, body: Dict) -> Dict:
+        session_id, question = _required(body, 'session_id'), _required(body, 'question')
+        async with self._session_lock(session_id):
+            session, answer, source = await self._run(self.db_executor, self._ask_local, session_id, question)
+            response = {'session_id': session_id, 'source': source, 'answer': None, 'options': [], 'sources': []}
+
+            if source == 'local_multi':
+                response['options'] = [option['answer'] for option in answer]
+            elif source == 'unknown' and self.ai.gemini_engine is not None:
+                if self.web_in_flight >= self.max_web_in_flight:
+                    raise _saturated("búsquedas web en curso")
+                self.web_in_flight += 1
+                try:
+                    answer, sources = await self._run(self.web_executor, self.ai.search_web_and_process,
+                                                      question, session)
+                finally:
+                    self.web_in_flight -= 1
+                if answer:
+                    self.ai.add_to_context(question, answer, session)
+                    # 'gemini' o, si la web no respondió a tiempo, 'local_fallback'
+                    response.update(source=session.last_source, answer=answer, sources=sources or [])
+            elif source != 'unknown':
+                response['answer'] = answer
+            return response
+
+    def _feedback_sync(self, session_id: str, question: str, answer: str, correct: bool, skip: bool):
+        session = self.ai.sessions.get(session_id)
+        if skip:
+            self.ai.skip_question_feedback(question, session)
+            return
+        self.ai.handle_answer_selection(question, answer, is_correct=correct)
+        if correct:
+            self.ai.add_to_context(question, answer, session)
+
+    async def _feedback(self, body: Dict) -> Dict:
+        session_id, question = _required(body, 'session_id'), _required(body, 'question')
+        skip = bool(body.get('skip', False))
+        answer = body.get('answer') if skip else _required(body, 'answer')
+        correct = body.get('correct')
+        if not skip and not isinstance(correct, bool):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "El campo 'correct' debe ser true o false")
+        async with self._session_lock(session_id):
+            await self._run(self.db_executor, self._feedback_sync, session_id, question, answer, correct, skip)
+        return {'session_id': session_id, 'ok': True}
+
+    def _correction_sync(self, session_id: str, answer: str, question: Optional[str]) -> bool:
+        session = self.ai.sessions.get(session_id)
+        # Como el comando 1001 de la consola: olvidar lo aprendido de la web antes de corregir
+        if session.last_learned_id:
+            self.ai.forget_last_interaction(session)
+        return self.ai.handle_user_correction(answer, question, session)
+
+    async def _correction(self, body: Dict) -> Dict:
+        session_id, answer = _required(body, 'session_id'), _required(body, 'answer')
+        question = body.get('question') or None
+        async with self._session_lock(session_id):
+            learned = await self._run(self.db_executor, self._correction_sync, session_id, answer, question)
+        if not learned:
+            raise HTTPError(HTTPStatus.CONFLICT, "No hay pregunta previa que corregir en esta sesión")
+        return {'session_id': session_id, 'ok': True}
+
+    async def _history(self, query: Dict) -> Dict:
+        session_id = _required(query, 'session_id')
+        try:
+            limit = max(1, min(int(query.get('limit', 20)), 100))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "El parámetro 'limit' debe ser un entero")
+        async with self._session_lock(session_id):
+            session = await self._run(self.db_executor, self.ai.sessions.get, session_id)
+            return {'session_id': session_id, 'history': session.conversation_context[-limit:]}
+
+    async def _health(self, query: Dict) -> Dict:
+        return {
+            'status': 'ok',
+            'in_flight': self.in_flight,
+            'web_in_flight': self.web_in_flight,
+            'served': self.served,
+            'rejected': self.rejected,
+            'sessions': self.ai.sessions.stats(),
+        }
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, db_path: Optional[str] = None,
+          stub_gemini: bool = False):
+    """Arranca el servidor hasta Ctrl+C (modo run.py --serve)"""
+    setup_logging()
+    db = Database(db_path) if db_path else Database()
+    ai = AIEngine(db)
+    if stub_gemini:
+        ai.gemini_engine = StubGeminiEngine()
+
+    server = OfficeAIServer(ai, host, port)
+    stop_on_sigterm()  # Parada ordenada también como servicio
+    print(f"OfficeAI sirviendo en http://{host}:{port} (Ctrl+C para parar)")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        db.close()
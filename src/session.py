@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Sesiones de conversación para OfficeAI
+Cada usuario tiene su propio estado (última pregunta, contexto, preguntas
+sin feedback...) para que un único AIEngine, con sus cachés y conexiones
+compartidas, atienda muchas conversaciones a la vez
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Optional, Set
+
+
+class Session:
+    """Estado conversacional de un usuario"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.last_question = None
+        self.last_answer = None
+        self.last_source = None
+        self.last_learned_id = None  # ID de la última entrada aprendida
+        self.conversation_context: List[Dict] = []  # Últimas interacciones para contexto
+        self.skipped_questions: Set[str] = set()  # Preguntas que no quieren ser evaluadas en esta sesión
+        self.last_seen = time.time()
+
+    def touch(self):
+        """Marca la sesión como usada ahora"""
+        self.last_seen = time.time()
+
+    def to_json(self) -> str:
+        """Estado serializado para persistirlo"""
+        return json.dumps({
+            'last_question': self.last_question,
+            'last_answer': self.last_answer,
+            'last_source': self.last_source,
+            'last_learned_id': self.last_learned_id,
+            'conversation_context': self.conversation_context,
+            'skipped_questions': sorted(self.skipped_questions),
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, session_id: str, state: str, last_seen: float) -> 'Session':
+        data = json.loads(state)
+        session = cls(session_id)
+        session.last_question = data.get('last_question')
+        session.last_answer = data.get('last_answer')
+        session.last_source = data.get('last_source')
+        session.last_learned_id = data.get('last_learned_id')
+        session.conversation_context = data.get('conversation_context', [])
+        session.skipped_questions = set(data.get('skipped_questions', []))
+        session.last_seen = last_seen
+        return session
+
+
+class SessionStore:
+    """
+    Sesiones activas indexadas por id, acotadas (se expulsa la usada hace más
+    tiempo) y con caducidad por inactividad
+
+    Con database, las sesiones expulsadas por el tope se guardan en SQLite y
+    se recuperan si el usuario vuelve antes de que caduquen
+    """
+
+    def __init__(self, max_sessions: int, idle_ttl: float, database=None):
+        """
+        Args:
+            max_sessions: Sesiones que se mantienen en memoria
+            idle_ttl: Segundos de inactividad tras los que una sesión caduca
+            database: Database donde persistir las sesiones (None: solo en memoria)
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.db = database
+        self._sessions = OrderedDict()  # id -> Session, de menos a más reciente
+        self._saving: Dict[str, Session] = {}  # Expulsadas cuya escritura aún no se ha confirmado
+        self._saves = 0  # Guardados confirmados (detecta lecturas de la DB desfasadas en get)
+        self._lock = threading.RLock()  # Reentrante: sin cola diferida on_commit se llama dentro de _persist
+        self.created = 0
+        self.restored = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._closed = False
+        if self.db is not None:
+            self.db.purge_sessions(time.time() - idle_ttl)
+            self.db.add_close_callback(self.close)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return now - session.last_seen > self.idle_ttl
+
+    def get(self, session_id: str) -> Session:
+        """Sesión con ese id (recuperada de SQLite o nueva si no existe o caducó), marcada como usada"""
+        now = time.time()
+        while True:
+            with self._lock:
+                session = self._in_memory(session_id, now)
+                if session is None and self.db is None:
+                    session = Session(session_id)
+                    self.created += 1
+                if session is not None:
+                    return self._activate(session, now)
+                saves = self._saves
+            # Consulta a SQLite fuera del cerrojo: no frena las peticiones de las demás sesiones
+            row = self.db.load_session(session_id, now - self.idle_ttl)
+            with self._lock:
+                session = self._in_memory(session_id, now)  # Otro hilo pudo traerla entretanto
+                if session is None:
+                    if self._saves != saves:
+                        continue  # Se confirmó un guardado mientras tanto: la fila leída puede estar desfasada
+                    if row is not None:
+                        session = Session.from_json(session_id, *row)
+                        self.restored += 1
+                    else:
+                        session = Session(session_id)
+                        self.created += 1
+                return self._activate(session, now)
+
+    def _in_memory(self, session_id: str, now: float) -> Optional[Session]:
+        """Sesión activa o pendiente de guardar, si no ha caducado (llamar con _lock tomado)"""
+        session = self._sessions.get(session_id) or self._saving.get(session_id)
+        if session is not None and self._expired(session, now):
+            # Su fila en la DB, si llega a escribirse, tampoco se recuperará por estar caducada
+            self._sessions.pop(session_id, None)
+            self._saving.pop(session_id, None)
+            self.expirations += 1
+            session = None
+        return session
+
+    def _activate(self, session: Session, now: float) -> Session:
+        """Marca la sesión como la más reciente y aplica caducidad y tope (llamar con _lock tomado)"""
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        session.touch()
+        self._drop_expired(now)
+        self._evict_overflow()
+        return session
+
+    def _drop_expired(self, now: float):
+        """Descarta las sesiones caducadas (están al principio por ser las menos recientes)"""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if not self._expired(session, now):
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def _evict_overflow(self):
+        """Expulsa las sesiones menos recientes por encima del tope, guardándolas si hay DB"""
+        evicted = []
+        while len(self._sessions) > self.max_sessions:
+            evicted.append(self._sessions.popitem(last=False)[1])
+            self.evictions += 1
+        if evicted and self.db is not None:
+            self._persist(evicted)
+
+    def _persist(self, sessions: List[Session]):
+        for session in sessions:
+            self._saving[session.session_id] = session
+        self.db.save_sessions(
+            [(session.session_id, session.to_json(), session.last_seen) for session in sessions],
+            on_commit=partial(self._saved, sessions)
+        )
+
+    def _saved(self, sessions: List[Session]):
+        """La escritura se confirmó: ya se pueden recuperar de la DB"""
+        with self._lock:
+            self._saves += 1
+            for session in sessions:
+                if self._saving.get(session.session_id) is session:
+                    del self._saving[session.session_id]
+
+    def discard(self, session_id: str):
+        """Termina una sesión (también su copia persistida)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._saving.pop(session_id, None)
+        if self.db is not None:
+            self.db.delete_sessions(session_id)
+
+    def save_all(self):
+        """Guarda todas las sesiones activas (p. ej. antes de reiniciar el proceso)"""
+        if self.db is None:
+            return
+        with self._lock:
+            self._drop_expired(time.time())
+            sessions = list(self._sessions.values())
+            if sessions:
+                self._persist(sessions)
+
+    def close(self):
+        """Guarda las sesiones activas (se llama al cerrar la Database)"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.save_all()
+        except (RuntimeError, sqlite3.Error) as e:
+            print(f"[ERROR] No se pudieron guardar las sesiones: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Métricas acumuladas del almacén de sesiones"""
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'created': self.created,
+                'restored': self.restored,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
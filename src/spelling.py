@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Corrector ortográfico estilo SymSpell para OfficeAI
+Precalcula las variantes por borrado de cada palabra del vocabulario para
+corregir erratas ("powerpiont", "tabal", "buscarb") en tiempo casi constante
+"""
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from text_normalizer import normalize
+
+_MAX_MEMOIZED = 10000  # Tope del memo de correcciones
+
+
+def osa_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Distancia de Damerau-Levenshtein restringida (OSA): inserción, borrado,
+    sustitución y transposición de letras adyacentes. Devuelve max_distance + 1
+    en cuanto se sabe que la supera.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class SpellingCorrector:
+    """Índice de borrados (SymSpell) sobre el vocabulario de un conjunto de textos con id"""
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7):
+        """
+        Args:
+            max_distance: Distancia de edición máxima que se corrige
+            prefix_length: Solo se indexan borrados del prefijo de esta longitud (SymSpell)
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._lock = threading.Lock()
+        self._texts: Dict[int, Set[str]] = {}    # id -> palabras que aporta
+        self._counts: Dict[str, int] = {}        # palabra -> textos en los que aparece
+        self._deletes: Dict[str, Set[str]] = {}
+        self._corrections: Dict[str, str] = {}  # Memo de correcciones; se vacía al cambiar el vocabulario
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._counts
+
+    def allowed_distance(self, word: str) -> int:
+        """Errores tolerados según la longitud: ninguno hasta 3 letras, 1 hasta 5, después el máximo"""
+        if len(word) <= 3 or not word.isalpha():
+            return 0
+        if len(word) <= 5:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def _edits(self, word: str, distance: int) -> Set[str]:
+        """Variantes del prefijo de la palabra con hasta distance borrados (incluida ella)"""
+        prefix = word[:self.prefix_length]
+        variants = {prefix}
+        frontier = {prefix}
+        for _ in range(distance):
+            frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+            variants |= frontier
+        return variants
+
+    def _add_words(self, words: Iterable[str]):
+        for word in words:
+            count = self._counts.get(word, 0)
+            self._counts[word] = count + 1
+            if count == 0:
+                for variant in self._edits(word, self.max_distance):
+                    self._deletes.setdefault(variant, set()).add(word)
+
+    def _remove_words(self, words: Iterable[str]):
+        for word in words:
+            count = self._counts.get(word, 0)
+            if count > 1:
+                self._counts[word] = count - 1
+            elif count == 1:
+                del self._counts[word]
+                for variant in self._edits(word, self.max_distance):
+                    candidates = self._deletes.get(variant)
+                    if candidates is not None:
+                        candidates.discard(word)
+                        if not candidates:
+                            del self._deletes[variant]
+
+    def add_many(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """Añade las palabras de (id, texto normalizado); los ids ya indexados se ignoran"""
+        added = 0
+        with self._lock:
+            for item_id, text in entries:
+                if item_id in self._texts:
+                    continue
+                words = set(normalize(text).tokens)
+                self._texts[item_id] = words
+                self._add_words(words)
+                added += 1
+            if added:
+                self._corrections.clear()
+        return added
+
+    def add(self, item_id: int, text: str) -> bool:
+        return self.add_many([(item_id, text)]) == 1
+
+    def remove(self, item_id: int) -> bool:
+        """Quita las palabras de un id; las que ya no aparecen en ningún texto salen del vocabulario"""
+        with self._lock:
+            words = self._texts.pop(item_id, None)
+            if words is None:
+                return False
+            self._remove_words(words)
+            self._corrections.clear()
+            return True
+
+    def rebuild(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """Sustituye todo el vocabulario"""
+        with self._lock:
+            self._texts.clear()
+            self._counts.clear()
+            self._deletes.clear()
+            self._corrections.clear()
+        return self.add_many(entries)
+
+    def correct_word(self, word: str) -> str:
+        """La palabra del vocabulario más cercana (y más frecuente en empate), o la propia palabra"""
+        with self._lock:
+            if word in self._counts:
+                return word
+            cached = self._corrections.get(word)
+            if cached is not None:
+                return cached
+
+            max_distance = self.allowed_distance(word)
+            best: Optional[str] = None
+            best_key = None
+            if max_distance:
+                candidates = set()
+                for variant in self._edits(word, max_distance):
+                    candidates |= self._deletes.get(variant, set())
+                for candidate in candidates:
+                    distance = osa_distance(word, candidate, max_distance)
+                    if distance > max_distance:
+                        continue
+                    key = (distance, -self._counts[candidate], candidate)
+                    if best_key is None or key < best_key:
+                        best, best_key = candidate, key
+
+            correction = best or word
+            if len(self._corrections) >= _MAX_MEMOIZED:
+                self._corrections.clear()
+            self._corrections[word] = correction
+            return correction
+
+    def correct(self, text: str) -> str:
+        """Texto normalizado con cada palabra corregida"""
+        return " ".join(self.correct_word(token) for token in normalize(text).tokens)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Normalizador de texto compartido para OfficeAI
+Calcula en una sola pasada (y memoriza) las formas que usan la base de datos,
+el motor de IA y el motor de conversación
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+from config import NORMALIZER_CACHE_SIZE
+
+
+class NormalizedText(NamedTuple):
+    """Formas normalizadas de un texto"""
+    folded: str               # Minúsculas y sin acentos; conserva la puntuación
+    normalized: str           # Solo [a-z0-9] y espacios simples (clave de búsqueda en la DB)
+    tokens: Tuple[str, ...]   # Palabras de la forma normalizada
+
+
+_FOLD_TABLE_LIMIT = 0x2000  # La tabla cubre U+0080..U+1FFF; el resto va por el camino lento
+
+
+def _strip_marks(text: str) -> str:
+    """Elimina las marcas diacríticas vía NFD (camino lento, carácter a carácter)"""
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _build_fold_table() -> dict:
+    """Tabla de traducción precalculada para los bloques latinos, griegos y cirílicos"""
+    table = {}
+    for code in range(0x80, _FOLD_TABLE_LIMIT):
+        char = chr(code)
+        if unicodedata.category(char) == "Mn":
+            table[code] = None
+            continue
+        stripped = _strip_marks(char)
+        if stripped != char:
+            table[code] = stripped
+    return table
+
+
+_FOLD_TABLE = str.maketrans(_build_fold_table())
+_BEYOND_FOLD_TABLE = re.compile("[\u2000-\U0010ffff]")
+_NON_ALNUM = re.compile(r"[^a-z0-9\s]")
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def normalize(text: str) -> NormalizedText:
+    """Normaliza un texto una sola vez; las llamadas repetidas salen de la caché LRU"""
+    folded = text.lower().translate(_FOLD_TABLE)
+    if _BEYOND_FOLD_TABLE.search(folded):
+        folded = _strip_marks(folded)
+    folded = folded.strip()
+
+    tokens = tuple(_NON_ALNUM.sub("", folded).split())
+    return NormalizedText(folded, " ".join(tokens), tokens)
@@ -4,10 +4,30 @@ Módulo de utilidades para OfficeAI
 Funciones auxiliares, logging y helpers
 """
 import logging
+import signal
 from logging.handlers import RotatingFileHandler
 from typing import Dict
 
-from config import LOGS_DIR, LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from config import LOGS_DIR, LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, BAD_ANSWER_PHRASES, BAD_ANSWER_MIN_WORDS
+
+
+def is_bad_answer(answer: str) -> bool:
+    """Verifica si una respuesta es de baja calidad"""
+    if len(answer.split()) < BAD_ANSWER_MIN_WORDS:
+        return True
+    
+    lower = answer.lower()
+    return any(phrase in lower for phrase in BAD_ANSWER_PHRASES)
+
+
+def _raise_interrupt(signum, frame):
+    signal.signal(signum, signal.SIG_IGN)  # Una sola parada aunque la señal se repita
+    raise KeyboardInterrupt
+
+
+def stop_on_sigterm():
+    """Trata SIGTERM como Ctrl+C, para que los modos de servicio y por lotes paren en orden"""
+    signal.signal(signal.SIGTERM, _raise_interrupt)
 
 
 def setup_logging() -> logging.Logger:
@@ -74,6 +94,12 @@ def print_stats(stats: Dict):
     
     print(f"\n💬 INTERACCIONES:")
     print(f"   Total de conversaciones: {stats.get('total_interactions', 0)}")
+    by_source = stats.get('interactions_by_source', {})
+    for source, count in sorted(by_source.items(), key=lambda item: item[1], reverse=True):
+        print(f"     - {source}: {count}")
+    by_day = stats.get('interactions_by_day', {})
+    if by_day:
+        print("   Últimos días: " + ", ".join(f"{day}: {count}" for day, count in sorted(by_day.items())))
     
     print(f"\n🌐 BÚSQUEDAS WEB:")
     print(f"   Búsquedas realizadas: {stats.get('total_searches', 0)}")
@@ -81,4 +107,30 @@ def print_stats(stats: Dict):
     print(f"   Tasa de caché: {stats.get('cache_hit_rate', 0):.1f}%")
     print(f"   Búsquedas cacheadas: {stats.get('cached_searches', 0)}")
     
+    answer_cache = stats.get('answer_cache')
+    if answer_cache:
+        print(f"\n⚡ CACHÉ DE RESPUESTAS:")
+        print(f"   Preguntas en caché: {answer_cache['size']}/{answer_cache['max_entries']}")
+        print(f"   Hits: {answer_cache['hits']} | Fallos: {answer_cache['misses']} | Expulsiones: {answer_cache['evictions']}")
+        print(f"   Tasa de aciertos: {answer_cache['hit_rate']:.1f}%")
+    
+    limiter = (stats.get('gemini') or {}).get('rate_limiter')
+    if limiter:
+        print(f"\n🚦 CUOTA DE GEMINI:")
+        print(f"   Disponibles: {limiter['tokens']['minute']:.0f} este minuto | {limiter['tokens']['day']:.0f} hoy")
+        print(f"   Concedidas: {limiter['granted']} | Rechazadas: {limiter['rejected']} | 429 recibidos: {limiter['throttled']}")
+        print(f"   Espera media: {limiter['avg_wait_seconds']:.2f}s")
+    
+    variants = (stats.get('gemini') or {}).get('variants')
+    if variants:
+        print(f"\n🔌 MODELOS DE GEMINI:")
+        for name, variant in variants.items():
+            latency = f"p50 {variant['p50_ms']} ms | p95 {variant['p95_ms']} ms" if variant['p50_ms'] is not None else "sin datos"
+            print(f"   {name} ({variant['model']}): {variant['state']} | {variant['calls']} llamadas, "
+                  f"{variant['failures']} fallos | {latency}")
+    hedging = (stats.get('gemini') or {}).get('hedging')
+    if hedging:
+        print(f"   Coberturas lanzadas: {hedging['hedges']} (ganadas: {hedging['hedge_wins']}) | "
+              f"Plazos vencidos: {hedging['deadlines_exceeded']}")
+    
     print("\n" + "="*80)
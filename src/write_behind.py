@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Cola de escritura diferida (write-behind) para OfficeAI
+Saca las escrituras pequeñas (historial, Q-values, selecciones) del camino
+de respuesta y las confirma en lotes desde un hilo de fondo
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger('OfficeAI')
+
+_STOP = object()  # Marca de parada del hilo escritor
+
+
+class _Flush:
+    """Marca de flush(): cierra el lote actual sin esperar al temporizador y avisa al confirmarlo"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindQueue:
+    """Hilo escritor que aplica mutaciones encoladas con commit agrupado"""
+
+    def __init__(self, transaction: Callable, batch_size: int = 64, flush_interval: float = 0.2):
+        """
+        Args:
+            transaction: Fábrica de context managers que entrega una conexión y hace
+                commit al salir (p. ej. Database._get_connection)
+            batch_size: Máximo de mutaciones por transacción
+            flush_interval: Segundos que se espera a completar un lote antes de confirmarlo
+        """
+        self._transaction = transaction
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # Ninguna marca de flush puede quedar detrás de _STOP
+        self._thread = threading.Thread(target=self._run, name="OfficeAI-WriteBehind", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: Callable, *args, on_commit: Optional[Callable] = None):
+        """
+        Encola operation(cursor, *args) para ejecutarla en el próximo lote
+        
+        on_commit se llama sin argumentos, desde el hilo escritor, una vez confirmada la operación
+        """
+        if self._closed:
+            raise RuntimeError("La cola de escritura diferida está cerrada")
+        self._queue.put((operation, args, on_commit))
+
+    def flush(self):
+        """
+        Bloquea hasta que las mutaciones encoladas antes de la llamada estén confirmadas
+        
+        Solo espera a su propia marca, así que no la retrasan las escrituras que otros hilos
+        sigan encolando. Desde el hilo escritor (p. ej. en un on_commit) no espera: lo anterior
+        ya está confirmado o en el lote en curso, y esperar a ese lote no terminaría nunca.
+        """
+        if threading.current_thread() is self._thread:
+            return
+        marker = _Flush()
+        with self._lock:
+            if self._closed:
+                return
+            self._queue.put(marker)
+        marker.done.wait()
+
+    def close(self):
+        """Confirma lo pendiente y detiene el hilo escritor"""
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            self._queue.put(_STOP)
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            while not self._is_marker(batch[-1]) and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            operations = [item for item in batch if not self._is_marker(item)]
+            try:
+                if operations:
+                    self._apply(operations)
+            finally:
+                for item in batch:
+                    if isinstance(item, _Flush):
+                        item.done.set()
+
+            if batch[-1] is _STOP:
+                return
+
+    @staticmethod
+    def _is_marker(item) -> bool:
+        return item is _STOP or isinstance(item, _Flush)
+
+    def _apply(self, operations):
+        """Aplica un lote en una sola transacción; si falla, reintenta una a una"""
+        try:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                for operation, args, _ in operations:
+                    operation(cursor, *args)
+        except Exception as e:
+            logger.warning(f"Lote de escritura diferida falló, reintentando individualmente: {e}")
+        else:
+            for _, _, on_commit in operations:
+                self._notify(on_commit)
+            return
+
+        for operation, args, on_commit in operations:
+            try:
+                with self._transaction() as conn:
+                    operation(conn.cursor(), *args)
+            except Exception as e:
+                logger.error(f"Escritura diferida descartada ({operation.__name__}): {e}")
+                continue
+            self._notify(on_commit)
+
+    @staticmethod
+    def _notify(on_commit: Optional[Callable]):
+        if on_commit is None:
+            return
+        try:
+            on_commit()
+        except Exception as e:
+            logger.error(f"Callback posterior al commit falló: {e}")
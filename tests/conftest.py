@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Configuración común de las pruebas: los módulos de src/ se importan sin paquete, como en run.py"""
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SHIPPED_DB = ROOT / "data" / "office_ai.db"
+
+sys.path.insert(0, str(ROOT / "src"))
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def shipped_db_path(tmp_path):
+    """Ruta a una copia, sin abrir, de la base de conocimiento que se distribuye con el proyecto"""
+    path = tmp_path / "office_ai.db"
+    shutil.copy(SHIPPED_DB, path)
+    return str(path)
+
+
+@pytest.fixture
+def shipped_db(shipped_db_path):
+    """Copia de la base de conocimiento que se distribuye con el proyecto (sin escritura diferida)"""
+    database = Database(shipped_db_path, write_behind=False)
+    yield database
+    database.close()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del respaldo NDJSON (export_ndjson / import_ndjson)"""
+import json
+import sqlite3
+
+import pytest
+
+from database import Database
+
+
+def snapshot(db):
+    """Conocimiento, Q-values e historial comparables entre dos bases (sin ids)"""
+    with sqlite3.connect(db.db_path) as conn:
+        knowledge = set(conn.execute("""
+            SELECT q.normalized, k.question_original, k.answer, k.topic
+            FROM knowledge k JOIN questions q ON q.id = k.question_id
+        """))
+        q_values = set(conn.execute("""
+            SELECT q.normalized, k.answer, v.q_value, v.times_selected, v.times_correct, v.times_incorrect
+            FROM q_values v
+            JOIN knowledge k ON k.id = v.knowledge_id
+            JOIN questions q ON q.id = k.question_id
+        """))
+        history = conn.execute("""
+            SELECT question, answer, source, was_correct, timestamp FROM history ORDER BY id
+        """).fetchall()
+    return knowledge, q_values, history
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    database = Database(str(tmp_path / "restaurada.db"), write_behind=False)
+    yield database
+    database.close()
+
+
+@pytest.mark.parametrize('filename', ["respaldo.ndjson", "respaldo.ndjson.gz"])
+def test_export_and_import_round_trip(shipped_db, empty_db, tmp_path, filename):
+    shipped_db.add_to_history("¿Qué es Excel?", "Una hoja de cálculo", 'local', was_correct=True)
+    path = str(tmp_path / filename)
+
+    exported = shipped_db.export_ndjson(path)
+    imported = empty_db.import_ndjson(path, batch_size=7)
+
+    knowledge, q_values, history = snapshot(shipped_db)
+    restored_knowledge, restored_q_values, restored_history = snapshot(empty_db)
+    assert exported['knowledge'] == len(knowledge)
+    assert imported['knowledge'] + imported['duplicates'] == len(knowledge)
+    assert knowledge <= restored_knowledge  # La base nueva ya traía los datos iniciales
+    assert q_values <= restored_q_values
+    assert restored_history == history
+
+
+def test_restored_questions_reach_the_in_memory_indexes(shipped_db, empty_db, tmp_path):
+    path = str(tmp_path / "respaldo.ndjson")
+    shipped_db.add_knowledge("como afinar una guitarra electrica", "Con un afinador cromático.", 'general')
+    shipped_db.export_ndjson(path)
+
+    empty_db.import_ndjson(path)
+
+    assert empty_db.correct_spelling("guitara") == "guitarra"
+    assert empty_db.search_semantic("como afinar la guitarra electrica")
+    assert empty_db.local_match_bound("afinar guitarra electrica") == 1.0
+
+
+def test_failed_import_applies_nothing(empty_db, tmp_path):
+    path = tmp_path / "respaldo.ndjson"
+    records = [
+        {'type': 'header', 'format': Database.EXPORT_FORMAT, 'version': Database.EXPORT_VERSION},
+        {'type': 'knowledge', 'question_original': "¿Cómo afinar una guitarra?", 'answer': "Con un afinador.",
+         'topic': 'general'},
+        {'type': 'desconocido'},
+    ]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding='utf-8')
+    before = snapshot(empty_db)
+    indexed = len(empty_db.semantic_index)
+
+    assert empty_db.import_ndjson(str(path), batch_size=1) is None
+
+    assert snapshot(empty_db) == before
+    # Los índices en memoria no ven la pregunta deshecha
+    assert len(empty_db.semantic_index) == indexed
+    assert "guitarra" not in empty_db.speller
+
+
+def test_import_rejects_an_unknown_format(empty_db, tmp_path):
+    path = tmp_path / "respaldo.ndjson"
+    path.write_text(json.dumps({'type': 'header', 'format': "otro", 'version': 1}) + "\n", encoding='utf-8')
+
+    assert empty_db.import_ndjson(str(path)) is None
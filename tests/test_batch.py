@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del modo por lotes: orden de salida, reanudación y reintento de los fallos"""
+import json
+
+import pytest
+
+from batch import BatchRunner, completed_ids, id_key
+
+
+class FakeAI:
+    """Sustituto de AIEngine: responde en local salvo las preguntas marcadas como fallidas"""
+
+    gemini_engine = None
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.asked = []
+
+    def process_question(self, question, session):
+        self.asked.append(question)
+        if question in self.failing:
+            raise RuntimeError("fallo provocado")
+        return f"respuesta a {question}", 'local'
+
+
+def write_lines(path, *lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding='utf-8')
+
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / "entrada.jsonl", tmp_path / "salida.jsonl"
+
+
+def run(ai, input_path, output_path):
+    return BatchRunner(ai, workers=2, web_concurrency=1, window=4).run(str(input_path), str(output_path))
+
+
+def test_results_are_written_in_input_order(paths):
+    input_path, output_path = paths
+    write_lines(input_path, *(json.dumps({'id': i, 'question': f"pregunta {i}"}) for i in range(10)))
+
+    counts = run(FakeAI(), input_path, output_path)
+
+    assert [result['id'] for result in read_results(output_path)] == list(range(10))
+    assert counts['processed'] == 10 and counts['local'] == 10
+
+
+def test_resume_skips_completed_ids(paths):
+    input_path, output_path = paths
+    write_lines(input_path, '{"id": "a", "question": "primera"}', '{"id": ["b", 1], "question": "segunda"}')
+    write_lines(output_path, json.dumps({'id': "a", 'question': "primera", 'answer': "hecha", 'source': 'local'}))
+    ai = FakeAI()
+
+    counts = run(ai, input_path, output_path)
+
+    assert ai.asked == ["segunda"]
+    assert counts['skipped'] == 1
+    assert [result['id'] for result in read_results(output_path)] == ["a", ["b", 1]]
+
+
+def test_invalid_lines_are_reported_and_not_retried(paths):
+    input_path, output_path = paths
+    write_lines(input_path, '{"id": 1, "question": "valida"}', 'no es json', '{"id": 3}', '"solo texto"')
+
+    counts = run(FakeAI(), input_path, output_path)
+    results = read_results(output_path)
+
+    assert [(result['id'], result['source']) for result in results] == [
+        (1, 'local'), (2, 'invalid'), (3, 'invalid'), (4, 'local')
+    ]
+    assert results[1]['error'] == "Línea JSON no válida"
+    assert results[2]['error'] == "Falta el campo 'question'"
+    assert counts['errors'] == 2
+
+    ai = FakeAI()
+    assert run(ai, input_path, output_path)['skipped'] == 4
+    assert ai.asked == []
+
+
+def test_errored_items_are_retried_on_resume(paths):
+    input_path, output_path = paths
+    write_lines(input_path, '{"id": 1, "question": "bien"}', '{"id": 2, "question": "mal"}')
+
+    counts = run(FakeAI(failing={"mal"}), input_path, output_path)
+    assert counts['errors'] == 1
+    assert read_results(output_path)[1]['source'] == 'error'
+
+    ai = FakeAI()
+    counts = run(ai, input_path, output_path)
+
+    assert ai.asked == ["mal"]
+    assert counts['skipped'] == 1
+    assert [(result['id'], result['source']) for result in read_results(output_path)] == [(1, 'local'), (2, 'local')]
+
+
+def test_completed_ids_drops_a_half_written_last_line(paths):
+    _, output_path = paths
+    output_path.write_text('{"id": 1, "source": "local"}\n{"id": 2, "sou', encoding='utf-8')
+
+    assert completed_ids(str(output_path)) == {id_key(1)}
+    assert output_path.read_text(encoding='utf-8') == '{"id": 1, "source": "local"}\n'
+
+
+def test_id_key_distinguishes_json_types():
+    assert id_key(1) != id_key("1")
+    assert id_key({'b': 1, 'a': 2}) == id_key({'a': 2, 'b': 1})
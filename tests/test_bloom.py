@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del filtro de Bloom y de la cota local_match_bound que evita consultas SQL inútiles"""
+import random
+import sqlite3
+
+import pytest
+
+from bloom import BloomFilter
+from config import FTS_MIN_COVERAGE, FUZZY_CUTOFF, LOCAL_FALLBACK_FTS_COVERAGE, LOCAL_FALLBACK_FUZZY_CUTOFF
+from database import Database
+
+
+def test_added_keys_are_always_found():
+    bloom = BloomFilter(500, 0.01)
+    keys = [f"palabra{i}" for i in range(500)]
+    bloom.add_many(keys)
+
+    assert all(key in bloom for key in keys)
+    assert not bloom.saturated
+
+
+def test_false_positive_rate_stays_near_the_target():
+    bloom = BloomFilter(1000, 0.01)
+    bloom.add_many(f"conocida{i}" for i in range(1000))
+
+    false_positives = sum(f"desconocida{i}" in bloom for i in range(5000))
+
+    assert false_positives / 5000 < 0.03
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "office_ai.bloom"
+    bloom = BloomFilter(100, 0.01)
+    bloom.add_many(["excel", "word"])
+    assert bloom.save(path, (2, 12345))
+
+    loaded, fingerprint = BloomFilter.load(path)
+
+    assert fingerprint == (2, 12345)
+    assert "excel" in loaded and "word" in loaded and len(loaded) == 2
+
+
+def test_load_rejects_a_truncated_file(tmp_path):
+    path = tmp_path / "office_ai.bloom"
+    BloomFilter(100, 0.01).save(path, (0, 0))
+    path.write_bytes(path.read_bytes()[:-1])
+
+    assert BloomFilter.load(path) is None
+
+
+def probe_questions(db):
+    """Preguntas conocidas, variaciones suyas y mezclas de su vocabulario con palabras desconocidas"""
+    with sqlite3.connect(db.db_path) as conn:
+        known = [normalized for normalized, in conn.execute("SELECT normalized FROM questions")]
+    vocabulary = sorted({word for question in known for word in question.split()})
+    rng = random.Random(19)
+    probes = list(known)
+    for question in known:
+        words = question.split()
+        probes.append(" ".join(words[:-1]))
+        probes.append(question + " por favor")
+        probes.append(" ".join(words[:-1] + ["zanahoria"]))
+    for _ in range(300):
+        words = rng.sample(vocabulary, rng.randint(1, 5))
+        if rng.random() < 0.5:
+            words.append(rng.choice(["zanahoria", "murcielago", "guitarra"]))
+        probes.append(" ".join(words))
+    return [probe for probe in probes if probe]
+
+
+@pytest.mark.parametrize('cutoff', [FUZZY_CUTOFF, LOCAL_FALLBACK_FUZZY_CUTOFF])
+def test_bound_never_rejects_a_question_retrieve_answers_would_match(shipped_db, cutoff):
+    assert shipped_db.bloom is not None
+    rejected = 0
+    for question in probe_questions(shipped_db):
+        bound = shipped_db.local_match_bound(question)
+        if bound < cutoff:
+            rejected += 1
+            assert shipped_db.retrieve_answers(question, cutoff) == [], question
+    assert rejected  # El filtro sí ahorra consultas
+
+
+@pytest.mark.parametrize('coverage', [FTS_MIN_COVERAGE, LOCAL_FALLBACK_FTS_COVERAGE])
+def test_content_bound_never_rejects_a_question_fulltext_would_match(shipped_db, coverage):
+    rejected = 0
+    for question in probe_questions(shipped_db):
+        if shipped_db.local_match_bound(question, content_only=True) < coverage:
+            rejected += 1
+            assert shipped_db.search_fulltext(question, min_coverage=coverage) == [], question
+    assert rejected
+
+
+def test_bound_sees_questions_added_by_another_process(shipped_db):
+    question = "como afinar una guitarra electrica"
+    assert shipped_db.local_match_bound(question) < FUZZY_CUTOFF
+
+    other = Database(shipped_db.db_path, write_behind=False)
+    try:
+        other.add_knowledge(question, "Con un afinador cromático, cuerda a cuerda.", 'general')
+    finally:
+        other.close()
+
+    assert shipped_db.local_match_bound(question) == 1.0
+    assert shipped_db.retrieve_answers(question, FUZZY_CUTOFF)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del autómata Aho-Corasick de palabras clave y de match_keywords"""
+import random
+
+import pytest
+
+from config import TOPIC_KEYWORDS
+from conversation_engine import match_keywords
+from keyword_matcher import KeywordMatch, KeywordMatcher, keyword_words
+
+
+def naive_matches(keywords, words):
+    """Referencia cuadrática: cada palabra clave comparada en cada posición"""
+    found = []
+    for end in range(1, len(words) + 1):
+        for keyword, label in keywords:
+            pattern = keyword_words(keyword)
+            start = end - len(pattern)
+            if pattern and start >= 0 and words[start:end] == pattern:
+                found.append(KeywordMatch(label, start, end))
+    return found
+
+
+def build(keywords):
+    matcher = KeywordMatcher()
+    for keyword, label in keywords:
+        matcher.add(keyword, label)
+    return matcher.build()
+
+
+def test_overlapping_and_nested_keywords_are_all_found():
+    matcher = build([("tabla", 'tabla'), ("tabla dinámica", 'dinamica'), ("dinámica", 'adjetivo'),
+                     ("hoja de cálculo", 'hoja'), ("cálculo", 'calculo')])
+
+    matches = matcher.find_all("Una TABLA DINÁMICA en la hoja de cálculo")
+
+    assert sorted(matches, key=lambda m: (m.end, m.start)) == [
+        KeywordMatch('tabla', 1, 2), KeywordMatch('dinamica', 1, 3), KeywordMatch('adjetivo', 2, 3),
+        KeywordMatch('hoja', 5, 8), KeywordMatch('calculo', 7, 8),
+    ]
+
+
+def test_keywords_only_match_whole_words():
+    matcher = build([("word", 'word'), ("tabla", 'tabla')])
+
+    assert matcher.find_all("wordpress y tablas") == []
+    assert [m.label for m in matcher.find_all("¿Word?")] == ['word']
+
+
+def test_failure_links_recover_after_a_partial_match():
+    matcher = build([("base de datos", 'bd'), ("de datos", 'datos')])
+
+    assert matcher.find_all("base de la base de datos") == [
+        KeywordMatch('bd', 3, 6), KeywordMatch('datos', 4, 6)
+    ]
+
+
+def test_keywords_cannot_be_added_after_build():
+    matcher = build([("excel", 'excel')])
+
+    with pytest.raises(RuntimeError):
+        matcher.add("word", 'word')
+
+
+def test_matches_agree_with_a_naive_scan_of_the_topic_keywords():
+    keywords = [(keyword, topic) for topic, words in TOPIC_KEYWORDS.items() for keyword in words]
+    matcher = build(keywords)
+    vocabulary = sorted({word for keyword, _ in keywords for word in keyword_words(keyword)} | {"y", "en", "la"})
+    rng = random.Random(15)
+
+    for _ in range(300):
+        words = tuple(rng.choice(vocabulary) for _ in range(rng.randint(0, 12)))
+        expected = naive_matches(keywords, words)
+        assert sorted(matcher.iter_matches(words)) == sorted(expected), words
+
+
+def test_match_keywords_orders_topics_by_priority():
+    hits = match_keywords("¿Cómo hago una tabla dinámica en Excel?")
+
+    assert hits.topics == ('excel', 'access')
+    assert hits.topic == 'excel'
+    assert set(hits.office_entities) == {'tabla', 'excel'}
+
+
+def test_match_keywords_without_keywords_is_general():
+    hits = match_keywords("que es python")
+
+    assert hits.topics == () and hits.office_entities == () and hits.definitions == ()
+    assert hits.topic == 'general'
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de la migración del esquema antiguo (claves de texto) al de claves enteras"""
+import sqlite3
+
+import pytest
+
+from database import Database
+
+
+def baseline_snapshot(path):
+    """Conocimiento, Q-values con respuesta e historial de una base con el esquema antiguo"""
+    with sqlite3.connect(path) as conn:
+        knowledge = sorted(conn.execute("""
+            SELECT id, question_normalized, question_original, answer, topic FROM knowledge
+        """))
+        q_values = sorted(conn.execute("""
+            SELECT v.question_normalized, v.answer, v.q_value, v.times_selected,
+                   v.times_correct, v.times_incorrect, v.last_used
+            FROM q_values v
+            JOIN knowledge k ON k.question_normalized = v.question_normalized AND k.answer = v.answer
+        """))
+        history = conn.execute("SELECT * FROM history ORDER BY id").fetchall()
+    return knowledge, q_values, history
+
+
+def migrated_snapshot(path):
+    """Lo mismo leído del esquema con claves enteras"""
+    with sqlite3.connect(path) as conn:
+        knowledge = sorted(conn.execute("""
+            SELECT k.id, q.normalized, k.question_original, k.answer, k.topic
+            FROM knowledge k JOIN questions q ON q.id = k.question_id
+        """))
+        q_values = sorted(conn.execute("""
+            SELECT q.normalized, k.answer, v.q_value, v.times_selected,
+                   v.times_correct, v.times_incorrect, v.last_used
+            FROM q_values v
+            JOIN knowledge k ON k.id = v.knowledge_id
+            JOIN questions q ON q.id = k.question_id
+        """))
+        history = conn.execute("SELECT * FROM history ORDER BY id").fetchall()
+    return knowledge, q_values, history
+
+
+@pytest.fixture
+def baseline_path(shipped_db_path):
+    with sqlite3.connect(shipped_db_path) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(knowledge)")}
+    assert 'question_normalized' in columns  # La base distribuida conserva el esquema antiguo
+    return shipped_db_path
+
+
+def open_and_close(path):
+    Database(path, write_behind=False).close()
+
+
+def test_migration_preserves_knowledge_q_values_and_history(baseline_path):
+    knowledge, q_values, history = baseline_snapshot(baseline_path)
+
+    open_and_close(baseline_path)
+
+    assert migrated_snapshot(baseline_path) == (knowledge, q_values, history)
+
+
+def test_migration_drops_q_values_without_an_answer(baseline_path):
+    with sqlite3.connect(baseline_path) as conn:
+        conn.execute("""
+            INSERT INTO q_values (question_normalized, answer, q_value) VALUES ('pregunta huerfana', 'sin fila', 3.0)
+        """)
+        expected = conn.execute("""
+            SELECT COUNT(*) FROM q_values v
+            JOIN knowledge k ON k.question_normalized = v.question_normalized AND k.answer = v.answer
+        """).fetchone()[0]
+
+    open_and_close(baseline_path)
+
+    with sqlite3.connect(baseline_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM q_values").fetchone()[0] == expected
+
+
+def test_migration_groups_answers_under_one_question_id(baseline_path):
+    with sqlite3.connect(baseline_path) as conn:
+        questions = conn.execute("SELECT COUNT(DISTINCT question_normalized) FROM knowledge").fetchone()[0]
+
+    open_and_close(baseline_path)
+
+    with sqlite3.connect(baseline_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0] == questions
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(knowledge)")}
+    assert 'question_normalized' not in columns and 'answer_hash' in columns
+
+
+def test_migrated_database_serves_stats_and_answers(baseline_path):
+    knowledge, _, history = baseline_snapshot(baseline_path)
+    db = Database(baseline_path, write_behind=False)
+    try:
+        stats = db.get_stats()
+        assert stats['total_knowledge'] == db.get_knowledge_count() == len(knowledge)
+        assert stats['total_interactions'] == len(history)
+        assert db.retrieve_answers("¿Cuál es la capital de Francia?", 0.7)
+    finally:
+        db.close()
+
+
+def test_reopening_a_migrated_database_changes_nothing(baseline_path):
+    open_and_close(baseline_path)
+    migrated = migrated_snapshot(baseline_path)
+
+    open_and_close(baseline_path)
+
+    assert migrated_snapshot(baseline_path) == migrated
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del limitador de cuota compartido entre procesos"""
+import sqlite3
+import time
+
+import pytest
+
+from rate_limiter import QuotaExhausted, RateLimiter
+
+
+def make_limiter(tmp_path, per_minute=3, max_wait=None):
+    return RateLimiter(tmp_path / "quota.db", 'gemini', per_minute, 1000, max_concurrency=2, max_wait=max_wait)
+
+
+def test_tokens_are_shared_between_limiters(tmp_path):
+    first, second = make_limiter(tmp_path), make_limiter(tmp_path)
+
+    assert first.acquire(timeout=0)
+    assert second.acquire(timeout=0)
+    assert first.acquire(timeout=0)
+    assert not second.acquire(timeout=0)  # Cubo por minuto vacío para ambos
+    assert second.stats()['rejected'] == 1
+
+
+def test_stats_reports_refilled_tokens_without_consuming_them(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.acquire(timeout=0)
+
+    tokens = limiter.stats()['tokens']
+
+    assert 2.0 <= tokens['minute'] < 2.1
+    assert limiter.stats()['tokens']['minute'] >= tokens['minute']
+    assert limiter.stats()['granted'] == 1
+
+
+def test_stats_does_not_wait_for_the_write_lock(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.acquire(timeout=0)
+    writer = sqlite3.connect(str(tmp_path / "quota.db"), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")  # Otro proceso en mitad de un acquire
+    try:
+        started = time.monotonic()
+        stats = limiter.stats()
+        assert time.monotonic() - started < 1.0
+        assert stats['tokens']['minute'] >= 2.0
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_slot_with_default_timeout_raises_when_quota_is_exhausted(tmp_path):
+    limiter = make_limiter(tmp_path, per_minute=1, max_wait=0.1)
+    with limiter.slot():
+        pass
+
+    with pytest.raises(QuotaExhausted, match="agotada"):
+        with limiter.slot():
+            pass
+    assert limiter.in_flight == 0
+
+
+def test_slot_with_default_timeout_raises_when_no_slot_is_free(tmp_path):
+    limiter = make_limiter(tmp_path, max_wait=0.1)
+    with limiter.slot(), limiter.slot():
+        with pytest.raises(QuotaExhausted, match="Sin hueco"):
+            with limiter.slot():
+                pass
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de los niveles de búsqueda local sobre la base de conocimiento distribuida"""
+import pytest
+
+from ai_engine import AIEngine
+
+# Preguntas sin respuesta en la base: deben ir a la web, no a una respuesta local equivocada
+UNKNOWN_QUESTIONS = [
+    "cuantos planetas hay",                                # 'cuantos continentes hay'
+    "cuantos paises hay",
+    "cuanto mide un gato",                                 # 'cuanto mide un salmonm'
+    "que es html",                                         # 'hazmelo en html y css'
+    "que es css",
+    "que es una pagina web",
+    "como hacer una macro en excel",                       # 'como hacer una tabla dinamica en excel'
+    "como proteger un documento de word con contrasena",   # 'como proteger una hoja de excel con contrasena'
+]
+
+# Paráfrasis que el nivel full-text sí debe resolver: (pregunta, fragmento de la respuesta esperada)
+FULLTEXT_PARAPHRASES = [
+    ("calcular promedio excel", "Calcular un promedio"),
+    ("como eliminar los duplicados de excel", "duplicados"),
+    ("que aplicaciones trae microsoft office", "Incluye Word"),
+    ("capital de francia", "París"),
+    ("como insertar un video en una diapositiva de powerpoint", "vídeo"),
+]
+
+# Casi iguales a una pregunta conocida salvo en la palabra que importa: el coseno de n-gramas las acepta
+SEMANTIC_NEAR_MISSES = [
+    "como insertar una tabla en powerpoint",               # 'como insertar un video en powerpoint'
+    "como eliminar duplicados en word",                    # 'como eliminar duplicados en excel'
+    "como recuperar un archivo de excel no guardado",      # '... de word no guardado'
+    "como hacer transiciones en word",                     # '... en powerpoint'
+    "diferencia entre http y ftp",                         # 'diferencia entre http y https'
+    "cual es la capital de italia",                        # 'cual es la capital de francia'
+]
+
+# Paráfrasis y erratas que el nivel semántico sí debe resolver: (pregunta, fragmento de la respuesta esperada)
+SEMANTIC_PARAPHRASES = [
+    ("como insertar video en powerpoint", "vídeo"),
+    ("como proteger una hoja de excel", "Proteger una hoja"),
+    ("que son las reglas de outlook", "reglas"),
+    ("para que sirve exel", "datos numéricos"),
+]
+
+
+@pytest.fixture
+def ai(shipped_db):
+    return AIEngine(shipped_db)
+
+
+@pytest.mark.parametrize('question', UNKNOWN_QUESTIONS)
+def test_fulltext_rejects_candidates_sharing_a_single_word(shipped_db, question):
+    assert shipped_db.search_fulltext(question) == []
+
+
+@pytest.mark.parametrize('question', UNKNOWN_QUESTIONS)
+def test_unknown_questions_have_no_local_answer(ai, question):
+    assert ai.find_answers(question) is None
+
+
+@pytest.mark.parametrize('question, expected', FULLTEXT_PARAPHRASES)
+def test_fulltext_finds_paraphrases(shipped_db, question, expected):
+    answers = shipped_db.search_fulltext(question)
+
+    assert answers
+    assert expected in answers[0]['answer']
+
+
+def test_fulltext_ignores_questions_without_content_words(shipped_db):
+    assert shipped_db.search_fulltext("que es eso") == []
+
+
+@pytest.mark.parametrize('question', SEMANTIC_NEAR_MISSES)
+def test_semantic_rejects_near_misses(shipped_db, question):
+    assert shipped_db.search_semantic(question) == []
+
+
+@pytest.mark.parametrize('question, expected', SEMANTIC_PARAPHRASES)
+def test_semantic_finds_paraphrases(shipped_db, question, expected):
+    answers = shipped_db.search_semantic(question)
+
+    assert answers
+    assert expected in answers[0]['answer']
+
+
+def test_unknown_powerpoint_table_question_is_not_answered_locally(ai):
+    assert ai.find_answers("como insertar una tabla en powerpoint") is None
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del índice semántico de n-gramas"""
+from semantic_index import SemanticIndex
+
+QUESTIONS = [
+    (1, "como hacer una tabla dinamica en excel"),
+    (2, "como insertar un video en powerpoint"),
+    (3, "que es una formula en excel"),
+    (4, "cual es la capital de francia"),
+]
+
+
+def make_index(path=None):
+    index = SemanticIndex(path, dim=1024, ngram=3)
+    index.add_many(QUESTIONS)
+    return index
+
+
+def test_known_question_ranks_first_with_full_score():
+    index = make_index()
+
+    for item_id, text in QUESTIONS:
+        best_id, score = index.search(text, top_k=2)[0]
+        assert best_id == item_id
+        assert score > 0.999
+
+
+def test_paraphrase_ranks_above_unrelated_questions():
+    hits = make_index().search("tabla dinamica en excel", top_k=4)
+
+    assert hits[0][0] == 1
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_threshold_filters_weak_hits():
+    assert make_index().search("receta de paella valenciana", top_k=4, threshold=0.5) == []
+
+
+def test_add_remove_and_rebuild_keep_the_signature_in_sync():
+    index = make_index()
+    assert not index.add(1, QUESTIONS[0][1])  # Ya indexado
+    assert index.remove(2) and not index.remove(2)
+
+    remaining = [entry for entry in QUESTIONS if entry[0] != 2]
+    assert len(index) == 3
+    assert index.signature == SemanticIndex.fingerprint(remaining)
+    assert 2 not in [item_id for item_id, _ in index.search(QUESTIONS[1][1], top_k=4)]
+
+    index.rebuild(QUESTIONS[:1])
+    assert index.signature == SemanticIndex.fingerprint(QUESTIONS[:1])
+
+
+def test_growth_past_capacity_keeps_earlier_rows():
+    index = make_index()
+    index.add_many((item_id, f"pregunta numero {item_id}") for item_id in range(100, 300))
+
+    assert len(index) == 204
+    assert index.search(QUESTIONS[3][1], top_k=1)[0][0] == 4
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "index.semantic.npz"
+    index = make_index(path)
+    assert index.save()
+    assert not index.save()  # Sin cambios no se reescribe
+
+    loaded = SemanticIndex(path, dim=1024, ngram=3)
+    assert loaded.load()
+    assert loaded.signature == index.signature
+    assert loaded.search(QUESTIONS[1][1], top_k=1)[0][0] == 2
+
+
+def test_load_rejects_an_index_built_with_other_settings(tmp_path):
+    path = tmp_path / "index.semantic.npz"
+    make_index(path).save()
+
+    assert not SemanticIndex(path, dim=512, ngram=3).load()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del servidor HTTP con Gemini simulado (sin red)"""
+import asyncio
+import http.client
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ai_engine import AIEngine
+from database import Database
+from gemini_engine import StubGeminiEngine
+from server import OfficeAIServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    db = Database(str(tmp_path / "office_ai.db"))
+    ai = AIEngine(db)
+    ai.gemini_engine = StubGeminiEngine(latency=0.5)
+    srv = OfficeAIServer(ai, '127.0.0.1', 0, max_in_flight=8, max_web_in_flight=1)
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(srv.start())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait(10)
+    yield srv
+
+    async def stop():
+        srv._server.close()
+        await srv._server.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+    srv.shutdown()
+    db.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    """(estado, JSON de respuesta, cabeceras) de una petición en una conexión nueva"""
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    try:
+        if isinstance(body, dict):
+            body = json.dumps(body)
+        conn.request(method, path, body=body, headers=headers or {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read()), response
+    finally:
+        conn.close()
+
+
+def test_ask_answers_from_the_local_knowledge_base(server):
+    status, payload, _ = request(server, 'POST', '/ask', {'session_id': 'ana', 'question': '¿Para qué sirve Word?'})
+
+    assert status == 200
+    assert payload['session_id'] == 'ana'
+    assert payload['source'] == 'local'
+    assert payload['answer']
+
+
+def test_ask_falls_back_to_the_web_for_unknown_questions(server):
+    question = 'pregunta desconocida sobre astronomía cuántica'
+    status, payload, _ = request(server, 'POST', '/ask', {'session_id': 'ana', 'question': question})
+
+    assert status == 200
+    assert payload['source'] == 'gemini'
+    assert payload['answer'] == f"Respuesta simulada para: {question}"
+
+
+def test_history_keeps_the_session_context(server):
+    request(server, 'POST', '/ask', {'session_id': 'ana', 'question': '¿Para qué sirve Word?'})
+    status, payload, _ = request(server, 'GET', '/history?session_id=ana')
+
+    assert status == 200
+    assert [turn['question'] for turn in payload['history']] == ['¿Para qué sirve Word?']
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'session_id': 'ana'}, "Falta el campo 'question'"),
+    ({'question': '¿Para qué sirve Word?'}, "Falta el campo 'session_id'"),
+    ({'session_id': 'ana', 'question': '   '}, "Falta el campo 'question'"),
+    ('esto no es JSON', "El cuerpo no es JSON válido"),
+    ('[1, 2]', "El cuerpo debe ser un objeto JSON"),
+])
+def test_ask_rejects_invalid_bodies(server, body, error):
+    status, payload, _ = request(server, 'POST', '/ask', body)
+
+    assert status == 400
+    assert payload == {'error': error}
+
+
+def test_feedback_requires_a_boolean_correct(server):
+    body = {'session_id': 'ana', 'question': '¿Para qué sirve Word?', 'answer': 'Un procesador de textos', 'correct': 'sí'}
+    status, _, _ = request(server, 'POST', '/feedback', body)
+
+    assert status == 400
+
+
+def test_unknown_routes_and_methods(server):
+    assert request(server, 'GET', '/nope')[0] == 404
+    assert request(server, 'GET', '/ask')[0] == 405
+
+
+def test_chunked_bodies_are_rejected(server):
+    body = json.dumps({'session_id': 'ana', 'question': '¿Para qué sirve Word?'}).encode('utf-8')
+    raw = (b"POST /ask HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+           b"Transfer-Encoding: chunked\r\n\r\n" + b"%x\r\n" % len(body) + body + b"\r\n0\r\n\r\n")
+    with socket.create_connection(('127.0.0.1', server.port), timeout=10) as sock:
+        sock.sendall(raw)
+        response = http.client.HTTPResponse(sock)
+        response.begin()
+        assert response.status == 411
+        assert response.getheader('Connection') == 'close'
+        assert 'error' in json.loads(response.read())
+
+
+def test_web_searches_beyond_the_limit_get_429(server):
+    def ask(i):
+        status, _, response = request(server, 'POST', '/ask',
+                                      {'session_id': f"u{i}", 'question': f"pregunta desconocida número {i} de astronomía"})
+        return status, response.getheader('Retry-After')
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(ask, range(4)))
+
+    assert (200, None) in results
+    assert (429, '1') in results
+    assert {status for status, _ in results} == {200, 429}
+
+    status, health, _ = request(server, 'GET', '/health')
+    assert status == 200
+    assert health['rejected'] == sum(status == 429 for status, _ in results)
+    assert health['in_flight'] == 0 and health['web_in_flight'] == 0
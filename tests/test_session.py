@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del almacén de sesiones (LRU con caducidad y persistencia en SQLite)"""
+import threading
+import time
+
+import pytest
+
+from database import Database
+from session import SessionStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "office_ai.db"))
+    yield database
+    database.close()
+
+
+def test_evicted_session_is_restored_from_the_database(db):
+    store = SessionStore(2, 60, db)
+    session = store.get('ana')
+    session.last_question = '¿qué es excel?'
+    store.get('luis')
+    store.get('eva')  # Expulsa a 'ana'
+    db.flush()
+
+    restored = store.get('ana')
+
+    assert restored is not session
+    assert restored.last_question == '¿qué es excel?'
+    assert store.stats()['restored'] == 1
+
+
+def test_session_pending_save_is_reused(db):
+    store = SessionStore(1, 60, db)
+    session = store.get('ana')
+    store.get('luis')  # Expulsa a 'ana'; su guardado puede no estar confirmado aún
+
+    assert store.get('ana') is session
+
+
+def test_expired_session_pending_save_is_not_revived(db, monkeypatch):
+    store = SessionStore(1, 60, db)
+    monkeypatch.setattr(db, 'save_sessions', lambda rows, on_commit=None: None)  # Guardado que nunca se confirma
+    session = store.get('ana')
+    session.last_question = '¿qué es excel?'
+    store.get('luis')
+    session.last_seen -= 120
+
+    fresh = store.get('ana')
+
+    assert fresh is not session
+    assert fresh.last_question is None
+    assert store.stats()['expirations'] == 1
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(10, 0.05)
+    store.get('ana').last_question = '¿qué es excel?'
+    time.sleep(0.1)
+
+    assert store.get('ana').last_question is None
+    assert store.stats()['expirations'] == 1
+
+
+def test_database_lookup_does_not_hold_the_store_lock(db, monkeypatch):
+    store = SessionStore(10, 60, db)
+    load_session = db.load_session
+    lock_free = []
+
+    def probe():
+        acquired = store._lock.acquire(timeout=1)
+        if acquired:
+            store._lock.release()
+        lock_free.append(acquired)
+
+    def checking_load(*args):
+        # Otro hilo debe poder usar el almacén mientras se consulta SQLite
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        return load_session(*args)
+
+    monkeypatch.setattr(db, 'load_session', checking_load)
+    store.get('ana')
+
+    assert lock_free == [True]
+
+
+def test_concurrent_gets_return_one_session_per_id(db):
+    store = SessionStore(1000, 60, db)
+    seen = {}
+    lock = threading.Lock()
+
+    def work():
+        for i in range(200):
+            session = store.get(f"s{i % 20}")
+            with lock:
+                seen.setdefault(session.session_id, set()).add(id(session))
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(len(ids) == 1 for ids in seen.values())
+    assert store.stats()['created'] == 20
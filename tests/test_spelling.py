@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del corrector ortográfico SymSpell y de la distancia OSA"""
+import random
+import string
+
+from spelling import SpellingCorrector, osa_distance
+
+TEXTS = [
+    (1, "como hacer una tabla dinamica en excel"),
+    (2, "como insertar un video en powerpoint"),
+    (3, "para que sirve la funcion buscarv"),
+    (4, "que es una tabla en access"),
+]
+
+
+def reference_osa(a, b):
+    """Distancia OSA con la tabla completa, sin cortes"""
+    d = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i][0] = i
+    for j in range(len(b) + 1):
+        d[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)][len(b)]
+
+
+def make_corrector():
+    corrector = SpellingCorrector(max_distance=2)
+    corrector.add_many(TEXTS)
+    return corrector
+
+
+def test_osa_distance_matches_the_full_table():
+    rng = random.Random(18)
+    for _ in range(500):
+        a = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 7)))
+        b = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 7)))
+        expected = reference_osa(a, b)
+        assert osa_distance(a, b, 10) == expected
+        assert osa_distance(a, b, 2) == min(expected, 3)
+
+
+def test_transposition_costs_one_edit():
+    assert osa_distance("powerpiont", "powerpoint", 2) == 1
+    assert osa_distance("tabal", "tabla", 2) == 1
+
+
+def test_common_typos_are_corrected():
+    corrector = make_corrector()
+
+    assert corrector.correct("Tabal dinámica en exel") == "tabla dinamica en excel"
+    assert corrector.correct("powerpiont") == "powerpoint"
+    assert corrector.correct("buscarb") == "buscarv"
+
+
+def test_known_short_and_distant_words_are_left_alone():
+    corrector = make_corrector()
+
+    assert corrector.correct_word("tabla") == "tabla"
+    assert corrector.correct_word("uno") == "uno"        # Hasta 3 letras no se corrige
+    assert corrector.correct_word("tbkla") == "tbkla"    # 5 letras: solo se tolera 1 error
+    assert corrector.correct_word("paella") == "paella"
+
+
+def test_ties_prefer_the_most_frequent_word():
+    corrector = make_corrector()
+
+    assert corrector.correct_word("tablo") == "tabla"  # 'tabla' aparece en dos textos
+
+
+def test_corrections_agree_with_a_brute_force_search():
+    corrector = make_corrector()
+    vocabulary = {word for _, text in TEXTS for word in text.split()}
+    counts = {word: sum(word in text.split() for _, text in TEXTS) for word in vocabulary}
+    rng = random.Random(18)
+
+    for _ in range(300):
+        word = list(rng.choice(sorted(vocabulary)))
+        for _ in range(rng.randint(1, 2)):
+            position = rng.randrange(len(word))
+            word[position] = rng.choice(string.ascii_lowercase)
+        word = "".join(word)
+        allowed = corrector.allowed_distance(word)
+        candidates = [(reference_osa(word, known), -counts[known], known) for known in vocabulary]
+        candidates = [key for key in candidates if key[0] <= allowed]
+        expected = min(candidates)[2] if allowed and candidates and word not in vocabulary else word
+        assert corrector.correct_word(word) == expected, word
+
+
+def test_removed_texts_leave_the_vocabulary():
+    corrector = make_corrector()
+    assert corrector.correct_word("buscarb") == "buscarv"
+
+    assert corrector.remove(3) and not corrector.remove(3)
+
+    assert "buscarv" not in corrector
+    assert "que" in corrector
+    assert corrector.correct_word("buscarb") == "buscarb"  # El memo se vacía al cambiar el vocabulario
+
+
+def test_database_corrects_against_its_knowledge_base(shipped_db):
+    assert shipped_db.correct_spelling("¿Qué es powerpiont?") == "que es powerpoint"
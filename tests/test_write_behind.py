@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de la cola de escritura diferida y de Database.flush()"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from database import Database
+from write_behind import WriteBehindQueue
+
+
+class CountingTransactions:
+    """Fábrica de transacciones sobre un fichero SQLite que cuenta los commits"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.commits = 0
+        self._local = threading.local()
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE items (value INTEGER UNIQUE)")
+
+    @contextmanager
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path)
+        try:
+            yield conn
+            conn.commit()
+            self.commits += 1
+        except Exception:
+            conn.rollback()
+            raise
+
+    def values(self):
+        with sqlite3.connect(self.path) as conn:
+            return sorted(value for value, in conn.execute("SELECT value FROM items"))
+
+
+def insert(cursor, value):
+    cursor.execute("INSERT INTO items (value) VALUES (?)", (value,))
+
+
+def fail(cursor):
+    raise RuntimeError("fallo provocado")
+
+
+@pytest.fixture
+def transactions(tmp_path):
+    return CountingTransactions(tmp_path / "items.db")
+
+
+@pytest.fixture
+def writer(transactions):
+    # Intervalo largo: solo flush() o un lote lleno provocan el commit
+    queue = WriteBehindQueue(transactions, batch_size=64, flush_interval=60.0)
+    yield queue
+    queue.close()
+
+
+def test_flush_makes_queued_writes_visible(writer, transactions):
+    committed = []
+    for value in range(10):
+        writer.submit(insert, value, on_commit=lambda value=value: committed.append(value))
+
+    writer.flush()
+
+    assert transactions.values() == list(range(10))
+    assert committed == list(range(10))
+
+
+def test_writes_are_group_committed(writer, transactions):
+    for value in range(10):
+        writer.submit(insert, value)
+    writer.flush()
+
+    assert transactions.commits == 1
+
+
+def test_batches_are_capped_at_batch_size(transactions):
+    writer = WriteBehindQueue(transactions, batch_size=4, flush_interval=60.0)
+    try:
+        for value in range(10):
+            writer.submit(insert, value)
+        writer.flush()
+    finally:
+        writer.close()
+
+    assert transactions.values() == list(range(10))
+    assert transactions.commits == 3  # 4 + 4 + 2
+
+
+def test_failed_operation_is_dropped_without_losing_the_batch(writer, transactions):
+    committed = []
+    writer.submit(insert, 1, on_commit=lambda: committed.append(1))
+    writer.submit(fail, on_commit=lambda: committed.append('fail'))
+    writer.submit(insert, 1, on_commit=lambda: committed.append('duplicate'))
+    writer.submit(insert, 2, on_commit=lambda: committed.append(2))
+
+    writer.flush()
+
+    # El lote entero se deshace y se reintenta operación a operación
+    assert transactions.values() == [1, 2]
+    assert committed == [1, 2]
+
+
+def test_failing_callback_does_not_stop_the_others(writer, transactions):
+    committed = []
+
+    def broken():
+        raise RuntimeError("callback roto")
+
+    writer.submit(insert, 1, on_commit=broken)
+    writer.submit(insert, 2, on_commit=lambda: committed.append(2))
+    writer.flush()
+
+    assert transactions.values() == [1, 2]
+    assert committed == [2]
+
+
+def test_flush_is_not_starved_by_concurrent_writers(writer, transactions):
+    stop = threading.Event()
+
+    def produce():
+        value = 1000
+        while not stop.is_set():
+            writer.submit(insert, value)
+            value += 1
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    try:
+        writer.submit(insert, 1)
+        flusher = threading.Thread(target=writer.flush)
+        flusher.start()
+        flusher.join(timeout=5)
+        assert not flusher.is_alive()  # Con queue.join() esperaba a que la cola se vaciara
+        assert 1 in transactions.values()
+    finally:
+        stop.set()
+        producer.join()
+
+
+def test_flush_from_the_writer_thread_does_not_deadlock(writer, transactions):
+    flushed = threading.Event()
+
+    def flush_inside_callback():
+        writer.flush()
+        flushed.set()
+
+    writer.submit(insert, 1, on_commit=flush_inside_callback)
+    writer.submit(insert, 2)
+    writer.flush()
+
+    assert flushed.is_set()
+    assert transactions.values() == [1, 2]
+
+
+def test_close_commits_pending_writes_and_rejects_new_ones(transactions):
+    writer = WriteBehindQueue(transactions, batch_size=64, flush_interval=60.0)
+    writer.submit(insert, 1)
+    writer.close()
+
+    assert transactions.values() == [1]
+    with pytest.raises(RuntimeError):
+        writer.submit(insert, 2)
+    writer.flush()  # Cerrada: no bloquea
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "office_ai.db"))
+    yield database
+    database.close()
+
+
+def test_database_flush_commits_deferred_writes(db):
+    committed = threading.Event()
+    db.add_to_history("¿qué es excel?", "Una hoja de cálculo", 'local')
+    db.save_sessions([("ana", "{}", 0.0)], on_commit=committed.set)
+
+    db.flush()
+
+    assert committed.is_set()
+    with sqlite3.connect(db.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 1
+        assert conn.execute("SELECT session_id FROM sessions").fetchall() == [("ana",)]
+
+
+def test_database_without_write_behind_writes_immediately(tmp_path):
+    db = Database(str(tmp_path / "office_ai.db"), write_behind=False)
+    try:
+        committed = []
+        db.save_sessions([("ana", "{}", 0.0)], on_commit=lambda: committed.append(True))
+        assert committed == [True]
+        with sqlite3.connect(db.db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+    finally:
+        db.close()
@@ -4,13 +4,11 @@
 Script de Entrenamiento Masivo para OfficeAI
 """
 import sys
-import time
 sys.path.insert(0, 'src')
 
 from database import Database
-from search import WebSearch
 from ai_engine import AIEngine
-from config import DB_PATH
+from config import DB_PATH, CACHE_TTL_HOURS, TRAINING_SAVE_BATCH
 
 # Lista de preguntas para entrenamiento
 TRAINING_QUESTIONS = [
@@ -81,8 +79,11 @@ def train_bot():
     
     # Inicializar componentes
     db = Database()
-    web = WebSearch(db)
-    ai = AIEngine(db, web)
+    ai = AIEngine(db)
+    
+    if not ai.gemini_engine:
+        print("❌ Gemini no está configurado (falta GEMINI_API_KEY)")
+        return
     
     initial_count = db.get_knowledge_count()
     print(f"📚 Conocimiento inicial: {initial_count} entradas")
@@ -90,33 +91,56 @@ def train_bot():
     print("-" * 80)
     
     success_count = 0
+    totals = {'inserted': 0, 'duplicates': 0}
+    learned = []  # Respuestas aún sin guardar (se guardan cada TRAINING_SAVE_BATCH)
+    
+    def save_learned():
+        # Misma recompensa inicial que search_web_and_process para respuestas de Gemini
+        result = db.add_knowledge_many(learned, initial_q=1.5)
+        for key in totals:
+            totals[key] += result[key]
+        learned.clear()
     
+    # Verificar qué preguntas ya sabe o tiene en la caché web (para no gastar búsquedas)
+    pending = []
     for i, question in enumerate(TRAINING_QUESTIONS, 1):
-        print(f"\n[{i}/{len(TRAINING_QUESTIONS)}] Procesando: '{question}'")
-        
-        # Verificar si ya lo sabe (para no gastar búsqueda)
-        answers = ai.find_answers(question)
-        if answers:
-            print("   ✓ Ya conozco esta respuesta (saltando)")
+        if ai.find_answers(question):
+            print(f"[{i}/{len(TRAINING_QUESTIONS)}] ✓ Ya conozco: '{question}' (saltando)")
             continue
-            
-        try:
-            # Forzar búsqueda web y procesamiento
-            print("   🔍 Buscando en la web...")
-            synthesis, sources = ai.search_web_and_process(question)
-            
+        cached = db.get_cached_web_results(db.normalize_text(question))
+        if isinstance(cached, dict) and cached.get('answer'):
+            print(f"[{i}/{len(TRAINING_QUESTIONS)}] ♻️  En caché web: '{question}'")
+            learned.append((question, cached['answer'], ai.get_topic(question)))
+            db.add_to_history(question, cached['answer'], 'gemini_search')
+            success_count += 1
+        else:
+            pending.append(question)
+    
+    # Búsquedas en paralelo; el limitador de cuota marca el ritmo (sin pausas fijas).
+    # Lo aprendido se guarda por lotes a medida que llega: una interrupción no pierde lo ya pagado
+    print(f"\n🔍 Buscando en la web {len(pending)} preguntas...")
+    try:
+        if len(learned) >= TRAINING_SAVE_BATCH:
+            save_learned()
+        for question, (synthesis, sources) in zip(pending, ai.gemini_engine.search_many(pending)):
+            print(f"\n   Pregunta: '{question}'")
             if synthesis:
+                learned.append((question, synthesis, ai.get_topic(question)))
+                db.cache_web_results(db.normalize_text(question), {'answer': synthesis, 'sources': sources},
+                                     CACHE_TTL_HOURS)
+                db.add_to_history(question, synthesis, 'gemini_search')
                 print(f"   ✅ APRENDIDO: {synthesis[:80]}...")
                 print(f"   🔗 Fuente: {sources[0] if sources else 'N/A'}")
                 success_count += 1
+                if len(learned) >= TRAINING_SAVE_BATCH:
+                    save_learned()
             else:
                 print("   ❌ No se pudo sintetizar una respuesta")
-                
-            # Pequeña pausa para no saturar
-            time.sleep(2)
-            
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
+    except KeyboardInterrupt:
+        print("\n⏹️  Entrenamiento interrumpido; se guarda lo aprendido hasta ahora")
+    finally:
+        if learned:
+            save_learned()
     
     print("\n" + "="*80)
     print("RESULTADOS DEL ENTRENAMIENTO")
@@ -126,7 +150,9 @@ def train_bot():
     print(f"📚 Conocimiento final:   {final_count}")
     print(f"📈 Crecimiento:          +{final_count - initial_count} entradas")
     print(f"✅ Éxito:                {success_count} respuestas aprendidas")
+    print(f"♻️  Duplicadas:           {totals['duplicates']}")
     print("="*80)
+    db.close()
 
 if __name__ == "__main__":
     train_bot()
\ No newline at end of file